@@ -0,0 +1,74 @@
+"""
+Load balancing run against several local stub instances of one service.
+
+Starts --instances stubs with increasing latency behind EVENTS_SERVICE_URL,
+drives concurrent requests through the gateway in-process and prints how many
+requests each instance served. Then stops the first instance, waits for the
+health checks to notice, and prints the split again.
+
+    python -m benchmarks.balance --balancer p2c
+"""
+import os
+import json
+import asyncio
+import argparse
+
+
+async def drive(client, requests: int, concurrency: int) -> dict:
+    statuses = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            response = await client.get("/api/events/")
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    await asyncio.gather(*[one() for _ in range(requests)])
+    return statuses
+
+
+async def main(args):
+    ports = [args.base_port + index for index in range(args.instances)]
+    os.environ.update(
+        SECRET_KEY="benchmark", RESPONSE_CACHE_ENABLED="false", UPSTREAM_COALESCE="false",
+        USERS_SERVICE_URL="http://users.invalid", EVENTS_SERVICE_URL="http://events.invalid",
+        EVENTS_SERVICE_INSTANCES=",".join(f"http://127.0.0.1:{port}" for port in ports),
+        UPSTREAM_BALANCER=args.balancer, UPSTREAM_HEALTH_CHECK_INTERVAL="1", UPSTREAM_UNHEALTHY_THRESHOLD="1",
+    )
+    import httpx
+    import main as gateway
+    from gateway.balancer import load_balancer
+    from benchmarks import stubs
+
+    faults = [stubs.Faults(latency=args.latency * (index + 1)) for index in range(args.instances)]
+    runners = [await stubs.start(port, fault) for port, fault in zip(ports, faults)]
+    try:
+        async with gateway.lifespan(gateway.app):
+            transport = httpx.ASGITransport(app=gateway.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+                statuses = await drive(client, args.requests, args.concurrency)
+                print(json.dumps({"phase": "all_up", "statuses": statuses,
+                                  "served": {port: fault.requests for port, fault in zip(ports, faults)}}))
+
+                await runners[0].cleanup()
+                await asyncio.sleep(2.5)
+                for fault in faults:
+                    fault.requests = 0
+                statuses = await drive(client, args.requests, args.concurrency)
+                print(json.dumps({"phase": "first_down", "statuses": statuses,
+                                  "served": {port: fault.requests for port, fault in zip(ports, faults)},
+                                  "instances": load_balancer.stats()}))
+    finally:
+        for runner in runners[1:]:
+            await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--instances", default=3, type=int)
+    parser.add_argument("--balancer", default="least_outstanding", choices=["least_outstanding", "p2c"])
+    parser.add_argument("--latency", default=0.01, type=float, help="Latency of the first instance; the n-th gets n times")
+    parser.add_argument("--requests", default=600, type=int)
+    parser.add_argument("--concurrency", default=30, type=int)
+    parser.add_argument("--base-port", default=8111, type=int)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,64 @@
+"""
+Fault-injection run of the per-upstream circuit breaker.
+
+Drives the gateway in-process against a stub upstream through three phases:
+healthy, failing (every call answered with a 503) and recovered. Prints one
+JSON line per phase with the status codes seen, the mean latency and the
+breaker state, which should go closed -> open -> half_open -> closed.
+
+    python -m benchmarks.breaker_faults
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+from collections import Counter
+
+
+async def phase(client, name: str, requests: int, breakers) -> dict:
+    statuses = Counter()
+    started = time.perf_counter()
+    for _ in range(requests):
+        response = await client.get("/api/events/")
+        statuses[response.status_code] += 1
+    elapsed = time.perf_counter() - started
+    return {"phase": name, "statuses": dict(statuses), "mean_ms": round(elapsed / requests * 1000, 2),
+            "breakers": breakers.stats()}
+
+
+async def main(args):
+    os.environ.update(
+        SECRET_KEY="benchmark", RESPONSE_CACHE_ENABLED="false", UPSTREAM_COALESCE="false",
+        USERS_SERVICE_URL=f"http://127.0.0.1:{args.stub_port}", EVENTS_SERVICE_URL=f"http://127.0.0.1:{args.stub_port}",
+        BREAKER_MIN_REQUESTS="10", BREAKER_OPEN_SECONDS=str(args.open_seconds), BREAKER_HALF_OPEN_PROBES="2",
+    )
+    import httpx
+    import main as gateway
+    from gateway.network import circuit_breakers
+    from benchmarks import stubs
+
+    faults = stubs.Faults(latency=args.latency)
+    runner = await stubs.start(args.stub_port, faults)
+    try:
+        async with gateway.lifespan(gateway.app):
+            transport = httpx.ASGITransport(app=gateway.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+                print(json.dumps(await phase(client, "healthy", args.requests, circuit_breakers)))
+                faults.error_rate = 1.0
+                print(json.dumps(await phase(client, "failing", args.requests, circuit_breakers)))
+                faults.error_rate = 0.0
+                print(json.dumps(await phase(client, "still_open", args.requests, circuit_breakers)))
+                await asyncio.sleep(args.open_seconds)
+                print(json.dumps(await phase(client, "recovered", args.requests, circuit_breakers)))
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", default=50, type=int, help="Requests per phase")
+    parser.add_argument("--latency", default=0.005, type=float, help="Stub latency in seconds")
+    parser.add_argument("--open-seconds", default=2, type=int)
+    parser.add_argument("--stub-port", default=8102, type=int)
+    asyncio.run(main(parser.parse_args()))
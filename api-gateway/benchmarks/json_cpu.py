@@ -0,0 +1,111 @@
+"""
+CPU spent per response on JSON bodies, for user and event lists of growing size.
+
+The codec phase times, in this process, what a controller does with an upstream
+JSON list: decode it and encode it again with the stdlib JSONResponse (the former
+path), the same with orjson through FastJSONResponse, or pass the bytes on as they
+are with RawResponse. The gateway phase starts a stub upstream with lists of each
+size and main:app under uvicorn, sends --requests requests to a typed controller
+(/api/accounts/users/1/) and to the catch-all route (/api/events/, with
+GATEWAY_PASS_THROUGH off so the JSON path is used), and reads the CPU time of the
+gateway process from /proc. One JSON line is printed per phase, path and size.
+
+    python -m benchmarks.json_cpu --sizes 10,100,1000,5000
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import subprocess
+import aiohttp
+from starlette.responses import JSONResponse
+from benchmarks.stubs import Faults
+from benchmarks.upload_memory import wait_until_up
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def cpu_seconds(pid: int) -> float:
+    """User plus system CPU time of pid."""
+    with open(f"/proc/{pid}/stat") as stat:
+        fields = stat.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / TICKS
+
+
+def codec(sizes, repeat: int):
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("USERS_SERVICE_URL", "http://users.invalid")
+    os.environ.setdefault("EVENTS_SERVICE_URL", "http://events.invalid")
+    from gateway.responses import FastJSONResponse, RawResponse, loads
+
+    raw_headers = [(b"content-type", b"application/json")]
+    paths = {
+        "former": lambda body: JSONResponse(json.loads(body)),
+        "orjson": lambda body: FastJSONResponse(loads(body)),
+        "raw": lambda body: RawResponse(200, raw_headers, body),
+    }
+    for size in sizes:
+        body = Faults(payload_items=size).payload()
+        for name, respond in paths.items():
+            started = time.process_time()
+            for _ in range(repeat):
+                respond(body)
+            print(json.dumps({"phase": "codec", "path": name, "items": size, "bytes": len(body),
+                              "cpu_us_per_response": round((time.process_time() - started) / repeat * 1e6, 2)}))
+
+
+async def gateway_cpu(size: int, args):
+    env = dict(os.environ, SECRET_KEY="benchmark", USERS_SERVICE_URL=f"http://127.0.0.1:{args.stub_port}",
+               EVENTS_SERVICE_URL=f"http://127.0.0.1:{args.stub_port}", GATEWAY_PASS_THROUGH="false",
+               RESPONSE_CACHE_ENABLED="false", RATE_LIMIT_ENABLED="false", UPSTREAM_COALESCE="false")
+    stub = subprocess.Popen([sys.executable, "-m", "benchmarks.stubs", "--port", str(args.stub_port),
+                             "--payload-items", str(size)], cwd=ROOT, stdout=subprocess.DEVNULL)
+    gateway = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port),
+                                "--log-level", "warning", "--no-access-log"], env=env, cwd=ROOT)
+    base = f"http://127.0.0.1:{args.port}"
+    semaphore = asyncio.Semaphore(args.concurrency)
+    try:
+        # Identity responses keep compression out of the numbers.
+        async with aiohttp.ClientSession(headers={"Accept-Encoding": "identity"}) as session:
+            await wait_until_up(session, f"{base}/v2/api/health/")
+            await wait_until_up(session, f"http://127.0.0.1:{args.stub_port}/")
+
+            async def one(path: str):
+                async with semaphore, session.get(f"{base}{path}") as response:
+                    await response.read()
+
+            for path in ("/api/accounts/users/1/", "/api/events/"):
+                await asyncio.gather(*[one(path) for _ in range(args.concurrency)])
+                before = cpu_seconds(gateway.pid)
+                await asyncio.gather(*[one(path) for _ in range(args.requests)])
+                print(json.dumps({"phase": "gateway", "path": path, "items": size,
+                                  "cpu_ms_per_request": round((cpu_seconds(gateway.pid) - before)
+                                                              / args.requests * 1000, 3)}), flush=True)
+    finally:
+        gateway.terminate()
+        gateway.wait()
+        stub.terminate()
+        stub.wait()
+
+
+async def main(args):
+    if not args.skip_codec:
+        codec(args.sizes, args.repeat)
+    for size in args.sizes:
+        await gateway_cpu(size, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,100,1000,5000", type=lambda value: [int(size) for size in value.split(",")],
+                        help="Items in the upstream lists")
+    parser.add_argument("--repeat", default=200, type=int, help="Responses built per codec measurement")
+    parser.add_argument("--requests", default=1000, type=int, help="Gateway requests per path and size")
+    parser.add_argument("--concurrency", default=20, type=int)
+    parser.add_argument("--skip-codec", action="store_true")
+    parser.add_argument("--port", default=8151, type=int)
+    parser.add_argument("--stub-port", default=8152, type=int)
+    asyncio.run(main(parser.parse_args()))
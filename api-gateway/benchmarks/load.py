@@ -0,0 +1,220 @@
+"""
+Load test of the gateway at a fixed request rate.
+
+Starts two stub upstreams (see benchmarks.stubs) as the users and events services
+and main:app under uvicorn with --workers workers, then sends each scenario for
+--duration seconds at --rps requests per second:
+
+    json       GET /api/accounts/users/1/, a typed controller answering JSON
+    multipart  POST /api/accounts/user-documents/ with an --upload-kb document
+    proxy      GET /api/events/, the catch-all proxy
+
+Requests are sent on schedule whether or not earlier ones have finished (open
+loop), and latency is measured from the scheduled time, so a stalled gateway
+shows up as latency rather than as a lower request rate. One JSON line is printed
+per scenario with the throughput, p50/p95/p99 latency, statuses and the RSS of
+the gateway and its workers. Linux only (reads /proc).
+
+    python -m benchmarks.load --workers 2 --rps 500 --duration 20 --latency 0.01
+    python -m benchmarks.load --scenarios proxy --env RESPONSE_CACHE_ENABLED=true > after.jsonl
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import subprocess
+import aiohttp
+from benchmarks.upload_memory import rss_kb, wait_until_up
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ("json", "multipart", "proxy")
+
+
+def process_tree(pid: int) -> list:
+    """Returns pid and the pids of all its descendants."""
+    pids = [pid]
+    for parent in pids:
+        try:
+            with open(f"/proc/{parent}/task/{parent}/children") as children:
+                pids.extend(int(child) for child in children.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def tree_rss_kb(pid: int) -> int:
+    total = 0
+    for member in process_tree(pid):
+        try:
+            total += rss_kb(member)
+        except OSError:
+            pass
+    return total
+
+
+def percentile(ordered: list, share: float) -> float:
+    """Nearest-rank percentile of an ascending list, in milliseconds."""
+    if not ordered:
+        return 0.0
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * share))] * 1000, 2)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def request_for(scenario: str, base: str, upload: bytes):
+    """Returns (method, url, keyword arguments) of one request of the scenario."""
+    if scenario == "json":
+        return "GET", f"{base}/api/accounts/users/1/", {}
+    if scenario == "multipart":
+        form = aiohttp.FormData()
+        form.add_field("document_type", "other")
+        form.add_field("user", "1")
+        form.add_field("document", upload, filename="document.bin", content_type="application/octet-stream")
+        return "POST", f"{base}/api/accounts/user-documents/", {"data": form}
+    return "GET", f"{base}/api/events/", {}
+
+
+async def drive(session, scenario: str, base: str, args, gateway_pid: int) -> dict:
+    upload = b"x" * (args.upload_kb * 1024)
+    latencies = []
+    statuses = {}
+    errors = 0
+    rss = [tree_rss_kb(gateway_pid)]
+
+    async def one(scheduled: float):
+        nonlocal errors
+        method, url, kwargs = request_for(scenario, base, upload)
+        try:
+            async with session.request(method, url, **kwargs) as response:
+                await response.read()
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            errors += 1
+            return
+        latencies.append(time.perf_counter() - scheduled)
+
+    async def sample_rss():
+        while True:
+            await asyncio.sleep(0.5)
+            rss.append(tree_rss_kb(gateway_pid))
+
+    total = int(args.rps * args.duration)
+    sampler = asyncio.ensure_future(sample_rss())
+    tasks = []
+    started = time.perf_counter()
+    for index in range(total):
+        scheduled = started + index / args.rps
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(one(scheduled)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    sampler.cancel()
+    rss.append(tree_rss_kb(gateway_pid))
+
+    latencies.sort()
+    ok = sum(count for status, count in statuses.items() if status < 400)
+    return {
+        "scenario": scenario,
+        "commit": git_commit(),
+        "workers": args.workers,
+        "target_rps": args.rps,
+        "duration_s": round(elapsed, 3),
+        "requests": total,
+        "throughput_rps": round(ok / elapsed, 2),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "errors": errors,
+        "latency_ms": {
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max": percentile(latencies, 1.0),
+        },
+        "rss_kb": {"start": rss[0], "peak": max(rss), "end": rss[-1]},
+        "upstream": {"latency_s": args.latency, "payload_items": args.payload_items, "error_rate": args.error_rate},
+    }
+
+
+def start_stub(port: int, args) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.stubs", "--port", str(port), "--latency", str(args.latency),
+         "--error-rate", str(args.error_rate), "--payload-items", str(args.payload_items)],
+        cwd=ROOT, stdout=subprocess.DEVNULL)
+
+
+async def main(args):
+    users_url = f"http://127.0.0.1:{args.stub_port}"
+    events_url = f"http://127.0.0.1:{args.stub_port + 1}"
+    # Measure the proxy path itself unless the run opts in to caching or rate limiting.
+    env = dict(os.environ, SECRET_KEY="benchmark", USERS_SERVICE_URL=users_url, EVENTS_SERVICE_URL=events_url,
+               RESPONSE_CACHE_ENABLED="false", RATE_LIMIT_ENABLED="false")
+    env.update(args.env)
+
+    stubs = [start_stub(args.stub_port, args), start_stub(args.stub_port + 1, args)]
+    gateway = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--workers", str(args.workers),
+         "--log-level", "warning", "--no-access-log"], env=env, cwd=ROOT)
+    base = f"http://127.0.0.1:{args.port}"
+    try:
+        connector = aiohttp.TCPConnector(limit=args.max_connections)
+        timeout = aiohttp.ClientTimeout(total=args.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            await wait_until_up(session, f"{base}/v2/api/health/")
+            for url in (users_url, events_url):
+                await wait_until_up(session, f"{url}/")
+            for scenario in args.scenarios:
+                # A short warm-up opens the upstream pools of every worker first.
+                await drive(session, scenario, base, argparse.Namespace(**{**vars(args), "duration": args.warmup}),
+                            gateway.pid)
+                print(json.dumps(await drive(session, scenario, base, args, gateway.pid)), flush=True)
+    finally:
+        gateway.terminate()
+        gateway.wait()
+        for stub in stubs:
+            stub.terminate()
+            stub.wait()
+
+
+def scenarios(value: str) -> list:
+    names = [name for name in value.split(",") if name]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return names
+
+
+def env_pair(value: str) -> tuple:
+    name, separator, setting = value.partition("=")
+    if not separator:
+        raise argparse.ArgumentTypeError("expected NAME=VALUE")
+    return name, setting
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default=1, type=int, help="uvicorn workers of the gateway")
+    parser.add_argument("--rps", default=200, type=float, help="Requests per second of each scenario")
+    parser.add_argument("--duration", default=10, type=float, help="Seconds each scenario runs")
+    parser.add_argument("--warmup", default=1, type=float, help="Seconds of unmeasured traffic before each scenario")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), type=scenarios,
+                        help=f"Comma separated, of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--latency", default=0.0, type=float, help="Seconds the stub upstreams take to answer")
+    parser.add_argument("--payload-items", default=10, type=int, help="Items in the JSON lists the stubs return")
+    parser.add_argument("--error-rate", default=0.0, type=float, help="Share of 503s from the stubs")
+    parser.add_argument("--upload-kb", default=64, type=int, help="Document size of the multipart scenario")
+    parser.add_argument("--max-connections", default=1000, type=int, help="Client connections to the gateway")
+    parser.add_argument("--timeout", default=60, type=float, help="Seconds before a request counts as an error")
+    parser.add_argument("--env", default=[], action="append", type=env_pair,
+                        help="NAME=VALUE gateway setting, may be repeated")
+    parser.add_argument("--port", default=8141, type=int)
+    parser.add_argument("--stub-port", default=8142, type=int, help="Users stub port; events uses the next one")
+    asyncio.run(main(parser.parse_args()))
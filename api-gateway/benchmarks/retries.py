@@ -0,0 +1,86 @@
+"""
+Retry and hedging run against two local stub instances of one service.
+
+The first instance answers quickly but fails --error-rate of its requests with a
+503, the second answers without errors after --slow-latency. The same traffic is
+sent to /api/events/{id}/ (retries only) and /api/events/ (retries and hedging),
+with and without retries, and the statuses, p50/p99 latency and retry budget use
+of each phase are printed.
+
+    python -m benchmarks.retries --error-rate 0.2
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+
+
+async def drive(client, path: str, requests: int, concurrency: int) -> dict:
+    statuses = {}
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    await asyncio.gather(*[one() for _ in range(requests)])
+    latencies.sort()
+    return {
+        "statuses": statuses,
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+    }
+
+
+async def main(args):
+    ports = [args.base_port, args.base_port + 1]
+    os.environ.update(
+        SECRET_KEY="benchmark", RESPONSE_CACHE_ENABLED="false", UPSTREAM_COALESCE="false", BREAKER_ENABLED="false",
+        USERS_SERVICE_URL="http://users.invalid", EVENTS_SERVICE_URL="http://events.invalid",
+        EVENTS_SERVICE_INSTANCES=",".join(f"http://127.0.0.1:{port}" for port in ports),
+        UPSTREAM_BALANCER="p2c", UPSTREAM_HEALTH_CHECK_INTERVAL="0",
+    )
+    import httpx
+    import main as gateway
+    from conf import settings
+    from gateway.network import retry_budget
+    from benchmarks import stubs
+
+    faults = [stubs.Faults(latency=args.fast_latency, error_rate=args.error_rate),
+              stubs.Faults(latency=args.slow_latency)]
+    runners = [await stubs.start(port, fault) for port, fault in zip(ports, faults)]
+    retries = settings.UPSTREAM_RETRIES
+    try:
+        async with gateway.lifespan(gateway.app):
+            transport = httpx.ASGITransport(app=gateway.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+                for phase, path, phase_retries in [("no_retries", "/api/events/1/", 0),
+                                                   ("retries", "/api/events/1/", retries),
+                                                   ("retries_and_hedging", "/api/events/", retries)]:
+                    settings.UPSTREAM_RETRIES = phase_retries
+                    before = retry_budget.stats()
+                    result = await drive(client, path, args.requests, args.concurrency)
+                    after = retry_budget.stats()
+                    result.update(phase=phase, **{name: after[name] - before[name]
+                                                  for name in ("retries", "hedges", "rejected")})
+                    print(json.dumps(result))
+    finally:
+        settings.UPSTREAM_RETRIES = retries
+        for runner in runners:
+            await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--error-rate", default=0.2, type=float, help="Share of 503s from the fast instance")
+    parser.add_argument("--fast-latency", default=0.005, type=float)
+    parser.add_argument("--slow-latency", default=0.2, type=float)
+    parser.add_argument("--requests", default=1000, type=int)
+    parser.add_argument("--concurrency", default=20, type=int)
+    parser.add_argument("--base-port", default=8121, type=int)
+    asyncio.run(main(parser.parse_args()))
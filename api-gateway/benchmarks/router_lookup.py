@@ -0,0 +1,58 @@
+"""
+Micro-benchmark of gateway route lookup as the route table grows.
+
+Compares the compiled RouteTable with the former linear scan over ROUTES
+and prints one JSON line per table size.
+
+    python -m benchmarks.router_lookup --sizes 10,100,1000,10000
+"""
+import json
+import timeit
+import argparse
+from gateway.router import RouteTable
+
+
+def build_routes(size: int) -> dict:
+    """Returns size synthetic routes spread over ten services, half of them with a path parameter."""
+    routes = {}
+    for index in range(size):
+        service = f'http://service-{index % 10}:8000'
+        if index % 2:
+            routes[f'api/resource-{index}/{{id}}/'] = f'{service}/api/resource-{index}/{{id}}/'
+        else:
+            routes[f'api/resource-{index}/'] = f'{service}/api/resource-{index}/'
+    return routes
+
+
+def linear_lookup(routes: dict, path: str):
+    service_url = None
+    for route, target_url in routes.items():
+        if path == route:
+            service_url = target_url
+    return service_url
+
+
+def main(args):
+    for size in args.sizes:
+        routes = build_routes(size)
+        table = RouteTable.compile(routes)
+        static_path = f'api/resource-{size - 2}/'
+        param_path = f'api/resource-{size - 1}/42/'
+        assert table.match(static_path, 'GET').url == routes[static_path]
+
+        compiled_static = timeit.timeit(lambda: table.match(static_path, 'GET'), number=args.number)
+        compiled_param = timeit.timeit(lambda: table.match(param_path, 'GET'), number=args.number)
+        linear_static = timeit.timeit(lambda: linear_lookup(routes, static_path), number=args.number)
+        print(json.dumps({
+            'routes': size,
+            'compiled_static_us': round(compiled_static / args.number * 1e6, 3),
+            'compiled_param_us': round(compiled_param / args.number * 1e6, 3),
+            'linear_static_us': round(linear_static / args.number * 1e6, 3),
+        }))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10,100,1000,10000', type=lambda value: [int(size) for size in value.split(',')])
+    parser.add_argument('--number', default=20000, type=int, help='Lookups per measurement')
+    main(parser.parse_args())
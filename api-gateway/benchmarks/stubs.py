@@ -0,0 +1,80 @@
+"""
+Stub upstream service for gateway benchmarks and fault injection.
+
+Answers every path with a JSON list of a configurable size after a configurable
+latency, and fails a configurable share of requests with a 503. The faults can
+be changed while it runs with POST /__faults__ {"latency": 0.5, "error_rate": 1}.
+
+    python -m benchmarks.stubs --port 8102 --latency 0.01 --payload-items 100
+    python -m benchmarks.stubs --port 8102 --unix-socket /tmp/stub.sock
+"""
+import json
+import random
+import asyncio
+import argparse
+from aiohttp import web
+
+
+class Faults:
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, payload_items: int = 10):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.payload_items = payload_items
+        self.requests = 0
+        self.last = None  # The last request answered, for tests to look at what reached the upstream.
+
+    def payload(self) -> bytes:
+        items = [{"id": index, "username": f"user-{index}", "email": f"user-{index}@example.com",
+                  "first_name": "Stub", "last_name": "User", "department": 1, "role": 1}
+                 for index in range(self.payload_items)]
+        return json.dumps(items).encode()
+
+
+def make_app(faults: Faults) -> web.Application:
+    body = faults.payload()
+
+    async def handle(request: web.Request) -> web.StreamResponse:
+        faults.requests += 1
+        faults.last = request
+        async for _ in request.content.iter_chunked(64 * 1024):
+            pass
+        if faults.latency:
+            await asyncio.sleep(faults.latency)
+        if faults.error_rate and random.random() < faults.error_rate:
+            return web.json_response({"detail": "Injected fault."}, status=503)
+        return web.Response(body=body, content_type="application/json")
+
+    async def set_faults(request: web.Request) -> web.Response:
+        nonlocal body
+        changes = await request.json()
+        for name in ("latency", "error_rate", "payload_items"):
+            if name in changes:
+                setattr(faults, name, changes[name])
+        body = faults.payload()
+        return web.json_response({name: getattr(faults, name)
+                                  for name in ("latency", "error_rate", "payload_items", "requests")})
+
+    app = web.Application(client_max_size=0)
+    app.router.add_post("/__faults__", set_faults)
+    app.router.add_route("*", "/{tail:.*}", handle)
+    return app
+
+
+async def start(port: int, faults: Faults, host: str = "127.0.0.1") -> web.AppRunner:
+    """Starts a stub on the running loop; stop it with await runner.cleanup()."""
+    runner = web.AppRunner(make_app(faults), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", default=8102, type=int)
+    parser.add_argument("--latency", default=0.0, type=float, help="Seconds before answering")
+    parser.add_argument("--error-rate", default=0.0, type=float, help="Share of requests answered with a 503")
+    parser.add_argument("--payload-items", default=10, type=int, help="Items in the JSON list returned")
+    parser.add_argument("--unix-socket", help="Also serve on this Unix socket")
+    args = parser.parse_args()
+    web.run_app(make_app(Faults(args.latency, args.error_rate, args.payload_items)), host="127.0.0.1",
+                port=args.port, path=args.unix_socket, access_log=None)
@@ -0,0 +1,91 @@
+"""
+Latency of one gateway-to-upstream hop over TCP and over a Unix socket.
+
+Starts a stub upstream serving on both a local TCP port and a Unix socket, then
+fetches from it through the gateway's own upstream pool (network.fetch_raw) at the
+http:// URL and at the unix: one, in alternating rounds, and prints one JSON line per
+transport with the p50/p99/mean latency, and a last line with what the socket
+saves per hop.
+
+    python -m benchmarks.unix_socket --requests 5000 --payload-items 10
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def summary(latencies: list) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "p50_us": round(latencies[len(latencies) // 2] * 1e6, 1),
+        "p99_us": round(latencies[int(len(latencies) * 0.99)] * 1e6, 1),
+        "mean_us": round(sum(latencies) / len(latencies) * 1e6, 1),
+    }
+
+
+async def measure(fetch_raw, url: str, requests: int, concurrency: int) -> list:
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            status, _, _ = await fetch_raw(url, "get")
+            latencies.append(time.perf_counter() - started)
+            assert status == 200, status
+
+    await asyncio.gather(*[one() for _ in range(requests)])
+    return latencies
+
+
+async def main(args):
+    socket_path = os.path.join(tempfile.mkdtemp(), "stub.sock")
+    tcp_url = f"http://127.0.0.1:{args.port}"
+    os.environ.update(SECRET_KEY="benchmark", USERS_SERVICE_URL=tcp_url, EVENTS_SERVICE_URL=f"unix:{socket_path}",
+                      UPSTREAM_COALESCE="false", METRICS_ENABLED="false")
+    from conf import settings
+    from gateway.network import fetch_raw, upstream_pool
+
+    stub = subprocess.Popen([sys.executable, "-m", "benchmarks.stubs", "--port", str(args.port), "--unix-socket",
+                             socket_path, "--payload-items", str(args.payload_items)], cwd=ROOT,
+                            stdout=subprocess.DEVNULL)
+    try:
+        for _ in range(50):
+            if os.path.exists(socket_path):
+                break
+            await asyncio.sleep(0.1)
+        urls = {"tcp": settings.USERS_SERVICE_URL + "/api/events/", "unix": settings.EVENTS_SERVICE_URL + "/api/events/"}
+        for url in urls.values():
+            await measure(fetch_raw, url, 200, args.concurrency)
+        # Alternate the transports in rounds so drift of the host affects both alike.
+        latencies = {transport: [] for transport in urls}
+        for _ in range(args.rounds):
+            for transport, url in urls.items():
+                latencies[transport] += await measure(fetch_raw, url, args.requests // args.rounds, args.concurrency)
+        results = {transport: summary(values) for transport, values in latencies.items()}
+        for transport, result in results.items():
+            print(json.dumps({"transport": transport, "concurrency": args.concurrency,
+                              "payload_items": args.payload_items, **result}))
+        print(json.dumps({"saved_per_hop_us": {name: round(results["tcp"][name] - results["unix"][name], 1)
+                                               for name in results["tcp"]}}))
+    finally:
+        await upstream_pool.close()
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", default=5000, type=int, help="Requests per transport")
+    parser.add_argument("--rounds", default=10, type=int)
+    parser.add_argument("--concurrency", default=1, type=int, help="Requests in flight; 1 measures a lone hop")
+    parser.add_argument("--payload-items", default=10, type=int, help="Items in the JSON list the stub returns")
+    parser.add_argument("--port", default=8161, type=int)
+    asyncio.run(main(parser.parse_args()))
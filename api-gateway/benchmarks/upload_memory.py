@@ -0,0 +1,104 @@
+"""
+Measures gateway RSS while streaming document uploads of growing size.
+
+Starts a stub users service that drains uploads and the gateway under uvicorn,
+then posts multipart bodies of each size and prints one JSON line per size with
+the gateway's resident memory before and after. Linux only (reads /proc).
+
+    python -m benchmarks.upload_memory --sizes 1,16,64,256
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import subprocess
+import aiohttp
+from aiohttp import web
+
+CHUNK = b'x' * (64 * 1024)
+
+
+def rss_kb(pid: int) -> int:
+    """Returns the resident set size of pid in kB."""
+    with open(f'/proc/{pid}/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+async def drain(request):
+    received = 0
+    async for chunk in request.content.iter_chunked(64 * 1024):
+        received += len(chunk)
+    return web.json_response({'received': received}, status=201)
+
+
+async def document(size_mb: int):
+    for _ in range(size_mb * 16):
+        yield CHUNK
+
+
+async def wait_until_up(session, url, attempts=50):
+    for _ in range(attempts):
+        try:
+            async with session.get(url):
+                return
+        except aiohttp.ClientConnectionError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f'{url} did not come up')
+
+
+async def main(args):
+    stub = web.Application(client_max_size=0)
+    stub.router.add_post('/api/accounts/user-documents/', drain)
+    runner = web.AppRunner(stub)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', args.stub_port).start()
+
+    env = dict(os.environ, SECRET_KEY='benchmark', UPLOAD_MAX_SIZE=str(2 ** 40),
+               UPLOAD_SPOOL_TO_DISK=str(args.spool).lower(),
+               USERS_SERVICE_URL=f'http://127.0.0.1:{args.stub_port}',
+               EVENTS_SERVICE_URL=f'http://127.0.0.1:{args.stub_port}')
+    gateway = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(args.port), '--log-level', 'warning'],
+        env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    base = f'http://127.0.0.1:{args.port}'
+    try:
+        async with aiohttp.ClientSession() as session:
+            await wait_until_up(session, f'{base}/v2/api/health/')
+            baseline = rss_kb(gateway.pid)
+            for size_mb in args.sizes:
+                form = aiohttp.FormData()
+                form.add_field('document_type', 'other')
+                form.add_field('user', '1')
+                form.add_field('document', document(size_mb), filename='document.bin',
+                               content_type='application/octet-stream')
+                # Multipart bodies built from generators have no length, so the gateway spools them.
+                started = time.perf_counter()
+                async with session.post(f'{base}/api/accounts/user-documents/', data=form) as response:
+                    await response.read()
+                    status = response.status
+                print(json.dumps({
+                    'size_mb': size_mb,
+                    'status': status,
+                    'seconds': round(time.perf_counter() - started, 3),
+                    'rss_baseline_kb': baseline,
+                    'rss_after_kb': rss_kb(gateway.pid),
+                }))
+    finally:
+        gateway.terminate()
+        gateway.wait()
+        await runner.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1,16,64,256', type=lambda value: [int(size) for size in value.split(',')],
+                        help='Upload sizes in MB')
+    parser.add_argument('--port', default=8101, type=int)
+    parser.add_argument('--stub-port', default=8102, type=int)
+    parser.add_argument('--spool', action='store_true', help='Spool uploads to disk before forwarding')
+    asyncio.run(main(parser.parse_args()))
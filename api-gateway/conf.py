@@ -1,12 +1,134 @@
 import os
+from typing import Dict
+from urllib.parse import quote
+from pydantic import field_validator
 from pydantic_settings import BaseSettings
 
+
+def upstream_url(url: str) -> str:
+    """
+    Spells a unix:/path/to/service.sock upstream as http+unix://%2Fpath%2Fto%2Fservice.sock,
+    a URL that request paths can be appended to like any other. Other URLs are kept as is.
+    """
+    if url.startswith('unix:'):
+        return 'http+unix://' + quote(url[len('unix:'):], safe='')
+    return url
+
+
 class Settings(BaseSettings):
     SECRET_KEY: str = os.environ.get('SECRET_KEY')
-    GATEWAY_TIMEOUT: int = 59
+    GATEWAY_TIMEOUT: int = 59  # Timeout budget of a route in seconds, unless it sets "timeout".
+    DEADLINE_HEADER: str = 'X-Request-Deadline'  # Carries the deadline of a request to the services.
+    TOKEN_CACHE_SIZE: int = 10000  # Verified access tokens kept per worker, 0 disables the cache.
+    # Key shared with the services to sign the identity of verified callers; empty leaves the tokens to them.
+    IDENTITY_SIGNING_KEY: str = ''
+    IDENTITY_HEADER: str = 'X-Gateway-Identity'
+    IDENTITY_TTL: int = 120  # Seconds a forwarded identity is valid, at most as long as its token.
 
-    # URLs for the microservices.
+    # Bulkheads: requests in flight per upstream service and per route class ("bulkhead" option of a route).
+    UPSTREAM_CONCURRENCY: int = 200  # 0 leaves the upstreams unbounded.
+    BULKHEAD_CLASSES: Dict[str, int] = {"auth": 20, "uploads": 10}
+    BULKHEAD_QUEUE_SIZE: int = 50  # Requests waiting for a slot; more are shed with a 503.
+    BULKHEAD_QUEUE_TIMEOUT: float = 1.0  # Seconds a request waits for a slot before a 503.
+    BULKHEAD_ADAPTIVE: bool = False  # Adjust the limits to the observed latency (AIMD).
+    BULKHEAD_ADAPTIVE_LATENCY: float = 1.0  # Latency above which an adaptive limit shrinks.
+    BULKHEAD_MIN_CONCURRENCY: int = 4  # Floor of an adaptive limit.
+
+    # URLs for the microservices: http://host:port, or unix:/path/to/service.sock for one on this host.
     USERS_SERVICE_URL: str = os.environ.get('USERS_SERVICE_URL')
     EVENTS_SERVICE_URL: str = os.environ.get('EVENTS_SERVICE_URL')
 
+    # Instances behind each service URL, comma separated, unix: sockets included. Empty means the service URL itself.
+    USERS_SERVICE_INSTANCES: str = ''
+    EVENTS_SERVICE_INSTANCES: str = ''
+    UPSTREAM_BALANCER: str = 'least_outstanding'  # Or 'p2c' (power of two choices).
+    UPSTREAM_SLOW_START_SECONDS: int = 30  # Ramp-up of traffic to an instance that (re)joins.
+    UPSTREAM_HEALTH_CHECK_INTERVAL: int = 5  # Seconds between active health checks, 0 disables them.
+    UPSTREAM_HEALTH_CHECK_PATH: str = '/'
+    UPSTREAM_HEALTH_CHECK_TIMEOUT: float = 2.0
+    UPSTREAM_UNHEALTHY_THRESHOLD: int = 2  # Failed checks in a row before an instance is skipped.
+
+    # Upstream connection pool, one per upstream origin (each instance of a service has its own).
+    UPSTREAM_POOL_SIZE: int = 100  # Max open connections to an origin.
+    UPSTREAM_KEEPALIVE_TIMEOUT: int = 30  # Seconds an idle connection is kept open.
+    UPSTREAM_DNS_CACHE_TTL: int = 300  # Seconds a DNS lookup is cached.
+    UPSTREAM_COALESCE: bool = True  # Share one upstream call between identical concurrent reads.
+
+    # Circuit breaker per upstream: fail fast with a 503 while the upstream is failing or slow.
+    BREAKER_ENABLED: bool = True
+    BREAKER_WINDOW: int = 30  # Seconds of outcomes the error and slow call rates are computed over.
+    BREAKER_MIN_REQUESTS: int = 20  # Calls needed in the window before the breaker can open.
+    BREAKER_ERROR_RATE: float = 0.5  # Share of failed calls (errors, timeouts, 5xx) that opens it.
+    BREAKER_SLOW_CALL_SECONDS: float = 10.0  # Calls slower than this count as slow.
+    BREAKER_SLOW_CALL_RATE: float = 0.8  # Share of slow calls that opens it.
+    BREAKER_OPEN_SECONDS: int = 15  # Time spent failing fast before probing again.
+    BREAKER_HALF_OPEN_PROBES: int = 3  # Successful probes needed to close it again.
+
+    # Retries and hedging of idempotent calls, under one retry budget for all upstreams.
+    UPSTREAM_RETRIES: int = 2  # Extra attempts after a connection error, timeout, 502, 503 or 504.
+    UPSTREAM_RETRY_BACKOFF: float = 0.05  # Base of the jittered exponential backoff, in seconds.
+    UPSTREAM_RETRY_BACKOFF_MAX: float = 1.0
+    RETRY_BUDGET_RATIO: float = 0.2  # Retries and hedges earned per original call.
+    RETRY_BUDGET_MIN_PER_SECOND: float = 1.0  # Retries earned per second regardless of traffic.
+    HEDGE_PERCENTILE: float = 95  # Hedge routes send a second attempt past this latency percentile.
+    HEDGE_MIN_DELAY: float = 0.02  # Never hedge sooner than this, in seconds.
+
+    # Token-bucket rate limiting per client and route, overridden by the "rate_limit" option of a route.
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_RATE: float = 20  # Requests per second a client may sustain on a route, 0 disables the default.
+    RATE_LIMIT_BURST: int = 40  # Requests a client may send at once after being idle.
+    RATE_LIMIT_BACKEND: str = 'shared'  # 'shared' across the workers of the host, or 'memory' per worker.
+    RATE_LIMIT_PATH: str = '/dev/shm/gateway-rate-limits'  # Memory-mapped bucket table of the shared backend.
+    RATE_LIMIT_SLOTS: int = 65536  # Buckets kept; size it well above the number of active clients.
+
+    # Batch endpoint: sub-requests for gateway routes, run concurrently under one deadline.
+    BATCH_MAX_REQUESTS: int = 20
+    BATCH_TIMEOUT: float = 10  # Default and largest deadline of a batch, in seconds.
+
+    # Routes file (JSON) replacing gateway.routes.ROUTES, reloaded by every worker when it changes.
+    ROUTES_FILE: str = ''
+    ROUTES_RELOAD_INTERVAL: float = 2  # Seconds between checks of ROUTES_FILE, 0 disables reloading.
+
+    # Catch-all proxy: stream bodies through untouched instead of parsing them as JSON.
+    GATEWAY_PASS_THROUGH: bool = True
+    GATEWAY_STREAM_CHUNK_SIZE: int = 64 * 1024  # Bytes held in memory per in-flight chunk.
+
+    # Document uploads are re-streamed to the service, never read whole into memory.
+    UPLOAD_MAX_SIZE: int = 20 * 1024 * 1024  # Largest accepted multipart body, in bytes.
+    UPLOAD_SPOOL_TO_DISK: bool = False  # Receive the whole body before contacting the service.
+    UPLOAD_SPOOL_MEMORY_SIZE: int = 1024 * 1024  # Spooled bodies above this size go to a temp file.
+
+    # Response compression negotiated with clients, and compressed transfer from the upstreams.
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024  # Bodies smaller than this are sent as they are.
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4  # Fast enough to compress on the fly; 11 is for static assets.
+    UPSTREAM_COMPRESSION: bool = True  # Ask upstreams for compressed bodies and pass them through when possible.
+
+    # Prometheus metrics on /metrics, summed over the snapshots each worker writes to METRICS_DIR.
+    METRICS_ENABLED: bool = True
+    METRICS_DIR: str = '/tmp/gateway-metrics'  # Shared by the workers of one host; clear it on deploy.
+    METRICS_FLUSH_INTERVAL: float = 5  # Seconds between snapshots of a worker's numbers.
+
+    # W3C trace context: sampled traces are exported as JSON lines, in batches.
+    TRACE_SAMPLE_RATE: float = 0.01  # Share of new traces recorded; callers' traceparent decides for theirs.
+    TRACE_EXPORT_PATH: str = '/tmp/traces/api-gateway.jsonl'  # Local stand-in for a trace collector.
+    TRACE_BATCH_SIZE: int = 512
+    TRACE_EXPORT_INTERVAL: float = 5
+    TRACE_MAX_QUEUE: int = 10000  # Spans waiting for export beyond this are dropped.
+
+    # Response cache for routes with a "cache" policy, see gateway.routes.
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_BACKEND: str = 'memory'  # 'memory' per worker, or 'disk' shared by every worker.
+    RESPONSE_CACHE_PATH: str = '/tmp/gateway-response-cache.sqlite3'  # Use /dev/shm to keep it in memory.
+    RESPONSE_CACHE_MAX_ENTRIES: int = 10000
+    RESPONSE_CACHE_MAX_BODY: int = 1024 * 1024  # Larger responses are never cached.
+
+    @field_validator('USERS_SERVICE_URL', 'EVENTS_SERVICE_URL', 'USERS_SERVICE_INSTANCES', 'EVENTS_SERVICE_INSTANCES')
+    @classmethod
+    def unix_socket_urls(cls, value):
+        if not value:
+            return value
+        return ','.join(upstream_url(url.strip()) for url in value.split(','))
+
 settings = Settings()
@@ -1,21 +1,148 @@
 import os
+import time
+import hashlib
 import jwt
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Optional
 from conf import settings
 from .exceptions import (AuthTokenMissing, AuthTokenExpired, AuthTokenCorrupted)
 
+
+class TokenCache:
+    """
+    Bounded LRU cache of verified access token payloads, keyed on a hash of the
+    token so the tokens themselves are never kept. An entry is dropped once its
+    token reaches its exp claim, or when the token is revoked.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (payload, exp)
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str):
+        """Returns the cached payload of a still-valid token, or None."""
+        key = self.key(token)
+        entry = self._entries.get(key)
+        if entry is not None:
+            payload, exp = entry
+            if exp > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return payload
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def set(self, token: str, payload: dict):
+        """Caches a verified payload until its exp; tokens without exp are not cached."""
+        exp = payload.get('exp')
+        if not self.max_size or exp is None:
+            return
+        self._entries[self.key(token)] = (payload, exp)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+        # Drop expired entries from the cold end rather than waiting for them to age out.
+        now = time.time()
+        while self._entries and next(iter(self._entries.values()))[1] <= now:
+            self._entries.popitem(last=False)
+
+    def revoke(self, token: str) -> bool:
+        """Purges a token so the next use is verified again. Returns whether it was cached."""
+        return self._entries.pop(self.key(token), None) is not None
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
+# Verified tokens of this worker, shared by every request.
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE)
+
+# Issuer of the identities the gateway signs; the services only trust this one.
+IDENTITY_ISSUER = 'api-gateway'
+
+
 def validate_access_token(authorization: str = None):
     """Validates and decodes the provided authorization token."""
     if not authorization:
         raise AuthTokenMissing('Authorization token is missing from the request headers.')
 
     token = authorization.replace('Bearer ', '')
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
+
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms='HS256')
-        return payload
     except jwt.exceptions.ExpiredSignatureError:
         raise AuthTokenExpired('The provided authorization token has expired. Please authenticate again.')
-    except jwt.exceptions.DecodeError:
+    except jwt.exceptions.InvalidTokenError:
+        # Corrupted, badly signed, not yet valid or otherwise unacceptable.
         raise AuthTokenCorrupted('The provided authorization token is invalid or corrupted.')
+    token_cache.set(token, payload)
+    return payload
+
+# Signed identity of the caller of the current request, forwarded to the services.
+request_identity: ContextVar[Optional[str]] = ContextVar("request_identity", default=None)
+
+
+def sign_identity(payload: dict) -> str:
+    """
+    Signs the claims of a verified access token the services need to authenticate the
+    caller with IDENTITY_SIGNING_KEY. The identity is valid for IDENTITY_TTL seconds,
+    or until the token expires if that is sooner, so one that leaks is soon useless.
+    """
+    if payload.get('token_type', 'access') != 'access':
+        raise AuthTokenCorrupted('The provided authorization token is not an access token.')
+    claims = {
+        'iss': IDENTITY_ISSUER,
+        'user_id': payload.get('user_id', payload.get('id')),
+        'email': payload.get('email'),
+        'permissions': payload.get('permissions', []),
+        'is_superuser': payload.get('is_superuser', False),
+    }
+    now = int(time.time())
+    claims['iat'] = now
+    claims['exp'] = min(payload.get('exp', now + settings.IDENTITY_TTL), now + settings.IDENTITY_TTL)
+    return jwt.encode(claims, settings.IDENTITY_SIGNING_KEY, algorithm='HS256')
+
+
+def identify(authorization: Optional[str]):
+    """
+    Verifies the bearer token of a request and makes its signed identity the one
+    forwarded upstream. Returns the token to undo it with request_identity.reset(token),
+    or None when identities are not forwarded or the request carries no token.
+    """
+    if not settings.IDENTITY_SIGNING_KEY or not authorization:
+        return None
+    return request_identity.set(sign_identity(validate_access_token(authorization)))
+
+
+def with_identity(headers: Optional[dict]) -> Optional[dict]:
+    """
+    Returns a copy of headers carrying the identity of the current request in
+    IDENTITY_HEADER. Any identity the client sent is dropped.
+    """
+    identity = request_identity.get()
+    name = settings.IDENTITY_HEADER.lower()
+    headers = {key: value for key, value in (headers or {}).items() if key.lower() != name}
+    if identity is not None:
+        headers[settings.IDENTITY_HEADER] = identity
+    return headers
+
+def revoke_access_token(authorization: str) -> bool:
+    """Purges a revoked token from the cache of verified tokens."""
+    return token_cache.revoke(authorization.replace('Bearer ', ''))
 
 def extract_authorization_headers(headers):
     """Extracts relevant headers from the request for processing."""
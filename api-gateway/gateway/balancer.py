@@ -0,0 +1,132 @@
+import time
+import random
+import asyncio
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, List
+from urllib.parse import urlsplit
+from conf import settings
+
+
+def origin(url: str) -> str:
+    """Returns the scheme://host:port part of the url, which keys upstream pools, instances and breakers."""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class Endpoint:
+    """One instance of a service."""
+
+    def __init__(self, url: str):
+        self.url = origin(url)
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0
+        self.warm_from = 0.0  # Start of the slow-start ramp, 0 when fully warm.
+
+    def weight(self, now: float) -> float:
+        """Share of its normal traffic the instance takes, ramping up after it (re)joins."""
+        ramp = settings.UPSTREAM_SLOW_START_SECONDS
+        if not self.warm_from or not ramp:
+            return 1.0
+        warmed = (now - self.warm_from) / ramp
+        if warmed >= 1:
+            self.warm_from = 0.0
+            return 1.0
+        return max(0.1, warmed)
+
+    def load(self, now: float) -> float:
+        return (self.outstanding + 1) / self.weight(now)
+
+    def mark(self, healthy: bool):
+        if healthy:
+            if not self.healthy:
+                self.warm_from = time.monotonic()
+            self.healthy, self.failures = True, 0
+        else:
+            self.failures += 1
+            if self.failures >= settings.UPSTREAM_UNHEALTHY_THRESHOLD:
+                self.healthy = False
+
+
+class EndpointPool:
+    """The instances behind one service url and the strategy that picks between them."""
+
+    def __init__(self, service_url: str, instance_urls: List[str]):
+        self.service_url = origin(service_url)
+        self.endpoints = [Endpoint(url) for url in instance_urls] or [Endpoint(service_url)]
+
+    def pick(self, available: Callable[[str], bool]) -> Endpoint:
+        now = time.monotonic()
+        candidates = [endpoint for endpoint in self.endpoints if endpoint.healthy and available(endpoint.url)]
+        if not candidates:
+            # Everything looks down: keep trying all of them rather than failing every request.
+            candidates = self.endpoints
+        if len(candidates) == 1:
+            return candidates[0]
+        if settings.UPSTREAM_BALANCER == 'p2c':
+            first, second = random.sample(candidates, 2)
+            return first if first.load(now) <= second.load(now) else second
+        return min(candidates, key=lambda endpoint: endpoint.load(now))
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            endpoint.url: {
+                "healthy": endpoint.healthy,
+                "outstanding": endpoint.outstanding,
+                "weight": round(endpoint.weight(now), 2),
+            }
+            for endpoint in self.endpoints
+        }
+
+
+class LoadBalancer:
+    """
+    Resolves a service url to one of its instances, by least outstanding requests
+    or power of two choices, skipping instances that fail their health checks or
+    whose circuit breaker is open, and ramping up traffic to instances that join.
+    """
+
+    def __init__(self):
+        self._pools: Dict[str, EndpointPool] = {}
+
+    def configure(self, services: Dict[str, str]):
+        """Builds the pools from {service url: comma separated instance urls}."""
+        pools = {}
+        for service_url, instances in services.items():
+            if service_url:
+                instance_urls = [url.strip() for url in (instances or '').split(',') if url.strip()]
+                pools[origin(service_url)] = EndpointPool(service_url, instance_urls)
+        self._pools = pools
+
+    def instance_urls(self) -> List[str]:
+        return [endpoint.url for pool in self._pools.values() for endpoint in pool.endpoints]
+
+    @contextmanager
+    def acquire(self, url: str, available: Callable[[str], bool] = lambda url: True):
+        """Yields url rewritten to the chosen instance, counted as outstanding until the block exits."""
+        pool = self._pools.get(origin(url))
+        if pool is None:
+            yield url
+            return
+        endpoint = pool.pick(available)
+        endpoint.outstanding += 1
+        try:
+            yield endpoint.url + url[len(pool.service_url):]
+        finally:
+            endpoint.outstanding -= 1
+
+    async def run_health_checks(self, probe: Callable[[str], Awaitable[bool]]):
+        """Probes every instance each UPSTREAM_HEALTH_CHECK_INTERVAL seconds until cancelled."""
+        while True:
+            endpoints = [endpoint for pool in self._pools.values() for endpoint in pool.endpoints]
+            results = await asyncio.gather(*[probe(endpoint.url) for endpoint in endpoints])
+            for endpoint, healthy in zip(endpoints, results):
+                endpoint.mark(healthy)
+            await asyncio.sleep(settings.UPSTREAM_HEALTH_CHECK_INTERVAL)
+
+    def stats(self) -> dict:
+        return {service_url: pool.stats() for service_url, pool in self._pools.items()}
+
+
+load_balancer = LoadBalancer()
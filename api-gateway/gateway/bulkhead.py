@@ -0,0 +1,154 @@
+import time
+import asyncio
+from collections import deque
+from typing import Dict, Optional
+from conf import settings
+from .balancer import origin
+from .exceptions import UpstreamUnavailable
+
+
+class Bulkhead:
+    """
+    Bounds the requests in flight through one upstream or route class. Requests over
+    the limit wait in a short queue for up to BULKHEAD_QUEUE_TIMEOUT seconds; once the
+    queue is full, new ones are shed straight away rather than piling up.
+
+    With BULKHEAD_ADAPTIVE the limit follows the observed latency (AIMD): it grows by
+    one per limit's worth of fast requests and shrinks by a tenth, at most once per
+    latency interval, when a request takes longer than BULKHEAD_ADAPTIVE_LATENCY.
+    """
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.max_limit = limit
+        self.limit = float(limit)
+        self.in_flight = 0
+        self.admitted = 0
+        self.queued = 0
+        self.shed = 0
+        self.timed_out = 0
+        self._waiters = deque()
+        self._decreased_at = 0.0
+
+    async def acquire(self):
+        """Takes a slot, waiting in the queue if needed. Raises UpstreamUnavailable when shed."""
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= settings.BULKHEAD_QUEUE_SIZE:
+            self.shed += 1
+            raise UpstreamUnavailable(f"{self.name} is overloaded.", retry_after=1)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(waiter, settings.BULKHEAD_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise UpstreamUnavailable(f"{self.name} is overloaded.", retry_after=1)
+        except asyncio.CancelledError:
+            # Handed a slot just as the request went away: pass it on.
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        self.admitted += 1
+
+    def release(self, latency: Optional[float] = None):
+        """Frees the slot of a finished request, handing it to the next one in the queue."""
+        if latency is not None and settings.BULKHEAD_ADAPTIVE:
+            self._adapt(latency)
+        self.in_flight -= 1
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def _adapt(self, latency: float):
+        if latency > settings.BULKHEAD_ADAPTIVE_LATENCY:
+            now = time.monotonic()
+            if now - self._decreased_at >= latency:
+                self.limit = max(settings.BULKHEAD_MIN_CONCURRENCY, self.limit * 0.9)
+                self._decreased_at = now
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def stats(self) -> dict:
+        return {
+            "limit": int(self.limit),
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "queue": len(self._waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed": self.shed,
+            "timed_out": self.timed_out,
+        }
+
+
+class Bulkheads:
+    """
+    One bulkhead per upstream service, sized by UPSTREAM_CONCURRENCY, and one per route
+    class named by the "bulkhead" option of a ROUTES rule, sized by BULKHEAD_CLASSES,
+    so a flood on one route or service cannot take every slot of the others.
+    """
+
+    def __init__(self):
+        self._upstreams: Dict[str, Bulkhead] = {}
+        self._classes: Dict[str, Bulkhead] = {}
+
+    def upstream(self, url: str) -> Optional[Bulkhead]:
+        if not settings.UPSTREAM_CONCURRENCY:
+            return None
+        key = origin(url)
+        bulkhead = self._upstreams.get(key)
+        if bulkhead is None:
+            bulkhead = self._upstreams[key] = Bulkhead(key, settings.UPSTREAM_CONCURRENCY)
+        return bulkhead
+
+    def route_class(self, name: Optional[str]) -> Optional[Bulkhead]:
+        limit = settings.BULKHEAD_CLASSES.get(name) if name else None
+        if not limit:
+            return None
+        bulkhead = self._classes.get(name)
+        if bulkhead is None:
+            bulkhead = self._classes[name] = Bulkhead(name, limit)
+        return bulkhead
+
+    async def acquire(self, route) -> list:
+        """
+        Takes a slot of the route's class and of its upstream service, in that order.
+        Raises UpstreamUnavailable, holding nothing, when either sheds the request.
+
+        Returns:
+            the bulkheads held, to hand back to release
+        """
+        held = []
+        try:
+            for bulkhead in (self.route_class(route.options.get("bulkhead")), self.upstream(route.target)):
+                if bulkhead is not None:
+                    await bulkhead.acquire()
+                    held.append(bulkhead)
+        except BaseException:
+            self.release(held)
+            raise
+        return held
+
+    @staticmethod
+    def release(held: list, latency: Optional[float] = None):
+        for bulkhead in held:
+            bulkhead.release(latency)
+
+    def stats(self) -> dict:
+        return {
+            "upstreams": {name: bulkhead.stats() for name, bulkhead in self._upstreams.items()},
+            "classes": {name: bulkhead.stats() for name, bulkhead in self._classes.items()},
+        }
+
+
+bulkheads = Bulkheads()
@@ -0,0 +1,361 @@
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, List, Optional
+from fastapi import Request, Response, status
+from starlette.concurrency import run_in_threadpool
+from conf import settings
+from .auth import validate_access_token
+from .exceptions import AuthTokenMissing, AuthTokenExpired, AuthTokenCorrupted
+from .network import forwardable_raw_headers
+from .responses import RawResponse
+
+# Response headers kept with a cached body; everything else is per response.
+CACHED_HEADERS = {"content-type", "content-language", "last-modified", "etag"}
+CACHEABLE_METHODS = {"GET", "HEAD"}
+# Vary key standing for the subject of the Authorization token rather than the raw header.
+VARY_USER = "user"
+
+
+@dataclass
+class CachePolicy:
+    """Caching rule of a route, given as the "cache" option of a ROUTES rule."""
+    ttl: int
+    vary: List[str] = field(default_factory=list)
+    stale_while_revalidate: int = 0
+
+    @classmethod
+    def from_options(cls, options: Optional[dict]) -> Optional['CachePolicy']:
+        if not options:
+            return None
+        return cls(
+            ttl=int(options["ttl"]),
+            vary=[name.lower() for name in options.get("vary", [])],
+            stale_while_revalidate=int(options.get("stale_while_revalidate", 0)),
+        )
+
+
+@dataclass
+class CachedResponse:
+    status: int
+    headers: List[List[str]]
+    body: bytes
+    etag: str
+    stored_at: float
+    expires_at: float
+    stale_until: float
+
+
+class MemoryCacheStore:
+    """LRU store local to one worker."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._by_resource = {}  # Keys of the entries of each resource, see ResponseCache.resource.
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    async def set(self, key: str, entry: CachedResponse):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        self._by_resource.setdefault(ResponseCache.resource_of(key), set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._forget(self._entries.popitem(last=False)[0])
+
+    async def delete_resource(self, resource: str):
+        for key in self._by_resource.pop(resource, ()):
+            self._entries.pop(key, None)
+
+    def _forget(self, key: str):
+        keys = self._by_resource.get(ResponseCache.resource_of(key))
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_resource[ResponseCache.resource_of(key)]
+
+    def size(self) -> int:
+        return len(self._entries)
+
+    def close(self):
+        self._entries.clear()
+        self._by_resource.clear()
+
+
+class DiskCacheStore:
+    """
+    LRU store in a local SQLite file, shared by every uvicorn worker of the host.
+    Pointing RESPONSE_CACHE_PATH into /dev/shm keeps it in shared memory.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, status INTEGER, headers TEXT, body BLOB, etag TEXT,"
+                " stored_at REAL, expires_at REAL, stale_until REAL, accessed_at REAL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+            self._connection = connection
+        return self._connection
+
+    def _get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT status, headers, body, etag, stored_at, expires_at, stale_until"
+                " FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        status_code, headers, body, etag, stored_at, expires_at, stale_until = row
+        return CachedResponse(status_code, json.loads(headers), body, etag, stored_at, expires_at, stale_until)
+
+    def _set(self, key: str, entry: CachedResponse):
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, entry.status, json.dumps(entry.headers), entry.body, entry.etag,
+                 entry.stored_at, entry.expires_at, entry.stale_until, time.time()),
+            )
+            connection.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed_at DESC"
+                " LIMIT -1 OFFSET ?)", (self.max_entries,)
+            )
+
+    def _delete_resource(self, resource: str):
+        with self._lock:
+            # The keys of a resource share its prefix; ";" sorts right after the ":" ending it.
+            self._connect().execute("DELETE FROM responses WHERE key >= ? AND key < ?",
+                                    (resource + ":", resource + ";"))
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        return await run_in_threadpool(self._get, key)
+
+    async def set(self, key: str, entry: CachedResponse):
+        await run_in_threadpool(self._set, key, entry)
+
+    async def delete_resource(self, resource: str):
+        await run_in_threadpool(self._delete_resource, resource)
+
+    def size(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+# Fetches the upstream response as (status, raw headers, body).
+Fetch = Callable[[], Awaitable[tuple]]
+
+# Request headers that would let the upstream answer a cache fill with a 304 or an encoded body.
+FILL_EXCLUDED_HEADERS = {"if-none-match", "if-modified-since", "accept-encoding"}
+
+
+def fill_headers(headers: dict) -> dict:
+    """Returns the headers to fetch a cacheable response with."""
+    return {key: value for key, value in headers.items() if key.lower() not in FILL_EXCLUDED_HEADERS}
+
+
+def opaque_tag(etag: str) -> str:
+    """The tag without its weak indicator, as If-None-Match compares them (RFC 9110 8.8.3.2)."""
+    etag = etag.strip()
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+class ResponseCache:
+    """
+    Opt-in cache of idempotent upstream responses with per-route TTL and vary keys,
+    ETag revalidation and stale-while-revalidate. Only the 200 responses it stores are
+    served from it, trimmed to CACHED_HEADERS; every other response is passed on as
+    the upstream sent it. Unsafe requests to a cached route drop its entries.
+    """
+
+    def __init__(self, store, max_body: int):
+        self.store = store
+        self.max_body = max_body
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._refreshing = {}
+
+    @classmethod
+    def from_settings(cls) -> 'ResponseCache':
+        if settings.RESPONSE_CACHE_BACKEND == 'disk':
+            store = DiskCacheStore(settings.RESPONSE_CACHE_PATH, settings.RESPONSE_CACHE_MAX_ENTRIES)
+        else:
+            store = MemoryCacheStore(settings.RESPONSE_CACHE_MAX_ENTRIES)
+        return cls(store, settings.RESPONSE_CACHE_MAX_BODY)
+
+    @staticmethod
+    def resource(url: str) -> str:
+        """Hashes the url without its query: the entries of every query and vary value of it share it."""
+        return hashlib.sha256(url.partition('?')[0].encode()).hexdigest()[:32]
+
+    @staticmethod
+    def resource_of(key: str) -> str:
+        return key.partition(':')[0]
+
+    @classmethod
+    def key(cls, method: str, url: str, request: Request, policy: CachePolicy) -> Optional[str]:
+        """
+        The resource of url and a hash of the request and its vary values, as "resource:hash";
+        None when the request must not be cached.
+        """
+        parts = ["GET" if method.upper() == "HEAD" else method.upper(), url]
+        for name in policy.vary:
+            if name == VARY_USER:
+                try:
+                    payload = validate_access_token(request.headers.get('authorization'))
+                except (AuthTokenMissing, AuthTokenExpired, AuthTokenCorrupted):
+                    return None
+                parts.append(str(payload.get('user_id', payload.get('id'))))
+            else:
+                parts.append(request.headers.get(name, ''))
+        return cls.resource(url) + ':' + hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+
+    async def respond(self, request: Request, url: str, policy: CachePolicy, fetch: Fetch) -> Response:
+        """Serves the request from the cache when possible, otherwise from fetch()."""
+        key = None
+        if request.method in CACHEABLE_METHODS:
+            key = self.key(request.method, url, request, policy)
+        if key is None:
+            return self._passthrough(request, *await fetch())
+
+        entry = await self.store.get(key)
+        now = time.time()
+        if entry is not None and now < entry.expires_at:
+            self.hits += 1
+            return self._response(request, entry)
+
+        if entry is not None and now < entry.stale_until:
+            self.stale_hits += 1
+            self._refresh(key, policy, fetch)
+            return self._response(request, entry)
+
+        self.misses += 1
+        status_code, raw_headers, body = await fetch()
+        entry = await self._store(key, policy, status_code, raw_headers, body)
+        if entry is None:
+            return self._passthrough(request, status_code, raw_headers, body)
+        return self._response(request, entry)
+
+    async def invalidate(self, url: str):
+        """Drops the entries of url, whatever their query or vary values, after a write to it."""
+        resource = self.resource(url)
+        # A refresh started before the write would store what it replaced.
+        for key, task in list(self._refreshing.items()):
+            if self.resource_of(key) == resource:
+                task.cancel()
+        await self.store.delete_resource(resource)
+
+    async def _fetch(self, key: str, policy: CachePolicy, fetch: Fetch):
+        await self._store(key, policy, *await fetch())
+
+    async def _store(self, key: str, policy: CachePolicy, status_code: int, raw_headers,
+                     body: bytes) -> Optional[CachedResponse]:
+        """Stores a cacheable response and returns its entry; None when it is not cacheable."""
+        if not self._cacheable(status_code, raw_headers, body):
+            return None
+        entry = self._entry(status_code, raw_headers, body, policy)
+        await self.store.set(key, entry)
+        return entry
+
+    def _refresh(self, key: str, policy: CachePolicy, fetch: Fetch):
+        """Revalidates a stale entry in the background, once per key at a time."""
+        if key in self._refreshing:
+            return
+        task = asyncio.create_task(self._fetch(key, policy, fetch))
+        self._refreshing[key] = task
+        task.add_done_callback(lambda done: self._refreshed(key, done))
+
+    def _refreshed(self, key: str, task: asyncio.Task):
+        self._refreshing.pop(key, None)
+        # A failed refresh keeps serving the stale entry until it runs out.
+        if not task.cancelled():
+            task.exception()
+
+    def _cacheable(self, status_code: int, raw_headers, body: bytes) -> bool:
+        if status_code != status.HTTP_200_OK or len(body) > self.max_body:
+            return False
+        for name, value in raw_headers:
+            name = name.decode('latin-1').lower()
+            if name == 'set-cookie':
+                return False
+            if name == 'cache-control' and 'no-store' in value.decode('latin-1').lower():
+                return False
+        return True
+
+    @staticmethod
+    def _entry(status_code: int, raw_headers, body: bytes, policy: CachePolicy) -> CachedResponse:
+        headers = [[name.decode('latin-1'), value.decode('latin-1')] for name, value in raw_headers
+                   if name.decode('latin-1').lower() in CACHED_HEADERS]
+        etag = next((value for name, value in headers if name.lower() == 'etag'), None)
+        if etag is None:
+            # Weak: CompressionMiddleware may send the body re-encoded under the same tag.
+            etag = 'W/"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+            headers.append(['ETag', etag])
+        now = time.time()
+        return CachedResponse(status_code, headers, body, etag, now, now + policy.ttl,
+                              now + policy.ttl + policy.stale_while_revalidate)
+
+    @staticmethod
+    def _passthrough(request: Request, status_code: int, raw_headers, body: bytes) -> Response:
+        """A response that is not served from the cache, with all the upstream's headers."""
+        return RawResponse(status_code, forwardable_raw_headers(raw_headers), b'' if request.method == 'HEAD' else body)
+
+    @staticmethod
+    def _response(request: Request, entry: CachedResponse) -> Response:
+        age = str(max(0, int(time.time() - entry.stored_at)))
+        if_none_match = request.headers.get('if-none-match')
+        if if_none_match and (if_none_match.strip() == '*' or opaque_tag(entry.etag) in
+                              [opaque_tag(tag) for tag in if_none_match.split(',')]):
+            # Not modified: validators only, no body and no content headers.
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': entry.etag, 'Age': age})
+
+        headers = dict(entry.headers)
+        headers['Age'] = age
+        body = b'' if request.method == 'HEAD' else entry.body
+        return Response(content=body, status_code=entry.status, headers=headers)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "backend": type(self.store).__name__,
+            "size": self.store.size(),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+    def close(self):
+        self.store.close()
+
+
+# Shared by the request gateway and the controllers, closed by the app lifespan.
+response_cache = ResponseCache.from_settings()
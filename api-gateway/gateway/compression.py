@@ -0,0 +1,149 @@
+import zlib
+from typing import AsyncIterator, List, Optional, Tuple
+from conf import settings
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; without it only gzip is negotiated.
+    brotli = None
+
+GZIP = "gzip"
+BROTLI = "br"
+DEFLATE = "deflate"
+
+# Content types that are already compressed, or must reach the client chunk by chunk.
+INCOMPRESSIBLE_TYPES = (
+    "image/", "video/", "audio/", "font/woff", "application/zip", "application/gzip", "application/x-gzip",
+    "application/x-bzip2", "application/x-7z-compressed", "application/x-rar", "application/pdf",
+    "application/octet-stream", "text/event-stream",
+)
+
+
+def supported_encodings() -> List[str]:
+    """Encodings the gateway can produce, in order of preference."""
+    return [BROTLI, GZIP] if brotli is not None else [GZIP]
+
+
+def accepted_encodings(accept_encoding: Optional[str]) -> dict:
+    """Parses an Accept-Encoding header into {encoding: q}, leaving out refused ones."""
+    accepted = {}
+    for item in (accept_encoding or "").lower().split(","):
+        name, _, params = item.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if q > 0:
+            accepted[name.strip()] = q
+    return accepted
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """Picks the encoding to compress a response with for a client, or None."""
+    accepted = accepted_encodings(accept_encoding)
+    best, best_q = None, 0
+    for encoding in supported_encodings():
+        q = accepted.get(encoding, accepted.get("*", 0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compressible(content_type: Optional[str]) -> bool:
+    return not (content_type or "").lower().startswith(INCOMPRESSIBLE_TYPES)
+
+
+class Compressor:
+    """Compresses a body chunk by chunk, so streamed bodies are never held whole."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == BROTLI:
+            self._compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, chunk: bytes) -> bytes:
+        if self.encoding == BROTLI:
+            return self._compressor.process(chunk)
+        return self._compressor.compress(chunk)
+
+    def finish(self) -> bytes:
+        if self.encoding == BROTLI:
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+class Decompressor:
+    """Decodes an upstream body chunk by chunk."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == BROTLI:
+            self._decompressor = brotli.Decompressor()
+        else:
+            # 47 takes either a gzip or a zlib header; raw deflate bodies are rare enough to ignore.
+            self._decompressor = zlib.decompressobj(47)
+
+    def decompress(self, chunk: bytes) -> bytes:
+        if self.encoding == BROTLI:
+            return self._decompressor.process(chunk)
+        return self._decompressor.decompress(chunk)
+
+    def finish(self) -> bytes:
+        if self.encoding == BROTLI:
+            return b""
+        return self._decompressor.flush()
+
+
+def upstream_accept_encoding(client_accept_encoding: Optional[str]) -> str:
+    """
+    Accept-Encoding to send upstream: the encoding negotiated with the client first, so its
+    body can pass through untouched, then the others the gateway can decode. Clients that
+    take no encoding get identity bodies rather than ones the gateway has to decode.
+    """
+    preferred = negotiate(client_accept_encoding)
+    if preferred is None:
+        return "identity"
+    others = [encoding for encoding in supported_encodings() if encoding != preferred]
+    return ", ".join([preferred] + [f"{encoding};q=0.5" for encoding in others])
+
+
+async def decode(chunks: AsyncIterator[bytes], encoding: str) -> AsyncIterator[bytes]:
+    decompressor = Decompressor(encoding)
+    async for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    data = decompressor.finish()
+    if data:
+        yield data
+
+
+def for_client(chunks: AsyncIterator[bytes], raw_headers: list,
+               accept_encoding: Optional[str]) -> Tuple[AsyncIterator[bytes], list]:
+    """
+    Adapts an upstream body to a client. A body in an encoding the client accepts passes
+    through untouched; any other encoding is decoded on the fly, and the compression
+    middleware encodes it again in whatever the client negotiates.
+
+    Returns:
+        the body chunks and the raw headers to send
+    """
+    encoding = None
+    for name, value in raw_headers:
+        if name.lower() == b"content-encoding":
+            encoding = value.decode("latin-1").strip().lower()
+    if not encoding or encoding == "identity" or encoding in accepted_encodings(accept_encoding):
+        return chunks, raw_headers
+    if encoding not in (GZIP, DEFLATE) and not (encoding == BROTLI and brotli is not None):
+        return chunks, raw_headers
+
+    headers = [(name, value) for name, value in raw_headers
+               if name.lower() not in (b"content-encoding", b"content-length")]
+    return decode(chunks, encoding), headers
@@ -1,9 +1,10 @@
 import os
 from fastapi import APIRouter
-from . import healthcheck, authentication, users
+from . import healthcheck, authentication, users, batch
 router = APIRouter()
 
 #Define custom routes controller. 
 router.include_router(healthcheck.router)
 router.include_router(authentication.router)
-router.include_router(users.router)
\ No newline at end of file
+router.include_router(users.router)
+router.include_router(batch.router)
\ No newline at end of file
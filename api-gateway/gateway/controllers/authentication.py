@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Request, Response, status
-from fastapi.responses import JSONResponse
 from gateway.controllers.schemas.authentication import LoginSerializer
-from gateway.network import make_request
+from gateway.network import send_json, forwardable_raw_headers
+from gateway.responses import RawResponse
 from gateway.auth import extract_authorization_headers
 from conf import settings
 
@@ -21,12 +21,7 @@ async def login(data: LoginSerializer, request: Request, response: Response):
     headers = extract_authorization_headers(request.headers)
     
     # Make the request to the external authentication service
-    response_data, response_status = await make_request(
-        url=url,
-        method='post',
-        headers=headers,
-        data=data.dict()  
-    )
-    
-    # Return the response data from the external service
-    return JSONResponse(status_code=response_status, content=response_data)
+    status_code, raw_headers, body = await send_json(url, 'post', data.dict(), headers)
+
+    # Return the tokens as the service encoded them
+    return RawResponse(status_code, forwardable_raw_headers(raw_headers), body)
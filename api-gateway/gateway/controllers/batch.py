@@ -0,0 +1,137 @@
+import time
+import asyncio
+import aiohttp
+from typing import Optional
+from fastapi import APIRouter, Request, HTTPException, status
+from gateway.network import send_json, forwardable_headers, RetryPolicy
+from gateway.responses import loads
+from gateway.middleware.request_gateway import route_table
+from gateway.ratelimit import RateLimit, rate_limiter
+from gateway.bulkhead import bulkheads
+from gateway.auth import extract_authorization_headers, identify, request_identity
+from gateway.exceptions import UpstreamUnavailable, DeadlineExceeded, AuthTokenExpired, AuthTokenCorrupted
+from gateway.deadline import budget, start, request_deadline
+from .schemas.batch import BatchRequest, SubRequest
+from conf import settings
+
+router = APIRouter()
+
+# Response headers of a sub-request worth handing back to the caller.
+RESULT_HEADERS = ("content-type", "location", "retry-after", "etag")
+
+
+def result(sub: SubRequest, status_code: int, body=None, headers: Optional[dict] = None) -> dict:
+    return {"id": sub.id, "status": status_code, "headers": headers or {}, "body": body}
+
+
+def decode_body(content_type: str, body: bytes):
+    if not body:
+        return None
+    if "json" in content_type:
+        try:
+            return loads(body)
+        except ValueError:
+            pass
+    return body.decode("utf-8", errors="replace")
+
+
+async def run(sub: SubRequest, shared_headers: dict, client: str) -> dict:
+    """
+    Sends one sub-request through the same routing, rate limit, bulkheads and retry
+    policy as a request made on its own, and turns every outcome into a result.
+    """
+    path, _, query = sub.path.lstrip("/").partition("?")
+    method = sub.method.upper()
+    match = route_table.match(path, method)
+    if match is None:
+        return result(sub, status.HTTP_404_NOT_FOUND, {"detail": "Route not found"})
+    if match.route is None:
+        return result(sub, status.HTTP_405_METHOD_NOT_ALLOWED, {"detail": "Method not allowed"},
+                      {"allow": ", ".join(match.allowed_methods)})
+
+    limit = RateLimit.from_options(match.route.options.get("rate_limit"))
+    if limit is not None and settings.RATE_LIMIT_ENABLED:
+        allowed, limit_headers = rate_limiter.check(match.route.pattern, client, limit)
+        if not allowed:
+            return result(sub, status.HTTP_429_TOO_MANY_REQUESTS, {"detail": "Rate limit exceeded."},
+                          {"retry-after": limit_headers["Retry-After"]})
+
+    url = f"{match.url}?{query}" if query else match.url
+    # The caller's credentials win over any given per sub-request, and hop-by-hop headers
+    # (Host, Connection, Transfer-Encoding...) are not the sub-request's to set.
+    shared = {name.lower() for name in shared_headers}
+    headers = {name: value for name, value in forwardable_headers(sub.headers or {}).items()
+               if name.lower() not in shared and name.lower() != "content-length"}
+    headers.update(shared_headers)
+    policy = RetryPolicy.from_options(match.route.options)
+    # Within the deadline of the batch, the budget of the route still applies.
+    start(budget(match.route.options))
+
+    try:
+        held = await bulkheads.acquire(match.route)
+    except UpstreamUnavailable as exc:
+        return result(sub, status.HTTP_503_SERVICE_UNAVAILABLE, {"detail": str(exc)},
+                      {"retry-after": str(exc.retry_after)})
+
+    started = time.monotonic()
+    try:
+        status_code, raw_headers, content = await send_json(url, method.lower(), sub.body, headers, policy)
+    except DeadlineExceeded as exc:
+        return result(sub, status.HTTP_504_GATEWAY_TIMEOUT, {"detail": str(exc)})
+    except UpstreamUnavailable as exc:
+        return result(sub, status.HTTP_503_SERVICE_UNAVAILABLE, {"detail": str(exc)},
+                      {"retry-after": str(exc.retry_after)})
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        return result(sub, status.HTTP_502_BAD_GATEWAY, {"detail": "Service is unavailable."})
+    finally:
+        bulkheads.release(held, time.monotonic() - started)
+
+    response_headers = {}
+    for name, value in raw_headers:
+        name = name.decode("latin-1").lower()
+        if name in RESULT_HEADERS:
+            response_headers[name] = value.decode("latin-1")
+    return result(sub, status_code, decode_body(response_headers.get("content-type", ""), content), response_headers)
+
+
+# Runs up to BATCH_MAX_REQUESTS sub-requests concurrently and answers with all their results
+@router.post('/v2/api/batch/', status_code=status.HTTP_200_OK)
+async def batch(data: BatchRequest, request: Request):
+    """
+    Each result carries the status of its own sub-request, so one failing sub-request
+    never fails the batch. Sub-requests still running when the deadline passes are
+    cancelled and reported as 504.
+    """
+    deadline = min(data.timeout or settings.BATCH_TIMEOUT, settings.BATCH_TIMEOUT)
+    shared_headers = extract_authorization_headers(request.headers)
+    client = rate_limiter.client(request.headers, request.client.host if request.client else None)
+
+    try:
+        identity = identify(request.headers.get("authorization"))
+    except (AuthTokenExpired, AuthTokenCorrupted) as exc:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(exc),
+                            headers={"WWW-Authenticate": "Bearer"})
+
+    # Every sub-request task starts with a copy of this deadline and identity.
+    token = start(deadline)
+    try:
+        tasks = [asyncio.ensure_future(run(sub, shared_headers, client)) for sub in data.requests]
+    finally:
+        request_deadline.reset(token)
+        if identity is not None:
+            request_identity.reset(identity)
+    done, pending = await asyncio.wait(tasks, timeout=deadline)
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.wait(pending)
+
+    results = []
+    for sub, task in zip(data.requests, tasks):
+        if task in pending:
+            results.append(result(sub, status.HTTP_504_GATEWAY_TIMEOUT, {"detail": "Deadline exceeded."}))
+        elif task.exception() is not None:
+            results.append(result(sub, status.HTTP_500_INTERNAL_SERVER_ERROR, {"detail": "Sub-request failed."}))
+        else:
+            results.append(task.result())
+    return {"responses": results}
@@ -1,14 +1,105 @@
 from fastapi import APIRouter, Request, Response, Depends, status
-from fastapi.responses import JSONResponse
+from fastapi.responses import PlainTextResponse
+from gateway.responses import FastJSONResponse
+from gateway.network import upstream_pool, single_flight, circuit_breakers, retry_budget
+from gateway.balancer import load_balancer
+from gateway.auth import token_cache
+from gateway.cache import response_cache
+from gateway.ratelimit import rate_limiter
+from gateway.bulkhead import bulkheads
+from gateway.metrics import metrics
+from gateway.middleware.request_gateway import route_table
 
 router = APIRouter()
 
+
+@metrics.collector
+def upstream_samples():
+    """Connection pool usage and outstanding requests per upstream, for /metrics."""
+    for upstream, pool in upstream_pool.stats().items():
+        labels = {"upstream": upstream}
+        yield "gateway_upstream_pool_limit", labels, pool["limit"]
+        for state in ("in_flight", "waiters"):
+            yield "gateway_upstream_pool_calls", {**labels, "state": state}, pool[state]
+    for service, instances in load_balancer.stats().items():
+        for instance, endpoint in instances.items():
+            yield "gateway_upstream_outstanding", {"upstream": instance}, endpoint["outstanding"]
+
+
+@metrics.collector
+def cache_samples():
+    """Lookups of the token and response caches by result, for /metrics."""
+    tokens = token_cache.stats()
+    for result, count in (("hit", tokens["hits"]), ("miss", tokens["misses"])):
+        yield "gateway_cache_requests_total", {"cache": "tokens", "result": result}, count
+    responses = response_cache.stats()
+    for result, count in (("hit", responses["hits"]), ("stale_hit", responses["stale_hits"]),
+                          ("miss", responses["misses"])):
+        yield "gateway_cache_requests_total", {"cache": "responses", "result": result}, count
+
+
+@metrics.collector
+def route_samples():
+    """The routes version this worker serves, for /metrics; more than one checksum means a reload is spreading."""
+    yield "gateway_routes_info", {"checksum": route_table.checksum}, 1
+
+
 @router.get('/v2/api/health/', status_code=status.HTTP_200_OK)
 async def health_check():
     """
     Health check endpoint to ensure the service is running
     """
-    return JSONResponse(
+    return FastJSONResponse(
         content={"status": "healthy", "message": "Api Gateway Service is up and running."},
         status_code=status.HTTP_200_OK
-    )
\ No newline at end of file
+    )
+
+@router.get('/v2/api/health/upstreams/', status_code=status.HTTP_200_OK)
+async def upstream_pool_stats():
+    """
+    Connection pool usage per upstream service, used to size the pools
+    """
+    return FastJSONResponse(
+        content={
+            "instances": load_balancer.stats(),
+            "pools": upstream_pool.stats(),
+            "coalescing": single_flight.stats(),
+            "breakers": circuit_breakers.stats(),
+            "retries": retry_budget.stats(),
+        },
+        status_code=status.HTTP_200_OK
+    )
+
+@router.get('/v2/api/health/caches/', status_code=status.HTTP_200_OK)
+async def cache_stats():
+    """
+    Size and hit/miss counters of the gateway caches of this worker
+    """
+    return FastJSONResponse(
+        content={"tokens": token_cache.stats(), "responses": response_cache.stats()},
+        status_code=status.HTTP_200_OK
+    )
+
+@router.get('/v2/api/health/limits/', status_code=status.HTTP_200_OK)
+async def limit_stats():
+    """
+    Requests admitted and rejected by the admission control of this worker
+    """
+    return FastJSONResponse(
+        content={"rate_limits": rate_limiter.stats(), "bulkheads": bulkheads.stats()},
+        status_code=status.HTTP_200_OK
+    )
+
+@router.get('/v2/api/health/routes/', status_code=status.HTTP_200_OK)
+async def route_stats():
+    """
+    Version, checksum and reload counters of the route table of this worker
+    """
+    return FastJSONResponse(content=route_table.stats(), status_code=status.HTTP_200_OK)
+
+@router.get('/metrics', response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """
+    Prometheus metrics summed over every worker of this host
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
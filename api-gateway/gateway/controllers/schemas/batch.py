@@ -0,0 +1,17 @@
+from pydantic import BaseModel, Field
+from typing import Any, Dict, Optional, List
+from conf import settings
+
+
+class SubRequest(BaseModel):
+    id: str = Field(..., example="profile", description="Echoed back with the result of this sub-request")
+    method: str = Field("GET", example="GET")
+    path: str = Field(..., example="api/accounts/users/1/", description="Path of a gateway route, with its query string")
+    body: Optional[Any] = Field(None, description="JSON body, for POST, PUT and PATCH")
+    headers: Optional[Dict[str, str]] = Field(None, description="Extra headers; Authorization comes from the batch")
+
+
+class BatchRequest(BaseModel):
+    requests: List[SubRequest] = Field(..., min_length=1, max_length=settings.BATCH_MAX_REQUESTS)
+    timeout: Optional[float] = Field(None, gt=0, description="Deadline for the whole batch in seconds, "
+                                                            "capped at BATCH_TIMEOUT")
@@ -4,3 +4,7 @@ from typing import Optional, List
 class CommonQueryParams(BaseModel):
     page: Optional[int] = Field(1, ge=1, description="Page number for pagination, starting from 1")
     page_limit: Optional[int] = Field(10, le=100, description="Maximum number of results per page (up to 100)")
+
+class CursorQueryParams(BaseModel):
+    cursor: Optional[str] = Field(None, max_length=512, description="next_cursor or previous_cursor of the page before, omit for the first page")
+    page_limit: int = Field(20, ge=1, le=100, description="Maximum number of results per page (up to 100)")
@@ -1,35 +1,93 @@
-from fastapi import APIRouter, Request, Response, Depends, status, File, UploadFile, Form
-from fastapi.responses import JSONResponse
-from gateway.controllers.schemas.users import UserDocumentUploadForm
-from gateway.network import make_request
+from typing import Annotated
+from urllib.parse import urlencode
+from fastapi import APIRouter, Request, Response, Query, status, HTTPException
+from fastapi.responses import StreamingResponse
+from gateway.network import open_stream, iter_stream, fetch_raw, forwardable_raw_headers
+from gateway.responses import RawResponse
+from gateway.cache import CachePolicy, response_cache
+from gateway.middleware.request_gateway import route_table
+from gateway.uploads import prepare_upload
 from gateway.auth import extract_authorization_headers
+from gateway.exceptions import PayloadTooLarge, MalformedRequest
+from .schemas.common import CursorQueryParams
 from conf import settings
 
 router = APIRouter()
 SERVICE_URL = settings.USERS_SERVICE_URL
 
+# Users a page at a time, in a stable order; the page size is bounded before it reaches the service
+@router.get('/api/accounts/users/', status_code=status.HTTP_200_OK)
+async def list_users(params: Annotated[CursorQueryParams, Query()], request: Request):
+    """
+    Pass the next_cursor of a page as cursor to get the page after it, until it is null.
+    """
+    query = {"page_limit": params.page_limit}
+    if params.cursor:
+        query["cursor"] = params.cursor
+    url = f"{SERVICE_URL}/api/accounts/users/?{urlencode(query)}"
+    headers = extract_authorization_headers(request.headers)
+
+    status_code, raw_headers, body = await fetch_raw(url, 'get', headers)
+    return RawResponse(status_code, forwardable_raw_headers(raw_headers), body)
+
 # This function will handle fetching the user details based on ID
 @router.get('/api/accounts/users/{id}/', status_code=status.HTTP_200_OK)
 async def get_users(id: int, request: Request, response: Response):
     url = f"{SERVICE_URL}/api/accounts/users/{id}/"
     headers = extract_authorization_headers(request.headers)
-    response_data, response_status = await make_request(
-        url=url,
-        method='get',
-        headers=headers
-    )
-    return JSONResponse(status_code=response_status, content=response_data)
+    # Cached as the "cache" option of the route says; writes to it go through the gateway route.
+    match = route_table.match_scope(request.scope)
+    policy = CachePolicy.from_options(match.route.options.get("cache")) if match and match.route else None
+    if policy and settings.RESPONSE_CACHE_ENABLED:
+        return await response_cache.respond(request, url, policy, lambda: fetch_raw(url, 'get', headers))
+
+    # The user is passed on as the service encoded it.
+    status_code, raw_headers, body = await fetch_raw(url, 'get', headers)
+    return RawResponse(status_code, forwardable_raw_headers(raw_headers), body)
+
+# Multipart body of the upload route, documented here since it is streamed through unparsed.
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["document_type", "user", "document"],
+                    "properties": {
+                        "document_type": {"type": "string"},
+                        "user": {"type": "string"},
+                        "document": {"type": "string", "format": "binary"},
+                    },
+                }
+            }
+        },
+    }
+}
 
 # This function handles the file upload
-@router.post('/api/accounts/user-documents/', status_code=status.HTTP_201_CREATED)
-async def upload_file(request: Request, form_data: UserDocumentUploadForm = Depends(UserDocumentUploadForm.as_form)):
+@router.post('/api/accounts/user-documents/', status_code=status.HTTP_201_CREATED, openapi_extra=UPLOAD_REQUEST_BODY)
+async def upload_file(request: Request):
     headers = extract_authorization_headers(request.headers)
-    
+
+    # Re-stream the multipart body as is, the content type carries its boundary.
+    try:
+        body, content_length, spool = await prepare_upload(request)
+    except PayloadTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except MalformedRequest as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    headers['Content-Type'] = request.headers.get('content-type', 'multipart/form-data')
+    headers['Content-Length'] = str(content_length)
+
     # Make a request to the external service for file upload
-    response_data, response_status = await make_request(
-        url=f"{SERVICE_URL}{request.url.path}",
-        method='post',
-        headers=headers,
-        form_data=form_data
-    )
-    return response_data
+    try:
+        upstream = await open_stream(f"{SERVICE_URL}{request.url.path}", 'post', body, headers)
+    except BaseException:
+        # The body may never have been read, which is what deletes a spool.
+        if spool is not None:
+            await spool.close()
+        raise
+    response = StreamingResponse(iter_stream(upstream), status_code=upstream.status)
+    response.raw_headers.extend(forwardable_raw_headers(upstream.raw_headers))
+    return response
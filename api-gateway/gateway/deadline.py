@@ -0,0 +1,56 @@
+import time
+from contextvars import ContextVar
+from typing import Optional
+from conf import settings
+from .exceptions import DeadlineExceeded
+
+# Wall-clock time (time.time()) by which the current request must be answered, if any.
+request_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+def budget(options: Optional[dict]) -> float:
+    """Timeout budget of a route in seconds: its "timeout" option, GATEWAY_TIMEOUT otherwise."""
+    seconds = float((options or {}).get("timeout", settings.GATEWAY_TIMEOUT))
+    if seconds <= 0:
+        raise ValueError("timeout must be a positive number of seconds")
+    return seconds
+
+
+def start(seconds: float):
+    """
+    Gives the rest of the current request seconds to finish, or what is left of an
+    enclosing deadline if that is sooner. Undo with request_deadline.reset(token).
+    """
+    deadline = time.time() + seconds
+    current = request_deadline.get()
+    return request_deadline.set(deadline if current is None else min(current, deadline))
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the deadline of the current request, None without a deadline."""
+    deadline = request_deadline.get()
+    return None if deadline is None else deadline - time.time()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def check():
+    """Raises DeadlineExceeded once the current request is out of time."""
+    if expired():
+        raise DeadlineExceeded("Deadline exceeded.")
+
+
+def with_deadline(headers: Optional[dict]) -> Optional[dict]:
+    """
+    Returns a copy of headers carrying the deadline of the current request in
+    DEADLINE_HEADER, as seconds since the epoch. Any deadline the client sent is dropped.
+    """
+    deadline = request_deadline.get()
+    name = settings.DEADLINE_HEADER.lower()
+    headers = {key: value for key, value in (headers or {}).items() if key.lower() != name}
+    if deadline is not None:
+        headers[settings.DEADLINE_HEADER] = f"{deadline:.3f}"
+    return headers
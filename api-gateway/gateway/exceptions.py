@@ -8,3 +8,25 @@ class AuthTokenExpired(Exception):
 
 class AuthTokenCorrupted(Exception):
     pass
+
+
+class PayloadTooLarge(Exception):
+    pass
+
+
+class MalformedRequest(Exception):
+    pass
+
+
+class RouteConfigError(ValueError):
+    pass
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class UpstreamUnavailable(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import asyncio
+import aiohttp
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Tuple
+from conf import settings
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+# Upper bounds of the latency histogram buckets, in seconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRICS = {
+    "gateway_requests_total": (COUNTER, "Requests answered by the gateway, by route and status class."),
+    "gateway_request_duration_seconds": (HISTOGRAM, "Time to answer a request in full, by route and status class."),
+    "gateway_requests_in_flight": (GAUGE, "Requests being answered."),
+    "gateway_upstream_connect_seconds": (HISTOGRAM, "Time to open a new connection to an upstream."),
+    "gateway_upstream_ttfb_seconds": (HISTOGRAM, "Time from sending a request upstream to its response headers."),
+    "gateway_upstream_connections_reused_total": (COUNTER, "Upstream requests sent on a pooled connection."),
+    "gateway_upstream_errors_total": (COUNTER, "Upstream requests that failed without a response."),
+    "gateway_upstream_pool_calls": (GAUGE, "Upstream calls in flight and waiting for a pooled connection, by state."),
+    "gateway_upstream_pool_limit": (GAUGE, "Upstream pool size."),
+    "gateway_upstream_outstanding": (GAUGE, "Requests in flight to an upstream instance."),
+    "gateway_cache_requests_total": (COUNTER, "Cache lookups, by cache and result."),
+    "gateway_cache_hit_ratio": (GAUGE, "Share of cache lookups that hit, over every worker."),
+    "gateway_routes_info": (GAUGE, "Workers serving each version of the route table, by checksum."),
+    "gateway_routes_reloads_total": (COUNTER, "Reloads of the routes file, by result."),
+    "gateway_routes_reload_seconds": (HISTOGRAM, "Time to read, check, compile and swap in a routes file."),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+# A collector returns (name, labels, value) samples of gauges and counters kept elsewhere.
+Collector = Callable[[], Iterable[Tuple[str, dict, float]]]
+
+
+def status_class(status_code: int) -> str:
+    return f"{status_code // 100}xx"
+
+
+class Metrics:
+    """
+    Counters, gauges and histograms of one worker. Recording only updates plain dicts on
+    the event loop, so it takes no lock. Every METRICS_FLUSH_INTERVAL seconds each worker
+    writes a snapshot to its own file in METRICS_DIR, and a scrape sums the snapshots of
+    every worker: counters and histograms of workers that have exited are kept so totals
+    never go back, while their gauges are dropped.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.gauges: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], List[float]] = {}
+        self.collectors: List[Collector] = []
+
+    def inc(self, name: str, labels: Labels = (), value: float = 1):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def add(self, name: str, labels: Labels = (), value: float = 1):
+        """Moves a gauge up or down."""
+        key = (name, labels)
+        self.gauges[key] = self.gauges.get(key, 0) + value
+
+    def observe(self, name: str, labels: Labels, value: float):
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            # One count per bucket plus +Inf, then the sum.
+            histogram = self.histograms[key] = [0] * (len(LATENCY_BUCKETS) + 2)
+        histogram[bisect_left(LATENCY_BUCKETS, value)] += 1
+        histogram[-1] += value
+
+    def collector(self, collector: Collector) -> Collector:
+        """Registers a function sampled at each flush, for stats other modules already keep."""
+        self.collectors.append(collector)
+        return collector
+
+    def snapshot(self) -> dict:
+        gauges = [[name, list(labels), value] for (name, labels), value in self.gauges.items()]
+        counters = [[name, list(labels), value] for (name, labels), value in self.counters.items()]
+        for collect in self.collectors:
+            for name, labels, value in collect():
+                kind = METRICS[name][0]
+                (counters if kind == COUNTER else gauges).append([name, sorted(labels.items()), value])
+        return {
+            "pid": os.getpid(),
+            "counters": counters,
+            "gauges": gauges,
+            "histograms": [[name, list(labels), values] for (name, labels), values in self.histograms.items()],
+        }
+
+    def path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"worker-{pid}.json")
+
+    def flush(self):
+        """Publishes this worker's numbers for the other workers to serve."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(os.getpid())
+        with open(path + ".tmp", "w") as snapshot:
+            json.dump(self.snapshot(), snapshot)
+        os.replace(path + ".tmp", path)
+
+    async def run_flush(self):
+        """Flushes every METRICS_FLUSH_INTERVAL seconds until cancelled."""
+        while True:
+            await asyncio.sleep(settings.METRICS_FLUSH_INTERVAL)
+            self.flush()
+
+    def aggregate(self) -> dict:
+        """Sums the latest snapshot of every worker, this one included."""
+        self.flush()
+        counters, gauges, histograms = {}, {}, {}
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                with open(entry.path) as snapshot:
+                    worker = json.load(snapshot)
+            except (OSError, ValueError):
+                continue
+            for name, labels, value in worker["counters"]:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+            if _alive(worker["pid"]):
+                for name, labels, value in worker["gauges"]:
+                    key = (name, tuple(map(tuple, labels)))
+                    gauges[key] = gauges.get(key, 0) + value
+            for name, labels, values in worker["histograms"]:
+                key = (name, tuple(map(tuple, labels)))
+                total = histograms.setdefault(key, [0] * len(values))
+                for index, value in enumerate(values):
+                    total[index] += value
+        return {"counters": counters, "gauges": gauges, "histograms": histograms}
+
+    def render(self) -> str:
+        """Prometheus text exposition of the numbers of every worker."""
+        numbers = self.aggregate()
+        gauges = numbers["gauges"]
+        gauges.update(_hit_ratios(numbers["counters"]))
+
+        samples: Dict[str, List[str]] = {}
+        for (name, labels), value in sorted(numbers["counters"].items()):
+            samples.setdefault(name, []).append(f"{name}{_labels(labels)} {_number(value)}")
+        for (name, labels), value in sorted(gauges.items()):
+            samples.setdefault(name, []).append(f"{name}{_labels(labels)} {_number(value)}")
+        for (name, labels), values in sorted(numbers["histograms"].items()):
+            lines = samples.setdefault(name, [])
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), values):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', str(bound)),))} {_number(cumulative)}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(values[-1])}")
+            lines.append(f"{name}_count{_labels(labels)} {_number(cumulative)}")
+
+        output = []
+        for name, (kind, help_text) in METRICS.items():
+            if name in samples:
+                output.append(f"# HELP {name} {help_text}")
+                output.append(f"# TYPE {name} {kind}")
+                output.extend(samples[name])
+        return "\n".join(output) + "\n"
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _hit_ratios(counters: dict) -> dict:
+    lookups, hits = {}, {}
+    for (name, labels), value in counters.items():
+        if name == "gateway_cache_requests_total":
+            labels = dict(labels)
+            cache = (("cache", labels["cache"]),)
+            lookups[cache] = lookups.get(cache, 0) + value
+            if labels["result"] != "miss":
+                hits[cache] = hits.get(cache, 0) + value
+    return {("gateway_cache_hit_ratio", cache): hits.get(cache, 0) / total
+            for cache, total in lookups.items() if total}
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+metrics = Metrics(settings.METRICS_DIR)
+
+
+def upstream_trace_config(upstream: str) -> aiohttp.TraceConfig:
+    """
+    aiohttp tracing of the session of one upstream that splits each call into the time
+    to get a connection opened (connect) and the time from then to the response headers (TTFB).
+    """
+    clock = time.perf_counter
+    labels = (("upstream", upstream),)
+
+    async def on_request_start(session, context, params):
+        context.upstream = labels
+        context.sent = clock()
+
+    async def on_connection_create_start(session, context, params):
+        context.connecting = clock()
+
+    async def on_connection_create_end(session, context, params):
+        now = clock()
+        metrics.observe("gateway_upstream_connect_seconds", context.upstream, now - context.connecting)
+        context.sent = now
+
+    async def on_connection_reuseconn(session, context, params):
+        metrics.inc("gateway_upstream_connections_reused_total", context.upstream)
+        context.sent = clock()
+
+    async def on_request_end(session, context, params):
+        metrics.observe("gateway_upstream_ttfb_seconds", context.upstream, clock() - context.sent)
+
+    async def on_request_exception(session, context, params):
+        metrics.inc("gateway_upstream_errors_total", context.upstream)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    return trace_config
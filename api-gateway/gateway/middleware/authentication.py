@@ -0,0 +1,40 @@
+from fastapi import status
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
+from gateway.responses import FastJSONResponse
+from gateway.middleware.request_gateway import route_table
+from gateway.auth import identify, request_identity
+from gateway.exceptions import AuthTokenExpired, AuthTokenCorrupted
+
+
+class IdentityMiddleware:
+    """
+    Verifies the bearer token of each gateway request once, at the edge, and forwards
+    the caller's identity to the services signed with IDENTITY_SIGNING_KEY, so they do
+    not decode the token again. Bad tokens are answered 401 here.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        match = route_table.match_scope(scope)
+        if match is None or match.route is None:
+            return await self.app(scope, receive, send)
+
+        try:
+            token = identify(Headers(scope=scope).get("authorization"))
+        except (AuthTokenExpired, AuthTokenCorrupted) as exc:
+            response = FastJSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content={"detail": str(exc)},
+                                        headers={"WWW-Authenticate": "Bearer"})
+            return await response(scope, receive, send)
+        if token is None:
+            return await self.app(scope, receive, send)
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_identity.reset(token)
@@ -0,0 +1,38 @@
+import time
+from fastapi import status
+from gateway.responses import FastJSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+from gateway.middleware.request_gateway import route_table
+from gateway.bulkhead import bulkheads
+from gateway.exceptions import UpstreamUnavailable
+
+
+class BulkheadMiddleware:
+    """
+    Holds a slot of the route class and of the upstream service of each gateway request
+    until its response is sent, and answers 503 with Retry-After when either is full.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        match = route_table.match_scope(scope)
+        if match is None or match.route is None:
+            return await self.app(scope, receive, send)
+
+        try:
+            held = await bulkheads.acquire(match.route)
+        except UpstreamUnavailable as exc:
+            response = FastJSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"detail": str(exc)},
+                                        headers={"Retry-After": str(exc.retry_after)})
+            return await response(scope, receive, send)
+
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            bulkheads.release(held, time.monotonic() - started)
@@ -0,0 +1,80 @@
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from gateway.compression import Compressor, negotiate, compressible
+from conf import settings
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses with the encoding negotiated from the client's Accept-Encoding,
+    brotli or gzip, chunk by chunk so streamed bodies stay streamed. Responses that are
+    already encoded (such as upstream bodies passed through untouched), smaller than
+    COMPRESSION_MIN_SIZE, or of an already compressed content type are sent as they are.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not settings.COMPRESSION_ENABLED:
+            return await self.app(scope, receive, send)
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+        await _CompressedResponse(encoding, send)(self.app, scope, receive)
+
+
+class _CompressedResponse:
+    def __init__(self, encoding: str, send: Send):
+        self.encoding = encoding
+        self.send = send
+        self.start = None
+        self.compressor = None
+        self.passthrough = False
+
+    async def __call__(self, app: ASGIApp, scope: Scope, receive: Receive):
+        await app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message: Message):
+        if self.passthrough:
+            return await self.send(message)
+
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            length = headers.get("content-length")
+            if (headers.get("content-encoding") or message["status"] < 200 or message["status"] in (204, 304)
+                    or not compressible(headers.get("content-type"))
+                    or (length is not None and int(length) < settings.COMPRESSION_MIN_SIZE)):
+                self.passthrough = True
+                return await self.send(message)
+            # Hold the start until the first chunk shows whether the body is worth compressing.
+            self.start = message
+            return
+
+        if message["type"] != "http.response.body":
+            return await self.send(message)
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.compressor is None:
+            if not more_body and len(body) < settings.COMPRESSION_MIN_SIZE:
+                self.passthrough = True
+                await self.send(self.start)
+                return await self.send(message)
+
+            self.compressor = Compressor(self.encoding)
+            headers = MutableHeaders(scope=self.start)
+            del headers["content-length"]
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                # The encoded body is not byte for byte the one the strong tag names.
+                headers["ETag"] = "W/" + etag
+            await self.send(self.start)
+
+        data = self.compressor.compress(body)
+        if not more_body:
+            data += self.compressor.finish()
+        if data or not more_body:
+            await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
@@ -0,0 +1,27 @@
+from starlette.types import ASGIApp, Receive, Scope, Send
+from gateway.middleware.request_gateway import route_table
+from gateway.deadline import budget, start, request_deadline
+
+
+class DeadlineMiddleware:
+    """
+    Starts the timeout budget of the route of each gateway request. Upstream calls made
+    for the request are cut off when it runs out, and carry its deadline to the services.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        match = route_table.match_scope(scope)
+        if match is None or match.route is None:
+            return await self.app(scope, receive, send)
+
+        token = start(budget(match.route.options))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_deadline.reset(token)
@@ -0,0 +1,37 @@
+import time
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from gateway.middleware.request_gateway import route_table
+from gateway.metrics import metrics, status_class
+from conf import settings
+
+
+class MetricsMiddleware:
+    """Counts and times every request by route pattern and status class, streamed bodies included."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not settings.METRICS_ENABLED:
+            return await self.app(scope, receive, send)
+
+        # Label by pattern, never by raw path, to keep the number of series bounded.
+        match = route_table.match_scope(scope)
+        route = match.route.pattern if match is not None and match.route is not None else "other"
+        status_code = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        metrics.add("gateway_requests_in_flight")
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.add("gateway_requests_in_flight", value=-1)
+            labels = (("route", route), ("status", status_class(status_code)))
+            metrics.inc("gateway_requests_total", labels)
+            metrics.observe("gateway_request_duration_seconds", labels, time.perf_counter() - started)
@@ -0,0 +1,44 @@
+from fastapi import status
+from gateway.responses import FastJSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from gateway.middleware.request_gateway import route_table
+from gateway.ratelimit import RateLimit, rate_limiter
+from conf import settings
+
+
+class RateLimitMiddleware:
+    """
+    Admits requests to the routes of gateway.routes.ROUTES through the token bucket
+    of the client on that route, and answers 429 with Retry-After once it is empty.
+    Admitted responses carry the RateLimit-* headers of the bucket too.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not settings.RATE_LIMIT_ENABLED:
+            return await self.app(scope, receive, send)
+
+        match = route_table.match_scope(scope)
+        if match is None or match.route is None:
+            return await self.app(scope, receive, send)
+
+        limit = RateLimit.from_options(match.route.options.get("rate_limit"))
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        client = rate_limiter.client(Headers(scope=scope), (scope.get("client") or (None,))[0])
+        allowed, headers = rate_limiter.check(match.route.pattern, client, limit)
+        if not allowed:
+            response = FastJSONResponse(status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                                        content={"detail": "Rate limit exceeded."}, headers=headers)
+            return await response(scope, receive, send)
+
+        async def send_with_headers(message: Message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).update(headers)
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
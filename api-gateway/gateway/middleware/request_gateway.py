@@ -1,41 +1,92 @@
 import os
 import aiohttp
 from fastapi import APIRouter, Request, Response, status, HTTPException, status
-from fastapi.responses import JSONResponse 
-from gateway.network import make_request
+from fastapi.responses import StreamingResponse
+from gateway.network import (make_request, open_stream, iter_stream, fetch_raw, send_json, forwardable_headers,
+    forwardable_raw_headers, RetryPolicy)
+from gateway.responses import FastJSONResponse, RawResponse
+from gateway.cache import CachePolicy, response_cache, fill_headers
+from gateway.compression import for_client, upstream_accept_encoding
 from gateway.routes import ROUTES
+from gateway.route_config import LiveRouteTable
+from conf import settings
 router = APIRouter()
 
+# Compiled once per worker so each lookup only walks the path segments, and compiled
+# again only when ROUTES_FILE changes.
+route_table = LiveRouteTable.from_settings(ROUTES)
+
+UNSAFE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+
+async def proxy_stream(service_url: str, request: Request, policy: RetryPolicy = None):
+    """Streams the request to the service and its response back, without parsing either body."""
+    method = request.method.lower()
+    body = request.stream() if request.method in ["POST", "PUT", "PATCH"] else None
+    headers = forwardable_headers(request.headers)
+    if settings.UPSTREAM_COMPRESSION:
+        headers["accept-encoding"] = upstream_accept_encoding(request.headers.get("accept-encoding"))
+    upstream = await open_stream(service_url, method, body, headers, policy)
+
+    # Compressed bodies the client can take as they are skip both decoding and encoding.
+    chunks, raw_headers = for_client(iter_stream(upstream), forwardable_raw_headers(upstream.raw_headers),
+                                     request.headers.get("accept-encoding"))
+    response = StreamingResponse(chunks, status_code=upstream.status)
+    response.raw_headers.extend(raw_headers)
+    return response
+
 
 @router.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH"])
 async def gateway(path: str, request: Request):
-    # Iterate through the routes to find a match
-    service_url = None
-    for route, target_url in ROUTES.items():
-        if path == route:
-            service_url = target_url
-
-    if not service_url:
+    match = route_table.match_scope(request.scope)
+    if match is None:
         raise HTTPException(status_code=404, detail="Route not found")
+    if match.route is None:
+        raise HTTPException(
+            status_code=status.HTTP_405_METHOD_NOT_ALLOWED,
+            detail="Method not allowed",
+            headers={"Allow": ", ".join(match.allowed_methods)},
+        )
 
-    # Prepare body and headers
-    body = await request.json() if request.method in ["POST", "PUT", "PATCH"] else None
-    headers = dict(request.headers)
+    service_url = match.url
+    if request.url.query:
+        service_url = f"{service_url}?{request.url.query}"
 
-    # Check if there is form data in the request
-    form_data = None
-    if "multipart/form-data" in headers.get("content-type", ""):
-        form_data = await request.form()
+    retry_policy = RetryPolicy.from_options(match.route.options)
+    policy = CachePolicy.from_options(match.route.options.get("cache"))
+    try:
 
-    # Determine HTTP method as a string
-    method = request.method.lower()
+        # Serve idempotent reads of routes with a cache policy from the response cache.
+        if policy and settings.RESPONSE_CACHE_ENABLED and request.method == "GET":
+            headers = fill_headers(forwardable_headers(request.headers))
+            return await response_cache.respond(
+                request, service_url, policy, lambda: fetch_raw(service_url, "get", headers, retry_policy))
 
-    try:
+        # Pass bodies through untouched, whatever their content type.
+        if settings.GATEWAY_PASS_THROUGH:
+            return await proxy_stream(service_url, request, retry_policy)
+
+        # Prepare body and headers
+        body = await request.json() if request.method in ["POST", "PUT", "PATCH"] else None
+        headers = dict(request.headers)
+
+        # Check if there is form data in the request
+        form_data = None
+        if "multipart/form-data" in headers.get("content-type", ""):
+            form_data = await request.form()
+
+        # Determine HTTP method as a string
+        method = request.method.lower()
 
         # Make request to the selected microservice
-        response_data, status_code = await make_request(service_url, method, form_data,  body, headers)
-        # Return the response
-        return JSONResponse(status_code=status_code, content=response_data)
+        if form_data is not None:
+            response_data, status_code = await make_request(service_url, method, form_data,  body, headers, retry_policy)
+            return FastJSONResponse(status_code=status_code, content=response_data)
+
+        # Upstream JSON needs no rewriting, so it is returned as the bytes it came in as.
+        status_code, raw_headers, content = await send_json(
+            service_url, method, body, forwardable_headers(headers), retry_policy)
+        return RawResponse(status_code, forwardable_raw_headers(raw_headers), content)
 
     except aiohttp.client_exceptions.ClientConnectorError:
         # This error occurs when there is a network-related issue
@@ -44,7 +95,7 @@ async def gateway(path: str, request: Request):
             detail="Service is unavailable.",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
+
     except aiohttp.client_exceptions.ContentTypeError:
         # This error occurs when the service responds with an invalid content type
         raise HTTPException(
@@ -52,3 +103,8 @@ async def gateway(path: str, request: Request):
             detail="Service error. Invalid content type received.",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+    finally:
+        # Whatever the outcome, a write may have reached the service: drop what was cached of it.
+        if policy and request.method in UNSAFE_METHODS:
+            await response_cache.invalidate(match.url)
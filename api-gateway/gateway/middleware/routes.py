@@ -0,0 +1,24 @@
+from starlette.types import ASGIApp, Receive, Scope, Send
+from gateway.middleware.request_gateway import route_table
+
+
+class RouteTableMiddleware:
+    """
+    Pins each request to the route table version serving when it arrives, and matches
+    it there once, so every middleware and handler routes it alike even if the table is
+    reloaded meanwhile.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        token = route_table.pin()
+        route_table.match_scope(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route_table.unpin(token)
@@ -0,0 +1,38 @@
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from gateway.middleware.request_gateway import route_table
+from gateway.tracing import start_trace, current_span
+
+
+class TracingMiddleware:
+    """
+    Opens the server span of every request, continuing the client's trace when it sent
+    a traceparent, and makes it the parent of the upstream calls made for the request.
+    Answers carry the traceparent so clients can look the trace up.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        match = route_table.match_scope(scope)
+        route = match.route.pattern if match is not None and match.route is not None else scope["path"]
+        server = start_trace(f"{scope['method']} {route}", Headers(scope=scope).get("traceparent"))
+        server.attributes["http.target"] = scope["path"]
+
+        async def send_with_traceparent(message: Message):
+            if message["type"] == "http.response.start":
+                server.attributes["http.status_code"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"traceparent", server.traceparent.encode("latin-1"))]
+            await send(message)
+
+        token = current_span.set(server)
+        try:
+            await self.app(scope, receive, send_with_traceparent)
+        finally:
+            current_span.reset(token)
+            server.end()
@@ -1,17 +1,785 @@
+import time
+import random
+import asyncio
+import hashlib
 import aiohttp
-import async_timeout
-from typing import Optional
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional
+from urllib.parse import unquote, urlsplit, urlunsplit
 from fastapi import UploadFile
 from conf import settings
+from .exceptions import UpstreamUnavailable, DeadlineExceeded
+from .balancer import load_balancer, origin
+from .metrics import upstream_trace_config
+from .tracing import Span, current_span, span, inject
+from .deadline import request_deadline, remaining, expired, check as check_deadline, with_deadline
+from .auth import with_identity
+from .responses import dumps, loads
 from fastapi import UploadFile as FastAPIUploadFile
 from starlette.datastructures import UploadFile as StarletteUploadFile, FormData
 
+
+# Scheme of upstreams on a Unix socket of this host, see conf.upstream_url.
+UNIX_SCHEME = "http+unix"
+
+
+def unix_socket(url: str) -> Optional[str]:
+    """Returns the socket path of an http+unix:// url, None for upstreams reached over TCP."""
+    parts = urlsplit(url)
+    return unquote(parts.netloc) if parts.scheme == UNIX_SCHEME else None
+
+
+def request_url(url: str) -> str:
+    """
+    The url to hand aiohttp for an upstream url. Unix socket upstreams are sent to
+    localhost: their session's connector dials the socket whatever the host.
+    """
+    if not url.startswith(UNIX_SCHEME):
+        return url
+    parts = urlsplit(url)
+    return urlunsplit(("http", "localhost", parts.path, parts.query, ""))
+
+
+class ConnectionUsage:
+    """
+    Calls of one upstream waiting for a connection of its pool and waiting for their
+    response, counted through aiohttp's public trace hooks rather than read off the
+    connector. The hooks do not report connections going back to the pool, so idle
+    and in-use connections are not known.
+    """
+
+    def __init__(self):
+        self.in_flight = 0
+        self.waiters = 0
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        async def on_request_start(session, context, params):
+            self.in_flight += 1
+
+        async def on_request_done(session, context, params):
+            self.in_flight -= 1
+
+        async def on_connection_queued_start(session, context, params):
+            self.waiters += 1
+
+        async def on_connection_queued_end(session, context, params):
+            self.waiters -= 1
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_done)
+        trace_config.on_request_exception.append(on_request_done)
+        trace_config.on_connection_queued_start.append(on_connection_queued_start)
+        trace_config.on_connection_queued_end.append(on_connection_queued_end)
+        return trace_config
+
+
+class UpstreamPool:
+    """
+    Keeps one long-lived aiohttp ClientSession, and therefore one keep-alive
+    connection pool, per upstream service instead of one per proxied call.
+    Upstreams on a Unix socket get a connector of their own for that socket.
+    """
+
+    def __init__(self):
+        self._sessions = {}
+        self._raw_sessions = {}
+        self._usage = {}
+
+    # The pool key of an upstream url, the same one the load balancer and bulkheads key on.
+    origin = staticmethod(origin)
+
+    def session(self, url: str, raw: bool = False) -> aiohttp.ClientSession:
+        """
+        Returns the pooled session for the upstream serving url, creating it on first use.
+        The raw session shares the same connections but leaves bodies encoded and only
+        times out on idle reads, for streaming them through as they are.
+        """
+        origin = self.origin(url)
+        if raw:
+            return self._raw_session(origin)
+        session = self._sessions.get(origin)
+        if session is None or session.closed:
+            # A connector serves this one origin, so its limit is the whole per-origin limit.
+            socket_path = unix_socket(origin)
+            if socket_path is not None:
+                # Co-located upstream: no TCP stack and no DNS on the way.
+                connector = aiohttp.UnixConnector(
+                    path=socket_path,
+                    limit=settings.UPSTREAM_POOL_SIZE,
+                    keepalive_timeout=settings.UPSTREAM_KEEPALIVE_TIMEOUT,
+                )
+            else:
+                connector = aiohttp.TCPConnector(
+                    limit=settings.UPSTREAM_POOL_SIZE,
+                    keepalive_timeout=settings.UPSTREAM_KEEPALIVE_TIMEOUT,
+                    use_dns_cache=True,
+                    ttl_dns_cache=settings.UPSTREAM_DNS_CACHE_TTL,
+                )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=settings.GATEWAY_TIMEOUT),
+                json_serialize=lambda content: dumps(content).decode("utf-8"),
+                trace_configs=self._trace_configs(origin),
+            )
+            self._sessions[origin] = session
+        return session
+
+    def _raw_session(self, origin: str) -> aiohttp.ClientSession:
+        session = self._raw_sessions.get(origin)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                connector=self.session(origin).connector,
+                connector_owner=False,
+                auto_decompress=False,
+                timeout=aiohttp.ClientTimeout(
+                    total=None,
+                    sock_connect=settings.GATEWAY_TIMEOUT,
+                    sock_read=settings.GATEWAY_TIMEOUT,
+                ),
+                trace_configs=self._trace_configs(origin),
+            )
+            self._raw_sessions[origin] = session
+        return session
+
+    def _trace_configs(self, origin: str) -> list:
+        # Shared by the session and the raw session of the origin, like their connector.
+        usage = self._usage.setdefault(origin, ConnectionUsage())
+        trace_configs = [usage.trace_config()]
+        if settings.METRICS_ENABLED:
+            trace_configs.append(upstream_trace_config(origin))
+        return trace_configs
+
+    def open(self, *urls: str):
+        """Creates the pools for the given upstreams ahead of the first request."""
+        for url in urls:
+            if url:
+                self.session(url)
+
+    def stats(self) -> dict:
+        """Returns the pool limits, calls in flight and calls waiting for a connection of every upstream."""
+        stats = {}
+        for origin, session in self._sessions.items():
+            connector = session.connector
+            if connector is None or connector.closed:
+                continue
+            usage = self._usage[origin]
+            stats[origin] = {
+                "limit": connector.limit,
+                "in_flight": usage.in_flight,
+                "waiters": usage.waiters,
+            }
+        return stats
+
+    async def close(self):
+        """Closes every pooled session and its connections."""
+        for session in self._raw_sessions.values():
+            await session.close()
+        for session in self._sessions.values():
+            await session.close()
+        self._raw_sessions.clear()
+        self._sessions.clear()
+        self._usage.clear()
+
+
+# Shared by every controller and the request gateway, managed by the app lifespan.
+upstream_pool = UpstreamPool()
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent upstream calls: the first caller starts the call
+    and every identical caller that arrives while it is in flight shares its result.
+
+    The shared call runs without the deadline of the caller that started it, bounded by
+    GATEWAY_TIMEOUT alone, so an early deadline of one caller does not fail the others;
+    each caller stops waiting for it at its own deadline. Its span is a child of the
+    first caller's span, and the span of every other caller waiting for it links to it.
+    """
+
+    # Request headers that can change the upstream response, including the caller identity.
+    KEY_HEADERS = ("authorization", "cookie", "device-id", "accept", "accept-encoding", "accept-language")
+    IDEMPOTENT_METHODS = ("get", "head")
+
+    def __init__(self):
+        self._calls = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    @classmethod
+    def key(cls, method: str, url: str, headers: Optional[dict]) -> str:
+        headers = {name.lower(): value for name, value in (headers or {}).items()}
+        parts = [method.lower(), url] + [headers.get(name, '') for name in cls.KEY_HEADERS]
+        return hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+
+    async def do(self, method: str, url: str, headers: Optional[dict], call: Callable[[], Awaitable]):
+        """Runs call(), or joins the identical call already in flight. Only idempotent methods are shared."""
+        if not settings.UPSTREAM_COALESCE or method.lower() not in self.IDEMPOTENT_METHODS:
+            return await call()
+
+        key = self.key(method, url, headers)
+        flight = self._calls.get(key)
+        if flight is None:
+            self.calls += 1
+            parent = current_span.get()
+            shared = None if parent is None else Span("coalesced call", parent.trace_id, parent.span_id,
+                                                      parent.sampled)
+            # A task of its own keeps the call going for the others if its first caller goes away.
+            task = asyncio.ensure_future(self._shared(call, shared))
+            self._calls[key] = task, shared
+            task.add_done_callback(lambda done: self._done(key, done))
+            return await self._wait(task)
+
+        self.coalesced += 1
+        task, shared = flight
+        with span("coalesced wait") as waiting:
+            if waiting is not None and shared is not None:
+                waiting.links.append(shared)
+            return await self._wait(task)
+
+    @staticmethod
+    async def _shared(call: Callable[[], Awaitable], shared: Optional[Span]):
+        # The task runs in a copy of the first caller's context: changes stay in it.
+        request_deadline.set(None)
+        current_span.set(shared)
+        try:
+            return await call()
+        finally:
+            if shared is not None:
+                shared.end()
+
+    @staticmethod
+    async def _wait(task: asyncio.Task):
+        """Waits for the shared call until the deadline of the current request."""
+        left = remaining()
+        if left is None:
+            return await asyncio.shield(task)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), max(left, 0))
+        except asyncio.TimeoutError:
+            if not expired():
+                raise  # The shared call itself timed out.
+            raise DeadlineExceeded("Deadline exceeded.")
+
+    def _done(self, key: str, task: asyncio.Task):
+        if self._calls.get(key, (None,))[0] is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # Raised to every waiting caller, marked retrieved here.
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._calls), "calls": self.calls, "coalesced": self.coalesced}
+
+
+# Shared by make_request and fetch_raw.
+single_flight = SingleFlight()
+
+class CircuitBreaker:
+    """
+    Tracks the error and slow call rates of one upstream over a sliding window.
+
+    closed: calls go through. Opens once enough calls failed or were slow.
+    open: calls fail fast with UpstreamUnavailable for BREAKER_OPEN_SECONDS.
+    half_open: a few probe calls go through; it closes once they all succeed,
+    and opens again on the first failed or slow probe.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+    # Errors that count as a failed call, along with 5xx responses.
+    FAILURES = (aiohttp.ClientError, asyncio.TimeoutError)
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._outcomes = deque()  # (finished_at, failed, slow)
+        self._failed = 0
+        self._slow = 0
+        self._probes = 0
+        self._probe_successes = 0
+
+    def allow(self):
+        """Admits a call, or raises UpstreamUnavailable while the breaker is open."""
+        if self.state == self.OPEN:
+            remaining = self.opened_at + settings.BREAKER_OPEN_SECONDS - time.monotonic()
+            if remaining > 0:
+                raise UpstreamUnavailable("Service is unavailable.", retry_after=int(remaining) + 1)
+            self.state, self._probes, self._probe_successes = self.HALF_OPEN, 0, 0
+
+        if self.state == self.HALF_OPEN:
+            if self._probes >= settings.BREAKER_HALF_OPEN_PROBES:
+                raise UpstreamUnavailable("Service is unavailable.", retry_after=1)
+            self._probes += 1
+
+    def record(self, latency: float, failed: bool):
+        slow = latency >= settings.BREAKER_SLOW_CALL_SECONDS
+        if self.state == self.HALF_OPEN:
+            self._probes -= 1
+            if failed or slow:
+                self._open()
+            else:
+                self._probe_successes += 1
+                if self._probe_successes >= settings.BREAKER_HALF_OPEN_PROBES:
+                    self._close()
+            return
+        if self.state == self.OPEN:
+            return
+
+        now = time.monotonic()
+        self._outcomes.append((now, failed, slow))
+        self._failed += failed
+        self._slow += slow
+        self._expire(now)
+        total = len(self._outcomes)
+        if total >= settings.BREAKER_MIN_REQUESTS and (
+                self._failed / total >= settings.BREAKER_ERROR_RATE
+                or self._slow / total >= settings.BREAKER_SLOW_CALL_RATE):
+            self._open()
+
+    def abandon(self):
+        """Releases the slot of a call that was cancelled before it had an outcome."""
+        if self.state == self.HALF_OPEN and self._probes:
+            self._probes -= 1
+
+    def call(self) -> '_BreakerCall':
+        """Guards one upstream call: with breaker.call() as call: ...; call.status = response.status"""
+        return _BreakerCall(self)
+
+    def _expire(self, now: float):
+        horizon = now - settings.BREAKER_WINDOW
+        while self._outcomes and self._outcomes[0][0] < horizon:
+            _, failed, slow = self._outcomes.popleft()
+            self._failed -= failed
+            self._slow -= slow
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+
+    def _close(self):
+        self.state = self.CLOSED
+        self._outcomes.clear()
+        self._failed = self._slow = 0
+
+    def stats(self) -> dict:
+        self._expire(time.monotonic())
+        total = len(self._outcomes)
+        return {
+            "state": self.state,
+            "times_opened": self.times_opened,
+            "window_calls": total,
+            "error_rate": round(self._failed / total, 4) if total else 0.0,
+            "slow_call_rate": round(self._slow / total, 4) if total else 0.0,
+        }
+
+
+class _BreakerCall:
+    def __init__(self, breaker: CircuitBreaker):
+        self.breaker = breaker
+        self.status = None
+
+    def __enter__(self):
+        if settings.BREAKER_ENABLED:
+            self.breaker.allow()
+        self._started = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if not settings.BREAKER_ENABLED:
+            return False
+        latency = time.monotonic() - self._started
+        if exc_type is None or self.status is not None:
+            # The upstream answered; only its status tells whether the call failed.
+            self.breaker.record(latency, failed=self.status is not None and self.status >= 500)
+        elif issubclass(exc_type, CircuitBreaker.FAILURES):
+            self.breaker.record(latency, failed=True)
+        else:
+            self.breaker.abandon()
+        return False
+
+
+class CircuitBreakers:
+    """One CircuitBreaker per upstream origin."""
+
+    def __init__(self):
+        self._breakers = {}
+
+    def get(self, url: str) -> CircuitBreaker:
+        origin = UpstreamPool.origin(url)
+        breaker = self._breakers.get(origin)
+        if breaker is None:
+            breaker = self._breakers[origin] = CircuitBreaker(origin)
+        return breaker
+
+    def available(self, url: str) -> bool:
+        """Whether calls to url would currently get through the breaker."""
+        breaker = self._breakers.get(UpstreamPool.origin(url))
+        return breaker is None or breaker.state != CircuitBreaker.OPEN or \
+            time.monotonic() >= breaker.opened_at + settings.BREAKER_OPEN_SECONDS
+
+    def stats(self) -> dict:
+        return {origin: breaker.stats() for origin, breaker in self._breakers.items()}
+
+
+circuit_breakers = CircuitBreakers()
+
+
+@contextmanager
+def upstream_call(url: str, exclude: set = None):
+    """
+    Picks the instance to send a call for url to and guards it with that instance's breaker.
+    Instances in exclude are avoided when possible, and the chosen one is added to it.
+    Yields (instance_url, call); set call.status once the instance has answered.
+    Raises DeadlineExceeded instead of calling, or of a timeout, once the request is out of time.
+    """
+    check_deadline()
+    exclude = set() if exclude is None else exclude
+    available = lambda instance_url: instance_url not in exclude and circuit_breakers.available(instance_url)
+    try:
+        with load_balancer.acquire(url, available=available) as instance_url:
+            exclude.add(UpstreamPool.origin(instance_url))
+            with circuit_breakers.get(instance_url).call() as call:
+                yield instance_url, call
+    except asyncio.TimeoutError:
+        check_deadline()
+        raise
+
+
+def call_timeout(raw: bool = False) -> aiohttp.ClientTimeout:
+    """
+    The timeout of an upstream call: what is left of the request deadline, GATEWAY_TIMEOUT
+    without one. Raw sessions stream bodies without a total timeout, so only connecting
+    and each read are cut.
+    """
+    left = remaining()
+    # aiohttp takes a timeout of 0 for none at all.
+    limit = settings.GATEWAY_TIMEOUT if left is None else max(left, 0.001)
+    if raw:
+        return aiohttp.ClientTimeout(total=None, sock_connect=limit, sock_read=limit)
+    return aiohttp.ClientTimeout(total=limit)
+
+
+def outgoing_headers(headers: Optional[dict], upstream) -> dict:
+    """The headers of an upstream call: the caller's, with the request deadline, identity and trace context."""
+    return inject(with_identity(with_deadline(headers)), upstream)
+
+
+@contextmanager
+def client_span(method: str, url: str):
+    """
+    Times one upstream call as a client span of the current trace. Yields the span,
+    or None outside of a trace; send its traceparent with inject(headers, span).
+    """
+    with span(f"{method.upper()} {urlsplit(url).path}", kind="client") as upstream:
+        if upstream is not None:
+            upstream.attributes["http.url"] = url
+        yield upstream
+
+
+class RetryBudget:
+    """
+    Caps retries and hedges across all upstreams to a share of the original calls,
+    so retrying cannot multiply the load on an upstream that is already struggling.
+    """
+
+    MAX_TOKENS = 100
+
+    def __init__(self):
+        self.tokens = float(self.MAX_TOKENS)
+        self.updated = time.monotonic()
+        self.retries = 0
+        self.hedges = 0
+        self.rejected = 0
+
+    def deposit(self):
+        """Earns RETRY_BUDGET_RATIO of a retry for every original call."""
+        now = time.monotonic()
+        earned = settings.RETRY_BUDGET_RATIO + (now - self.updated) * settings.RETRY_BUDGET_MIN_PER_SECOND
+        self.tokens = min(self.MAX_TOKENS, self.tokens + earned)
+        self.updated = now
+
+    def withdraw(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        self.rejected += 1
+        return False
+
+    def stats(self) -> dict:
+        return {"tokens": round(self.tokens, 2), "retries": self.retries, "hedges": self.hedges,
+                "rejected": self.rejected}
+
+
+class LatencyTracker:
+    """Recent call latencies of one service, to tell when an attempt is late enough to hedge."""
+
+    SAMPLES = 500
+    MIN_SAMPLES = 20
+    REFRESH_EVERY = 50
+
+    def __init__(self):
+        self._samples = deque(maxlen=self.SAMPLES)
+        self._recorded = 0
+        self._percentiles = {}
+
+    def record(self, latency: float):
+        self._samples.append(latency)
+        self._recorded += 1
+        if self._recorded % self.REFRESH_EVERY == 0:
+            self._percentiles.clear()
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        if len(self._samples) < self.MIN_SAMPLES:
+            return None
+        value = self._percentiles.get(percentile)
+        if value is None:
+            ordered = sorted(self._samples)
+            value = ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+            self._percentiles[percentile] = value
+        return value
+
+
+@dataclass
+class RetryPolicy:
+    """
+    Retry and hedging rule of a route, from the "retries" and "hedge" options of a
+    ROUTES rule: {"retries": 2, "hedge": {"percentile": 95}} or {"hedge": true}.
+    """
+    retries: int
+    hedge_percentile: Optional[float] = None
+
+    @classmethod
+    def from_options(cls, options: Optional[dict]) -> 'RetryPolicy':
+        options = options or {}
+        hedge = options.get("hedge")
+        if hedge is True:
+            hedge = {}
+        percentile = hedge.get("percentile", settings.HEDGE_PERCENTILE) if isinstance(hedge, dict) else None
+        return cls(retries=int(options.get("retries", settings.UPSTREAM_RETRIES)), hedge_percentile=percentile)
+
+
+RETRYABLE_STATUSES = {502, 503, 504}
+RETRYABLE_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, UpstreamUnavailable)
+IDEMPOTENT_METHODS = {"get", "head", "options", "put", "delete"}
+
+retry_budget = RetryBudget()
+latency_trackers = {}
+
+
+async def call_with_retries(
+    method: str,
+    url: str,
+    attempt: Callable[[set], Awaitable[Any]],
+    status_of: Callable[[Any], int],
+    discard: Callable[[Any], None] = lambda result: None,
+    policy: RetryPolicy = None,
+):
+    """
+    Runs attempt(exclude) and, for idempotent methods, retries it on another instance after
+    a connection error, timeout, 502, 503 or 504, with jittered exponential backoff. With a
+    hedge percentile, a second attempt starts once the first is slower than that percentile
+    of recent latencies, and the first good answer wins. Retries and hedges draw on the
+    shared retry budget.
+
+    Args:
+        attempt: makes one call, avoiding the instances in the set it is given
+        status_of: returns the HTTP status of a result
+        discard: releases a result that is not returned
+    """
+    policy = policy or RetryPolicy.from_options(None)
+    idempotent = method.lower() in IDEMPOTENT_METHODS
+    if not idempotent:
+        return await attempt(set())
+
+    retry_budget.deposit()
+    tracker = latency_trackers.setdefault(UpstreamPool.origin(url), LatencyTracker())
+    exclude = set()
+    retries = 0
+    while True:
+        started = time.monotonic()
+        try:
+            if policy.hedge_percentile is not None:
+                result = await _hedged(attempt, exclude, tracker.percentile(policy.hedge_percentile),
+                                       status_of, discard)
+            else:
+                result = await attempt(exclude)
+        except RETRYABLE_ERRORS:
+            if retries >= policy.retries or expired() or not retry_budget.withdraw():
+                raise
+        else:
+            tracker.record(time.monotonic() - started)
+            if status_of(result) not in RETRYABLE_STATUSES or retries >= policy.retries \
+                    or expired() or not retry_budget.withdraw():
+                return result
+            discard(result)
+
+        retries += 1
+        retry_budget.retries += 1
+        backoff = min(settings.UPSTREAM_RETRY_BACKOFF_MAX, settings.UPSTREAM_RETRY_BACKOFF * 2 ** (retries - 1))
+        left = remaining()
+        await asyncio.sleep(random.uniform(0, backoff if left is None else max(min(backoff, left), 0)))
+
+
+async def _hedged(attempt, exclude: set, delay: Optional[float], status_of, discard):
+    first = asyncio.ensure_future(attempt(exclude))
+    if delay is None:
+        return await first
+
+    pending = {first}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=max(delay, settings.HEDGE_MIN_DELAY))
+        if done or not retry_budget.withdraw():
+            return await first
+        retry_budget.hedges += 1
+        pending.add(asyncio.ensure_future(attempt(exclude)))
+
+        finished = []
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            finished.extend(done)
+            winner = next((task for task in done if task.exception() is None
+                           and status_of(task.result()) not in RETRYABLE_STATUSES), None)
+            if winner is not None:
+                break
+        else:
+            # Neither attempt answered well: hand the first failure to the retry loop.
+            winner = finished[0]
+        for task in finished:
+            if task is not winner and task.exception() is None:
+                discard(task.result())
+        return winner.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def probe(url: str) -> bool:
+    """Active health check of one instance: healthy when it answers below 500 in time."""
+    session = upstream_pool.session(url)
+    try:
+        async with session.get(request_url(url + settings.UPSTREAM_HEALTH_CHECK_PATH), allow_redirects=False,
+                               timeout=aiohttp.ClientTimeout(total=settings.UPSTREAM_HEALTH_CHECK_TIMEOUT)) as response:
+            return response.status < 500
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        return False
+
+# Connection-level headers that must not be forwarded between hops.
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "transfer-encoding", "upgrade", "host",
+}
+
+
+def forwardable_headers(headers) -> dict:
+    """Drops the hop-by-hop headers so the rest can be passed to the next hop."""
+    return {key: value for key, value in headers.items() if key.lower() not in HOP_BY_HOP_HEADERS}
+
+
+def forwardable_raw_headers(raw_headers) -> list:
+    """
+    Same as forwardable_headers for raw (bytes) header pairs, keeping repeated headers.
+    Names are lowercased, as ASGI expects of response headers.
+    """
+    return [(key.lower(), value) for key, value in raw_headers
+            if key.decode("latin-1").lower() not in HOP_BY_HOP_HEADERS]
+
+
+async def open_stream(url: str, method: str, body=None, headers: dict = None,
+                      policy: RetryPolicy = None) -> aiohttp.ClientResponse:
+    """
+    Sends the request without parsing either body.
+
+    Args:
+        url: is the url for one of the in-network services
+        method: is the lower version of one of the HTTP methods
+        body: is the request body, bytes or an async iterable of chunks (optional)
+        headers: is the headers to forward, already stripped of hop-by-hop headers
+        policy: is the retry and hedging rule of the route (optional)
+
+    Returns:
+        the upstream response with its body unread; consume it with iter_stream
+    """
+    async def attempt(exclude):
+        with upstream_call(url, exclude) as (instance_url, call), client_span(method, instance_url) as upstream:
+            session = upstream_pool.session(instance_url, raw=True)
+            # Only ask upstream for an encoding the caller asked for.
+            response = await session.request(method, request_url(instance_url), data=body,
+                                             headers=outgoing_headers(headers, upstream),
+                                             skip_auto_headers=("Accept-Encoding",), timeout=call_timeout(raw=True))
+            call.status = response.status
+            if upstream is not None:
+                upstream.attributes["http.status_code"] = response.status
+        return response
+
+    # A streamed body can only be sent once.
+    if body is not None and not isinstance(body, bytes):
+        return await attempt(set())
+    return await call_with_retries(method, url, attempt, status_of=lambda response: response.status,
+                                   discard=lambda response: response.close(), policy=policy)
+
+
+async def iter_stream(response: aiohttp.ClientResponse, chunk_size: int = None):
+    """Yields the upstream body chunk by chunk and hands the connection back to the pool."""
+    try:
+        async for chunk in response.content.iter_chunked(chunk_size or settings.GATEWAY_STREAM_CHUNK_SIZE):
+            yield chunk
+    except BaseException:
+        # The body was not read to the end, so the connection cannot be reused.
+        response.close()
+        raise
+    response.release()
+
+
+async def fetch_raw(url: str, method: str, headers: dict = None, policy: RetryPolicy = None):
+    """
+    Reads a whole upstream response without decoding or parsing it.
+
+    Returns:
+        (status, raw_headers, body) of the upstream response
+    """
+    async def fetch():
+        response = await open_stream(url, method, headers=headers, policy=policy)
+        try:
+            body = await response.read()
+        finally:
+            response.release()
+        return response.status, response.raw_headers, body
+
+    return await single_flight.do(method, url, headers, fetch)
+
+
+async def send_json(url: str, method: str, data: Any = None, headers: dict = None, policy: RetryPolicy = None):
+    """
+    Sends data as the JSON body, when there is any, and reads the whole upstream response
+    without decoding or parsing it, for callers that pass upstream JSON on as it is.
+
+    Returns:
+        (status, raw_headers, body) of the upstream response
+    """
+    if data is None:
+        return await fetch_raw(url, method, headers, policy)
+
+    headers = {key: value for key, value in (headers or {}).items()
+               if key.lower() not in ("content-type", "content-length")}
+    headers["Content-Type"] = "application/json"
+    response = await open_stream(url, method, dumps(data), headers, policy)
+    try:
+        body = await response.read()
+    finally:
+        response.release()
+    return response.status, response.raw_headers, body
+
+
 async def make_request(
     url: str,
     method: str,
-    form_data: Optional[aiohttp.FormData] = None, 
+    form_data: Optional[aiohttp.FormData] = None,
     data: dict = None,
     headers: dict = None,
+    policy: RetryPolicy = None,
 ):
     """
     Args:
@@ -20,6 +788,7 @@ async def make_request(
         data: is the payload (optional)
         headers: is the header to put additional headers into request
         file: is the file to upload (optional)
+        policy: is the retry and hedging rule of the route (optional)
 
     Returns:
         service result coming / non-blocking http request (coroutine)
@@ -27,31 +796,47 @@ async def make_request(
     if not data:
         data = {}
 
-    with async_timeout.timeout(settings.GATEWAY_TIMEOUT):
-        async with aiohttp.ClientSession() as session:
-            request = getattr(session, method)
-            file_fields = {}
-
-            # Ensure form_data is aiohttp.FormData if it is a dictionary
-            if form_data:
-                _form_data = aiohttp.FormData(quote_fields=False)  # Ensure correct format
-
-                for key, value in form_data.items():  # Use multi_items() to extract files correctly
-                    if isinstance(value, (StarletteUploadFile, FastAPIUploadFile)):
-                        file_content = await value.read()  # Read file as bytes
-
-                        _form_data.add_field(
-                            name=key,
-                            value=file_content,  # Send file as actual bytes
-                            filename=value.filename,
-                            content_type=value.content_type or "application/octet-stream"
-                        )
-                    else:
-                        _form_data.add_field(name=key, value=str(value))  # Convert non-file values to strings
-                async with request(url, data=_form_data, headers=headers) as response:
-                    response_data = await response.json()
-                    return response_data, response.status
-            else:  # Default to JSON payload if no file
-                async with request(url, json=data, headers=headers) as response:
-                    response_data = await response.json()
+    # Ensure form_data is aiohttp.FormData if it is a dictionary
+    if form_data:
+        _form_data = aiohttp.FormData(quote_fields=False)  # Ensure correct format
+
+        for key, value in form_data.items():  # Use multi_items() to extract files correctly
+            if isinstance(value, (StarletteUploadFile, FastAPIUploadFile)):
+                file_content = await value.read()  # Read file as bytes
+
+                _form_data.add_field(
+                    name=key,
+                    value=file_content,  # Send file as actual bytes
+                    filename=value.filename,
+                    content_type=value.content_type or "application/octet-stream"
+                )
+            else:
+                _form_data.add_field(name=key, value=str(value))  # Convert non-file values to strings
+        with upstream_call(url) as (instance_url, call), client_span(method, instance_url) as upstream:
+            request = getattr(upstream_pool.session(instance_url), method)
+            async with request(request_url(instance_url), data=_form_data, headers=outgoing_headers(headers, upstream),
+                               timeout=call_timeout()) as response:
+                call.status = response.status
+                with span("deserialize"):
+                    response_data = await response.json(loads=loads)
+                if upstream is not None:
+                    upstream.attributes["http.status_code"] = response.status
+                return response_data, response.status
+    else:  # Default to JSON payload if no file
+        async def attempt(exclude):
+            with upstream_call(url, exclude) as (instance_url, call), client_span(method, instance_url) as upstream:
+                request = getattr(upstream_pool.session(instance_url), method)
+                async with request(request_url(instance_url), json=data, headers=outgoing_headers(headers, upstream),
+                                   timeout=call_timeout()) as response:
+                    call.status = response.status
+                    with span("deserialize"):
+                        response_data = await response.json(loads=loads)
+                    if upstream is not None:
+                        upstream.attributes["http.status_code"] = response.status
                     return response_data, response.status
+
+        async def send():
+            return await call_with_retries(method, url, attempt, status_of=lambda result: result[1], policy=policy)
+
+        # Identical reads in flight at the same time share one upstream call.
+        return await single_flight.do(method, url, headers, send)
@@ -0,0 +1,180 @@
+import math
+import mmap
+import time
+import fcntl
+import struct
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+from conf import settings
+from .auth import validate_access_token
+from .exceptions import AuthTokenMissing, AuthTokenExpired, AuthTokenCorrupted
+
+# Bucket keys are per client unless a rule sets "per": "route" for one bucket shared by everyone.
+PER_CLIENT = "client"
+PER_ROUTE = "route"
+
+
+@dataclass
+class RateLimit:
+    """
+    Token bucket of a route, given as the "rate_limit" option of a ROUTES rule:
+    {"rate": requests per second, "burst": bucket size, "per": "client" or "route"}.
+    """
+    rate: float
+    burst: int
+    per: str = PER_CLIENT
+
+    @classmethod
+    def from_options(cls, options) -> Optional['RateLimit']:
+        """Falls back to RATE_LIMIT_RATE and RATE_LIMIT_BURST; False or a rate of 0 disables it."""
+        if options is False:
+            return None
+        options = options or {}
+        rate = float(options.get("rate", settings.RATE_LIMIT_RATE))
+        if rate <= 0:
+            return None
+        return cls(rate=rate, burst=int(options.get("burst", settings.RATE_LIMIT_BURST)),
+                   per=options.get("per", PER_CLIENT))
+
+    @property
+    def window(self) -> int:
+        """Seconds an empty bucket takes to fill up again."""
+        return max(1, math.ceil(self.burst / self.rate))
+
+
+def refill(tokens: float, updated: float, limit: RateLimit, now: float) -> float:
+    return min(float(limit.burst), tokens + max(0.0, now - updated) * limit.rate)
+
+
+class MemoryBucketStore:
+    """Buckets local to one worker; each worker then admits the full rate."""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated)
+
+    def take(self, key: str, limit: RateLimit, now: float) -> float:
+        """Takes a token if there is one and returns the tokens left before taking, refilled to now."""
+        tokens, updated = self._buckets.pop(key, (float(limit.burst), now))
+        tokens = refill(tokens, updated, limit, now)
+        self._buckets[key] = (tokens - 1 if tokens >= 1 else tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return tokens
+
+    def close(self):
+        self._buckets.clear()
+
+
+class SharedBucketStore:
+    """
+    Buckets in a fixed table of slots in a memory-mapped file, shared by every uvicorn
+    worker of the host. A key hashes straight to its slot, which is locked with a byte
+    range lock for the read-modify-write, so a check costs the same however many
+    clients there are. Keys that collide on a slot share its bucket until one of them
+    goes idle; size RATE_LIMIT_SLOTS well above the number of active clients.
+    """
+
+    SLOT = struct.Struct("<Qdd")  # key hash, tokens, updated
+
+    def __init__(self, path: str, slots: int):
+        self.path = path
+        self.slots = slots
+        self._file = None
+        self._map = None
+
+    def _open(self):
+        if self._map is None:
+            self._file = open(self.path, "a+b")
+            size = self.slots * self.SLOT.size
+            # Every worker may race to size the file; growing it to the same size is harmless.
+            if self._file.seek(0, 2) < size:
+                self._file.truncate(size)
+            self._map = mmap.mmap(self._file.fileno(), size)
+        return self._map
+
+    def take(self, key: str, limit: RateLimit, now: float) -> float:
+        """Takes a token if there is one and returns the tokens left before taking, refilled to now."""
+        buckets = self._open()
+        digest = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+        offset = (digest % self.slots) * self.SLOT.size
+        fcntl.lockf(self._file, fcntl.LOCK_EX, self.SLOT.size, offset)
+        try:
+            owner, tokens, updated = self.SLOT.unpack_from(buckets, offset)
+            tokens = refill(tokens, updated, limit, now) if owner == digest else float(limit.burst)
+            self.SLOT.pack_into(buckets, offset, digest, tokens - 1 if tokens >= 1 else tokens, now)
+        finally:
+            fcntl.lockf(self._file, fcntl.LOCK_UN, self.SLOT.size, offset)
+        return tokens
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = self._file = None
+
+
+class RateLimiter:
+    """Token-bucket admission control per client and per route, in front of the upstreams."""
+
+    def __init__(self, store):
+        self.store = store
+        self.allowed = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_settings(cls) -> 'RateLimiter':
+        if settings.RATE_LIMIT_BACKEND == 'shared':
+            store = SharedBucketStore(settings.RATE_LIMIT_PATH, settings.RATE_LIMIT_SLOTS)
+        else:
+            store = MemoryBucketStore(settings.RATE_LIMIT_SLOTS)
+        return cls(store)
+
+    @staticmethod
+    def client(headers, client_host: Optional[str]) -> str:
+        """The user of a valid access token, otherwise the client address."""
+        authorization = headers.get('authorization')
+        if authorization:
+            try:
+                payload = validate_access_token(authorization)
+                return "user:" + str(payload.get('user_id', payload.get('id')))
+            except (AuthTokenMissing, AuthTokenExpired, AuthTokenCorrupted):
+                pass
+        return "ip:" + (client_host or "unknown")
+
+    def check(self, route: str, client: str, limit: RateLimit) -> Tuple[bool, dict]:
+        """
+        Takes a token from the bucket of the client on the route.
+
+        Returns:
+            whether the request is admitted, and the RateLimit-* headers to answer with
+            (plus Retry-After when it is not)
+        """
+        key = route if limit.per == PER_ROUTE else f"{route}\n{client}"
+        tokens = self.store.take(key, limit, time.time())
+        allowed = tokens >= 1
+        remaining = tokens - 1 if allowed else tokens
+        headers = {
+            "RateLimit-Limit": str(limit.burst),
+            "RateLimit-Remaining": str(int(remaining)),
+            "RateLimit-Reset": str(math.ceil((limit.burst - remaining) / limit.rate)),
+            "RateLimit-Policy": f"{limit.burst};w={limit.window}",
+        }
+        if allowed:
+            self.allowed += 1
+        else:
+            self.rejected += 1
+            headers["Retry-After"] = str(math.ceil((1 - tokens) / limit.rate))
+        return allowed, headers
+
+    def stats(self) -> dict:
+        return {"backend": type(self.store).__name__, "allowed": self.allowed, "rejected": self.rejected}
+
+    def close(self):
+        self.store.close()
+
+
+# Shared by every request of this worker, closed by the app lifespan.
+rate_limiter = RateLimiter.from_settings()
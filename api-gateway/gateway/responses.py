@@ -0,0 +1,39 @@
+import json
+from typing import Any
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # The stdlib encoder is used instead.
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    """Encodes content as compact UTF-8 JSON, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(body) -> Any:
+    """Decodes a JSON body (bytes or str), with orjson when it is installed."""
+    return orjson.loads(body) if orjson is not None else json.loads(body)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded by dumps: the default response class of the gateway."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class RawResponse(Response):
+    """
+    An upstream response sent on as the bytes it came in as, so JSON the gateway has
+    no reason to rewrite is never decoded and encoded again. raw_headers are the
+    upstream's forwardable headers; only Content-Length is set here.
+    """
+
+    def __init__(self, status_code: int, raw_headers: list, body: bytes):
+        super().__init__(content=body, status_code=status_code)
+        self.raw_headers = [(key, value) for key, value in raw_headers if key != b"content-length"] + self.raw_headers
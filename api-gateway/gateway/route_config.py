@@ -0,0 +1,251 @@
+"""
+Route table loaded from ROUTES_FILE and reloaded when the file changes.
+
+The file is JSON, {"routes": {...}}, with the keys and values of gateway.routes.ROUTES.
+Target urls may name settings as ${USERS_SERVICE_URL}. Without ROUTES_FILE the built-in
+ROUTES are used. Export them as a first file, or check one before deploying it, with
+
+    python -m gateway.route_config --dump > routes.json
+    python -m gateway.route_config routes.json
+"""
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import argparse
+from contextvars import ContextVar
+from typing import Optional, Tuple
+from urllib.parse import urlsplit
+from conf import settings
+from .router import RouteTable, RouteMatch, _rules
+from .cache import CachePolicy
+from .ratelimit import RateLimit
+from .network import RetryPolicy, UNIX_SCHEME
+from .metrics import metrics
+from .deadline import budget
+from .exceptions import RouteConfigError
+
+logger = logging.getLogger(__name__)
+
+# Options a rule may set besides "url" and "methods"; anything else is taken for a typo.
+ROUTE_OPTIONS = {
+    "cache": CachePolicy.from_options,
+    "rate_limit": RateLimit.from_options,
+    "retries": lambda retries: RetryPolicy.from_options({"retries": retries}),
+    "hedge": lambda hedge: RetryPolicy.from_options({"hedge": hedge}),
+    "bulkhead": lambda name: settings.BULKHEAD_CLASSES[name],
+    "timeout": lambda seconds: budget({"timeout": seconds}),
+}
+METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+UPSTREAM_SCHEMES = {"http", "https", UNIX_SCHEME}
+PLACEHOLDER = re.compile(r"\$\{(\w+)\}")
+
+
+def expand(url: str) -> str:
+    """Replaces ${NAME} with the NAME setting."""
+    def setting(match):
+        value = getattr(settings, match.group(1), None)
+        if not isinstance(value, str) or not value:
+            raise RouteConfigError(f"{url!r} names {match.group(0)}, which is not a URL setting.")
+        return value
+    return PLACEHOLDER.sub(setting, url)
+
+
+def validate(routes: dict) -> RouteTable:
+    """Checks every rule of routes and compiles them. Raises RouteConfigError on the first problem."""
+    if not isinstance(routes, dict) or not routes:
+        raise RouteConfigError("Expected a non-empty object of routes.")
+    table = RouteTable()
+    try:
+        for pattern, value in routes.items():
+            for route in _rules(pattern, value):
+                route.target = expand(route.target)
+                parts = urlsplit(route.target)
+                if parts.scheme not in UPSTREAM_SCHEMES or not parts.netloc:
+                    raise RouteConfigError(f"{pattern}: {route.target!r} is not an upstream url.")
+                if route.methods and not set(route.methods) <= METHODS:
+                    raise RouteConfigError(f"{pattern}: unknown methods {sorted(set(route.methods) - METHODS)}.")
+                for name, option in route.options.items():
+                    if name not in ROUTE_OPTIONS:
+                        raise RouteConfigError(f"{pattern}: unknown option {name!r}.")
+                    try:
+                        ROUTE_OPTIONS[name](option)
+                    except (KeyError, TypeError, ValueError, AttributeError) as exc:
+                        raise RouteConfigError(f"{pattern}: invalid {name} option {option!r} ({exc!r}).")
+                table.add(route)
+    except RouteConfigError:
+        raise
+    except (KeyError, TypeError, ValueError, AttributeError) as exc:
+        raise RouteConfigError(f"Invalid routes: {exc!r}.")
+    return table
+
+
+def load(path: str) -> Tuple[RouteTable, str]:
+    """Reads, checks and compiles the routes file. Returns the table and a checksum of the file."""
+    with open(path, "rb") as source:
+        content = source.read()
+    try:
+        config = json.loads(content)
+    except ValueError as exc:
+        raise RouteConfigError(f"{path} is not valid JSON: {exc}.")
+    if not isinstance(config, dict) or "routes" not in config:
+        raise RouteConfigError(f'{path} has no "routes".')
+    return validate(config["routes"]), hashlib.sha256(content).hexdigest()[:12]
+
+
+# The table a request was first routed by, so a reload never changes its route halfway.
+pinned_table: ContextVar[Optional[RouteTable]] = ContextVar("pinned_table", default=None)
+
+# Key of the ASGI scope holding the match of the request, see LiveRouteTable.match_scope.
+ROUTE_SCOPE_KEY = "gateway.route"
+
+
+class LiveRouteTable:
+    """
+    The route table of this worker, swapped whole when ROUTES_FILE changes. A new version
+    is only swapped in once it is read, checked and compiled, so a bad file leaves the
+    current one serving. Requests pinned to a version (see RouteTableMiddleware) are
+    routed by it until they finish, whatever is swapped in meanwhile.
+    """
+
+    def __init__(self, table: RouteTable, source: Optional[str] = None, checksum: str = "built-in"):
+        self.table = table
+        self.source = source
+        self.checksum = checksum
+        self.version = 1
+        self.loaded_at = time.time()
+        self.reloads = 0
+        self.failures = 0
+        self.last_error = None
+        self.last_reload_ms = None
+        self._stat = self._file_stat()
+
+    @classmethod
+    def from_settings(cls, routes: dict) -> "LiveRouteTable":
+        """Loads ROUTES_FILE when set, otherwise compiles the built-in routes."""
+        if settings.ROUTES_FILE:
+            table, checksum = load(settings.ROUTES_FILE)
+            return cls(table, settings.ROUTES_FILE, checksum)
+        return cls(RouteTable.compile(routes))
+
+    def match(self, path: str, method: str) -> Optional[RouteMatch]:
+        return (pinned_table.get() or self.table).match(path, method)
+
+    def match_scope(self, scope) -> Optional[RouteMatch]:
+        """
+        Matches the request of an ASGI scope once and keeps the match in the scope, so the
+        middlewares and the handler of the request share it instead of each matching again.
+        """
+        if ROUTE_SCOPE_KEY not in scope:
+            scope[ROUTE_SCOPE_KEY] = self.match(scope["path"], scope["method"])
+        return scope[ROUTE_SCOPE_KEY]
+
+    def pin(self):
+        """Routes the rest of the current request by the current version; undo with unpin(token)."""
+        return pinned_table.set(self.table)
+
+    @staticmethod
+    def unpin(token):
+        pinned_table.reset(token)
+
+    def _file_stat(self):
+        if not self.source:
+            return None
+        try:
+            stat = os.stat(self.source)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    async def reload(self) -> bool:
+        """Swaps in the routes file if it changed. Returns whether a new version is serving."""
+        stat = self._file_stat()
+        if stat is None or stat == self._stat:
+            return False
+        self._stat = stat
+        started = time.perf_counter()
+        try:
+            table, checksum = await asyncio.to_thread(load, self.source)
+        except (OSError, RouteConfigError) as exc:
+            self.failures += 1
+            self.last_error = str(exc)
+            metrics.inc("gateway_routes_reloads_total", (("result", "failed"),))
+            logger.error("Keeping routes version %s: %s", self.version, exc)
+            return False
+        if checksum == self.checksum:
+            return False
+
+        # One reference swap: lookups see either the old table or the new one, never a mix.
+        self.table, self.checksum = table, checksum
+        self.version += 1
+        self.reloads += 1
+        self.loaded_at = time.time()
+        self.last_error = None
+        elapsed = time.perf_counter() - started
+        self.last_reload_ms = round(elapsed * 1000, 3)
+        metrics.inc("gateway_routes_reloads_total", (("result", "ok"),))
+        metrics.observe("gateway_routes_reload_seconds", (), elapsed)
+        logger.info("Routes version %s (%s, %s rules) loaded in %.1f ms",
+                    self.version, checksum, table.size, elapsed * 1000)
+        return True
+
+    async def watch(self):
+        """Checks ROUTES_FILE for changes every ROUTES_RELOAD_INTERVAL seconds until cancelled."""
+        while True:
+            await asyncio.sleep(settings.ROUTES_RELOAD_INTERVAL)
+            await self.reload()
+
+    def stats(self) -> dict:
+        return {
+            "source": self.source or "gateway.routes.ROUTES",
+            "version": self.version,
+            "checksum": self.checksum,
+            "rules": self.table.size,
+            "loaded_at": self.loaded_at,
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_reload_ms": self.last_reload_ms,
+            "last_error": self.last_error,
+        }
+
+
+def dump(routes: dict) -> dict:
+    """The built-in routes as a routes file, with service urls spelled as their settings."""
+    names = {settings.USERS_SERVICE_URL: "${USERS_SERVICE_URL}", settings.EVENTS_SERVICE_URL: "${EVENTS_SERVICE_URL}"}
+
+    def spell(url: str) -> str:
+        for service_url, name in names.items():
+            if service_url and url.startswith(service_url):
+                return name + url[len(service_url):]
+        return url
+
+    def rule(value):
+        if isinstance(value, str):
+            return spell(value)
+        if isinstance(value, dict):
+            return {**value, "url": spell(value["url"])}
+        return [rule(item) for item in value]
+
+    return {"routes": {pattern: rule(value) for pattern, value in routes.items()}}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", nargs="?", help="Routes file to check")
+    parser.add_argument("--dump", action="store_true", help="Print the built-in routes as a routes file")
+    args = parser.parse_args()
+    if args.dump:
+        from .routes import ROUTES
+        print(json.dumps(dump(ROUTES), indent=4))
+    elif args.path:
+        try:
+            table, checksum = load(args.path)
+        except (OSError, RouteConfigError) as exc:
+            sys.exit(f"{args.path}: {exc}")
+        print(json.dumps({"path": args.path, "rules": table.size, "checksum": checksum}))
+    else:
+        parser.error("give a routes file to check, or --dump")
@@ -0,0 +1,175 @@
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Dict, List, Optional
+from urllib.parse import quote, unquote
+from yarl import URL
+
+ANY_METHOD = '*'
+MOUNT = '*'
+# Path segments that move a url off its route's target once the client resolves them.
+DOT_SEGMENTS = ('.', '..', '')
+
+
+@dataclass
+class Route:
+    """A compiled entry of gateway.routes.ROUTES."""
+    pattern: str
+    target: str
+    methods: Optional[List[str]] = None
+    options: dict = field(default_factory=dict)
+
+    def url(self, params: dict, remainder: str = '') -> Optional[str]:
+        """
+        Builds the upstream url, filling path parameters and appending the mounted remainder.
+        Returns None if the url would resolve to a path outside the target.
+        """
+        target = self.target
+        for name, value in params.items():
+            target = target.replace('{' + name + '}', quote(value, safe=''))
+        url = target + quote(remainder, safe='/')
+        # What is filled in is percent-encoded, so only dots can resolve it elsewhere;
+        # aiohttp resolves them the way yarl does, so check the path it will request.
+        if '.' in url[len(self.base):] and not URL(url).path.startswith(URL(self.base).path):
+            return None
+        return url
+
+    @cached_property
+    def base(self) -> str:
+        """The part of the target every upstream url of the route starts with, up to its first parameter."""
+        return self.target.partition('{')[0]
+
+
+@dataclass
+class RouteMatch:
+    route: Optional[Route]
+    params: dict
+    url: Optional[str] = None
+    allowed_methods: List[str] = field(default_factory=list)
+
+
+class _Node:
+    __slots__ = ('static', 'param_name', 'param', 'mount', 'rules')
+
+    def __init__(self):
+        self.static: Dict[str, '_Node'] = {}
+        self.param_name: Optional[str] = None
+        self.param: Optional['_Node'] = None
+        self.mount: Dict[str, Route] = {}
+        self.rules: Dict[str, Route] = {}
+
+
+def _segments(path: str) -> List[str]:
+    path = path.strip('/')
+    return path.split('/') if path else []
+
+
+def _rules(pattern: str, value) -> List[Route]:
+    """Normalizes a ROUTES value: a target url, a {"url": ...} rule, or a list of rules."""
+    if isinstance(value, str):
+        return [Route(pattern, value)]
+    if isinstance(value, dict):
+        options = {key: option for key, option in value.items() if key not in ('url', 'methods')}
+        methods = [method.upper() for method in value['methods']] if value.get('methods') else None
+        return [Route(pattern, value['url'], methods, options)]
+    return [rule for item in value for rule in _rules(pattern, item)]
+
+
+class RouteTable:
+    """
+    Prefix tree over path segments, compiled once from gateway.routes.ROUTES.
+
+    Patterns support {name} path parameters and a trailing * to mount a whole
+    prefix on a service; the remainder of the path is appended to the target.
+    Static segments win over parameters, which win over mounts. Lookup cost
+    depends on the path length only, not on the number of routes.
+    """
+
+    def __init__(self):
+        self._root = _Node()
+        self.size = 0
+
+    @classmethod
+    def compile(cls, routes: dict) -> 'RouteTable':
+        table = cls()
+        for pattern, value in routes.items():
+            for route in _rules(pattern, value):
+                table.add(route)
+        return table
+
+    def add(self, route: Route):
+        node = self._root
+        segments = _segments(route.pattern)
+        mount = bool(segments) and segments[-1] == MOUNT
+        if mount:
+            segments = segments[:-1]
+
+        for segment in segments:
+            if segment.startswith('{') and segment.endswith('}'):
+                name = segment[1:-1]
+                if node.param is None:
+                    node.param_name, node.param = name, _Node()
+                elif node.param_name != name:
+                    raise ValueError(f"Route {route.pattern!r} renames parameter {{{node.param_name}}} to {segment}.")
+                node = node.param
+            else:
+                node = node.static.setdefault(segment, _Node())
+
+        rules = node.mount if mount else node.rules
+        for method in route.methods or [ANY_METHOD]:
+            if method in rules:
+                raise ValueError(f"Route {route.pattern!r} is defined twice for {method}.")
+            rules[method] = route
+        self.size += 1
+
+    def match(self, path: str, method: str) -> Optional[RouteMatch]:
+        """
+        Finds the route for path and method.
+
+        Returns:
+            None when no route matches the path, a RouteMatch without a route when the
+            path matches but not for this method, otherwise the route and its upstream url.
+            Paths with empty or dot segments, even percent-encoded, match no route.
+        """
+        segments = _segments(path)
+        for segment in segments:
+            if segment in DOT_SEGMENTS or ('%' in segment and unquote(segment) in DOT_SEGMENTS):
+                return None
+        params = {}
+        found = self._find(self._root, segments, 0, params)
+        if found is None:
+            return None
+
+        rules, remainder = found
+        if path.endswith('/') and remainder:
+            remainder += '/'
+        route = rules.get(method.upper()) or rules.get(ANY_METHOD)
+        if route is None:
+            return RouteMatch(None, params, allowed_methods=sorted(rules))
+        url = route.url(params, remainder)
+        if url is None:
+            return None
+        return RouteMatch(route, params, url)
+
+    def _find(self, node: _Node, segments: List[str], index: int, params: dict):
+        if index == len(segments):
+            if node.rules:
+                return node.rules, ''
+            return (node.mount, '') if node.mount else None
+
+        segment = segments[index]
+        child = node.static.get(segment)
+        if child is not None:
+            found = self._find(child, segments, index + 1, params)
+            if found is not None:
+                return found
+
+        if node.param is not None:
+            params[node.param_name] = segment
+            found = self._find(node.param, segments, index + 1, params)
+            if found is not None:
+                return found
+            del params[node.param_name]
+
+        if node.mount:
+            return node.mount, '/'.join(segments[index:])
+        return None
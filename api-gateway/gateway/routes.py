@@ -2,15 +2,64 @@ from conf import settings
 USERS_SERVICE_URL  = settings.USERS_SERVICE_URL
 EVENTS_SERVICE_URL = settings.EVENTS_SERVICE_URL
 
+# Instances serving each service URL; requests to a service are balanced across them.
+SERVICES = {
+    USERS_SERVICE_URL: settings.USERS_SERVICE_INSTANCES,
+    EVENTS_SERVICE_URL: settings.EVENTS_SERVICE_INSTANCES,
+}
 
+# Compiled into a gateway.router.RouteTable at startup. A key is a path pattern with
+# optional {name} parameters, or a prefix ending in * mounted on a service. A value is
+# the target url, a rule {"url": ..., "methods": [...]}, or a list of rules. A rule may
+# opt GET requests into the response cache with {"cache": {"ttl": seconds, "vary":
+# [header names or "user"], "stale_while_revalidate": seconds}}; its other methods drop
+# the cached responses of the url they write to. Idempotent calls are
+# retried UPSTREAM_RETRIES times unless the rule sets "retries", and a rule may add
+# "hedge": {"percentile": 95} to race a second attempt against slow first ones. Each
+# client gets a token bucket per route of RATE_LIMIT_RATE and RATE_LIMIT_BURST, unless
+# the rule sets "rate_limit": {"rate": per second, "burst": n, "per": "client" or "route"}
+# or turns it off with "rate_limit": false. "bulkhead": name puts the route in a class
+# of BULKHEAD_CLASSES with its own concurrency limit. "timeout": seconds is the budget of
+# a request to the route, GATEWAY_TIMEOUT otherwise; the services are told its deadline
+# in DEADLINE_HEADER. With ROUTES_FILE set, the routes of that file are served instead
+# and reloaded when it changes (see gateway.route_config).
 ROUTES = {
 	######################## USERS_SERVICE_URL ########################
-    "api/auth/token/": USERS_SERVICE_URL + '/api/auth/token/',
+    "api/auth/token/": {
+        "url": USERS_SERVICE_URL + '/api/auth/token/',
+        # Every login runs a password hash on the users service.
+        "rate_limit": {"rate": 0.2, "burst": 5},
+        "bulkhead": "auth",
+        "timeout": 10,
+    },
     "api/accounts/users/": USERS_SERVICE_URL + '/api/accounts/users/',
+    "api/accounts/users/{id}/": {
+        "url": USERS_SERVICE_URL + '/api/accounts/users/{id}/',
+        # Each caller gets their own cached copy of a user profile, dropped when it is written.
+        "cache": {"ttl": 30, "vary": ["user"], "stale_while_revalidate": 30},
+    },
+    "api/accounts/user-documents/*": {
+        "url": USERS_SERVICE_URL + '/api/accounts/user-documents/',
+        # Slow uploads get their own slots so they cannot starve the rest of the service.
+        "bulkhead": "uploads",
+        "timeout": 120,
+    },
+    "api/accounts/*": USERS_SERVICE_URL + '/api/accounts/',
 
 
     ######################## EVENTS_SERVICE_URL ########################
-    "api/events/": EVENTS_SERVICE_URL + '/api/events/'
+    "api/events/": {
+        "url": EVENTS_SERVICE_URL + '/api/events/',
+        # Same listing for every caller, refreshed in the background for 30s once stale.
+        "cache": {"ttl": 10, "stale_while_revalidate": 30},
+        # Reads past the p95 latency get a second attempt on another instance.
+        "hedge": {"percentile": 95},
+        "timeout": 10,
+    },
+    "api/events/{event_id}/": {
+        "url": EVENTS_SERVICE_URL + '/api/events/{event_id}/',
+        "methods": ["GET", "PUT", "DELETE"],
+    },
 
 
-}
\ No newline at end of file
+}
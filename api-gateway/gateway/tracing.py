@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import random
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from conf import settings
+
+SERVICE_NAME = "api-gateway"
+SAMPLED = 0x01
+
+
+def new_id(bits: int) -> str:
+    return format(random.getrandbits(bits) or 1, f"0{bits // 4}x")
+
+
+class Span:
+    """One timed operation of a trace, with the ids W3C traceparent carries."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "sampled", "name", "kind", "attributes", "links", "start",
+                 "_started")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool, kind: str = "internal"):
+        self.trace_id = trace_id
+        self.span_id = new_id(64)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.name = name
+        self.kind = kind
+        self.attributes = {}
+        self.links = []  # Spans of other traces this one is related to, not a parent of.
+        self.start = time.time()
+        self._started = time.perf_counter()
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{SAMPLED if self.sampled else 0:02x}"
+
+    def inject(self, headers: Optional[dict]) -> dict:
+        """Returns a copy of headers carrying this span as the parent of the next hop."""
+        headers = {key: value for key, value in (headers or {}).items() if key.lower() != "traceparent"}
+        headers["traceparent"] = self.traceparent
+        return headers
+
+    def end(self):
+        if self.sampled:
+            exporter.export({
+                "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+                "service": SERVICE_NAME, "name": self.name, "kind": self.kind, "start": self.start,
+                "duration_ms": round((time.perf_counter() - self._started) * 1000, 3),
+                "attributes": self.attributes,
+                "links": [{"trace_id": link.trace_id, "span_id": link.span_id} for link in self.links],
+            })
+
+
+def parse_traceparent(value: Optional[str]):
+    """Returns (trace_id, parent_id, sampled) of a valid traceparent header, otherwise None."""
+    parts = (value or "").strip().split("-")
+    if len(parts) < 4 or len(parts[0]) != 2 or parts[0] == "ff" or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        flags = int(parts[3][:2], 16)
+        if not int(parts[1], 16) or not int(parts[2], 16):
+            return None
+    except ValueError:
+        return None
+    return parts[1].lower(), parts[2].lower(), bool(flags & SAMPLED)
+
+
+class BatchExporter:
+    """
+    Buffers finished spans and appends them as JSON lines to TRACE_EXPORT_PATH from a
+    background thread, every TRACE_EXPORT_INTERVAL seconds or once TRACE_BATCH_SIZE are
+    waiting. Spans beyond TRACE_MAX_QUEUE are dropped rather than slowing requests down.
+    """
+
+    def __init__(self):
+        self._spans = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.dropped = 0
+
+    def export(self, span: dict):
+        with self._lock:
+            if len(self._spans) >= settings.TRACE_MAX_QUEUE:
+                self.dropped += 1
+                return
+            self._spans.append(span)
+            full = len(self._spans) >= settings.TRACE_BATCH_SIZE
+        if self._thread is None:
+            self._start()
+        if full:
+            self._wake.set()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(settings.TRACE_EXPORT_INTERVAL)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            spans, self._spans = self._spans, []
+        if spans:
+            os.makedirs(os.path.dirname(settings.TRACE_EXPORT_PATH) or ".", exist_ok=True)
+            with open(settings.TRACE_EXPORT_PATH, "a") as export:
+                export.write("".join(json.dumps(span) + "\n" for span in spans))
+
+
+exporter = BatchExporter()
+
+# The span of the request being handled by the current task.
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def start_trace(name: str, traceparent: Optional[str] = None) -> Span:
+    """
+    Starts the server span of a request, continuing the caller's trace when it sent a
+    valid traceparent. Otherwise the sampling decision is made here, once per trace.
+    """
+    parent = parse_traceparent(traceparent)
+    if parent is not None:
+        trace_id, parent_id, sampled = parent
+    else:
+        trace_id, parent_id, sampled = new_id(128), None, random.random() < settings.TRACE_SAMPLE_RATE
+    return Span(name, trace_id, parent_id, sampled, kind="server")
+
+
+@contextmanager
+def span(name: str, kind: str = "internal"):
+    """Times a child of the current span; yields None outside of a trace."""
+    parent = current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, parent.trace_id, parent.span_id, parent.sampled, kind)
+    token = current_span.set(child)
+    try:
+        yield child
+    finally:
+        current_span.reset(token)
+        child.end()
+
+
+def inject(headers: Optional[dict], span: Optional[Span]) -> Optional[dict]:
+    """Adds the traceparent of span to headers, when there is a span."""
+    return span.inject(headers) if span is not None else headers
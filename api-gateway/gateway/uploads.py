@@ -0,0 +1,71 @@
+from tempfile import SpooledTemporaryFile
+from fastapi import Request
+from starlette.datastructures import UploadFile
+from conf import settings
+from .exceptions import PayloadTooLarge, MalformedRequest
+
+
+async def spool_body(request: Request, max_size: int) -> UploadFile:
+    """Receives the whole request body into a spooled temp file, enforcing max_size as it goes."""
+    spool = UploadFile(file=SpooledTemporaryFile(max_size=settings.UPLOAD_SPOOL_MEMORY_SIZE))
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_size:
+                raise PayloadTooLarge(f'Upload exceeds the {max_size} bytes limit.')
+            await spool.write(chunk)
+    except BaseException:
+        await spool.close()
+        raise
+    spool.size = received
+    await spool.seek(0)
+    return spool
+
+
+async def iter_spool(spool: UploadFile, chunk_size: int = None):
+    """Yields the spooled body chunk by chunk, then deletes the temp file."""
+    chunk_size = chunk_size or settings.GATEWAY_STREAM_CHUNK_SIZE
+    try:
+        while chunk := await spool.read(chunk_size):
+            yield chunk
+    finally:
+        await spool.close()
+
+
+async def prepare_upload(request: Request, max_size: int = None):
+    """
+    Prepares a multipart request body for re-streaming to a service without parsing it.
+
+    Args:
+        request: is the incoming multipart request
+        max_size: is the largest accepted body in bytes, defaults to UPLOAD_MAX_SIZE
+
+    Returns:
+        (body, content_length, spool): an async iterable of body chunks, its total length
+        and the spool it is read from, None when it streams straight from the client.
+        Reading the body to the end deletes the spool; close it if it is never read.
+
+    Raises:
+        PayloadTooLarge: if the body is larger than max_size
+        MalformedRequest: if the Content-Length header is not a byte count
+    """
+    max_size = max_size or settings.UPLOAD_MAX_SIZE
+    content_length = request.headers.get('content-length')
+    if content_length is not None:
+        try:
+            content_length = int(content_length)
+        except ValueError:
+            content_length = -1
+        if content_length < 0:
+            raise MalformedRequest('Content-Length must be a number of bytes.')
+        if content_length > max_size:
+            raise PayloadTooLarge(f'Upload exceeds the {max_size} bytes limit.')
+
+    # Without a declared length the body has to be received first to tell the service its size.
+    if content_length is None or settings.UPLOAD_SPOOL_TO_DISK:
+        spool = await spool_body(request, max_size)
+        return iter_spool(spool), spool.size, spool
+
+    # The server already holds the client to its declared Content-Length.
+    return request.stream(), content_length, None
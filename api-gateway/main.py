@@ -1,9 +1,80 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, status
 from gateway.controllers import router as routers
-from gateway.middleware.request_gateway import router as gateway_router
+from gateway.middleware.request_gateway import router as gateway_router, route_table
+from gateway.network import upstream_pool, probe
+from gateway.balancer import load_balancer
+from gateway.routes import SERVICES
+from gateway.cache import response_cache
+from gateway.ratelimit import rate_limiter
+from gateway.middleware.rate_limit import RateLimitMiddleware
+from gateway.middleware.bulkhead import BulkheadMiddleware
+from gateway.middleware.deadline import DeadlineMiddleware
+from gateway.middleware.authentication import IdentityMiddleware
+from gateway.middleware.compression import CompressionMiddleware
+from gateway.middleware.metrics import MetricsMiddleware
+from gateway.middleware.tracing import TracingMiddleware
+from gateway.middleware.routes import RouteTableMiddleware
+from gateway.tracing import exporter
+from gateway.metrics import metrics
+from gateway.exceptions import UpstreamUnavailable, DeadlineExceeded
+from gateway.responses import FastJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from conf import settings
 
-app = FastAPI()  # Initialize FastAPI application
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the upstream connection pools once per worker and close them on shutdown.
+    load_balancer.configure(SERVICES)
+    upstream_pool.open(*load_balancer.instance_urls())
+    health_checks = None
+    if settings.UPSTREAM_HEALTH_CHECK_INTERVAL:
+        health_checks = asyncio.create_task(load_balancer.run_health_checks(probe))
+    metrics_flush = None
+    if settings.METRICS_ENABLED:
+        metrics_flush = asyncio.create_task(metrics.run_flush())
+    routes_reload = None
+    if settings.ROUTES_FILE and settings.ROUTES_RELOAD_INTERVAL:
+        routes_reload = asyncio.create_task(route_table.watch())
+    yield
+    if routes_reload:
+        routes_reload.cancel()
+    if health_checks:
+        health_checks.cancel()
+    if metrics_flush:
+        metrics_flush.cancel()
+        metrics.flush()
+    exporter.flush()
+    await upstream_pool.close()
+    response_cache.close()
+    rate_limiter.close()
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)  # Initialize FastAPI application
+
+
+@app.exception_handler(UpstreamUnavailable)
+async def upstream_unavailable_handler(request: Request, exc: UpstreamUnavailable):
+    # Fail fast instead of waiting on an upstream that is known to be down.
+    headers = {"Retry-After": str(exc.retry_after)} if exc.retry_after else None
+    return FastJSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"detail": str(exc)}, headers=headers)
+
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded):
+    # The budget of the route ran out before the upstream answered.
+    return FastJSONResponse(status_code=status.HTTP_504_GATEWAY_TIMEOUT, content={"detail": str(exc)})
+
+# Added before CORS so that rejected requests still get the CORS headers. Rate limits
+# run first so rejected requests never take a bulkhead slot, and bad tokens are
+# rejected after them so they are rate limited too.
+app.add_middleware(BulkheadMiddleware)
+app.add_middleware(IdentityMiddleware)
+app.add_middleware(RateLimitMiddleware)
+
+# Outside the bulkheads, so time spent queued for a slot comes out of the budget.
+app.add_middleware(DeadlineMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -12,6 +83,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outside CORS and the rejecting middlewares, so rejections are negotiated too.
+app.add_middleware(CompressionMiddleware)
+
+# Times whole responses, rejections and compression included.
+app.add_middleware(MetricsMiddleware)
+
+# Outside everything but the route table pinning, so the server span covers all the gateway does.
+app.add_middleware(TracingMiddleware)
+
+# Around everything else, so one route table version routes a request from start to finish.
+app.add_middleware(RouteTableMiddleware)
+
 # Include the routes from the routes module
 app.include_router(routers)
 
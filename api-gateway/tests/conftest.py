@@ -0,0 +1,62 @@
+"""
+The gateway is tested in-process against a stub upstream (benchmarks.stubs) serving
+both services on a local port. Settings are read when conf is first imported, so the
+environment is set up here, before the gateway is; tests change them with monkeypatch.
+"""
+import os
+import socket
+import tempfile
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+STUB_PORT = free_port()
+SCRATCH = tempfile.mkdtemp(prefix="gateway-tests-")
+for name, value in {
+    "SECRET_KEY": "test-secret-key-of-at-least-32-bytes",
+    "USERS_SERVICE_URL": f"http://127.0.0.1:{STUB_PORT}",
+    "EVENTS_SERVICE_URL": f"http://127.0.0.1:{STUB_PORT}",
+    "UPSTREAM_HEALTH_CHECK_INTERVAL": "0",
+    "UPSTREAM_COALESCE": "false",
+    "RESPONSE_CACHE_ENABLED": "false",
+    "RATE_LIMIT_ENABLED": "false",
+    "RATE_LIMIT_BACKEND": "memory",
+    "METRICS_DIR": os.path.join(SCRATCH, "metrics"),
+    "TRACE_SAMPLE_RATE": "0",
+    "TRACE_EXPORT_PATH": os.path.join(SCRATCH, "traces.jsonl"),
+}.items():
+    os.environ.setdefault(name, value)
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+import main as gateway  # noqa: E402
+from benchmarks import stubs  # noqa: E402
+from gateway.network import circuit_breakers  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def upstream():
+    """The stub both services point at; change its faults to inject errors or latency."""
+    faults = stubs.Faults()
+    runner = await stubs.start(STUB_PORT, faults)
+    yield faults
+    await runner.cleanup()
+
+
+@pytest.fixture
+async def client(monkeypatch):
+    """An httpx client of the gateway app, with its lifespan running and fresh circuit breakers."""
+    monkeypatch.setattr(circuit_breakers, "_breakers", {})
+    async with gateway.lifespan(gateway.app):
+        transport = httpx.ASGITransport(app=gateway.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+            yield client
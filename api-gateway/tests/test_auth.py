@@ -0,0 +1,86 @@
+import time
+import jwt
+import pytest
+from conf import settings
+from gateway.auth import IDENTITY_ISSUER, sign_identity, validate_access_token, token_cache
+from gateway.exceptions import AuthTokenExpired, AuthTokenCorrupted
+
+
+IDENTITY_KEY = "identity-key-of-at-least-32-bytes!"
+
+
+def access_token(key: str = None, **claims) -> str:
+    payload = {"token_type": "access", "user_id": 5, "email": "user@example.com", "permissions": ["accounts.view_user"],
+               "exp": int(time.time()) + 60, **claims}
+    return jwt.encode(payload, key or settings.SECRET_KEY, algorithm="HS256")
+
+
+@pytest.fixture(autouse=True)
+def clear_token_cache():
+    token_cache.clear()
+
+
+@pytest.fixture
+def identities(monkeypatch):
+    monkeypatch.setattr(settings, "IDENTITY_SIGNING_KEY", IDENTITY_KEY)
+
+
+def decode_identity(identity: str) -> dict:
+    return jwt.decode(identity, IDENTITY_KEY, algorithms=["HS256"], issuer=IDENTITY_ISSUER)
+
+
+def test_valid_token():
+    assert validate_access_token("Bearer " + access_token())["user_id"] == 5
+
+
+@pytest.mark.parametrize("token, error", [
+    (access_token(exp=int(time.time()) - 10), AuthTokenExpired),
+    (access_token(key="another-secret-key-of-at-least-32-bytes"), AuthTokenCorrupted),
+    (access_token(nbf=int(time.time()) + 3600), AuthTokenCorrupted),
+    (access_token(iat="yesterday"), AuthTokenCorrupted),
+    ("not-a-token", AuthTokenCorrupted),
+])
+def test_invalid_tokens(token, error):
+    with pytest.raises(error):
+        validate_access_token("Bearer " + token)
+
+
+@pytest.mark.parametrize("token_lifetime", [3600, 10])
+def test_identity_expires_with_ttl_or_token(identities, monkeypatch, token_lifetime):
+    monkeypatch.setattr(settings, "IDENTITY_TTL", 30)
+    now = int(time.time())
+    claims = decode_identity(sign_identity(validate_access_token("Bearer " + access_token(exp=now + token_lifetime))))
+    assert claims["user_id"] == 5
+    assert claims["permissions"] == ["accounts.view_user"]
+    assert now <= claims["iat"] <= claims["exp"] <= now + min(30, token_lifetime) + 1
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("token", [
+    access_token(nbf=int(time.time()) + 3600),
+    access_token(key="another-secret-key-of-at-least-32-bytes"),
+    access_token(exp=int(time.time()) - 10),
+    "not-a-token",
+])
+async def test_bad_token_is_answered_401(identities, upstream, client, token):
+    response = await client.get("/api/accounts/roles/", headers={"Authorization": "Bearer " + token})
+    assert response.status_code == 401
+    assert response.headers["www-authenticate"] == "Bearer"
+    assert upstream.requests == 0
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("authorized", [True, False])
+async def test_client_identity_is_replaced(identities, upstream, client, authorized):
+    forged = jwt.encode({"iss": IDENTITY_ISSUER, "user_id": 1, "is_superuser": True}, IDENTITY_KEY, algorithm="HS256")
+    headers = {settings.IDENTITY_HEADER: forged}
+    if authorized:
+        headers["Authorization"] = "Bearer " + access_token()
+    response = await client.get("/api/accounts/roles/", headers=headers)
+    assert response.status_code == 200
+
+    forwarded = upstream.last.headers.get(settings.IDENTITY_HEADER)
+    if authorized:
+        assert decode_identity(forwarded)["user_id"] == 5
+    else:
+        assert forwarded is None
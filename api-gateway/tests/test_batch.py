@@ -0,0 +1,32 @@
+import pytest
+from tests.conftest import STUB_PORT
+
+
+async def batch(client, *requests):
+    response = await client.post("/v2/api/batch/", json={"requests": list(requests)})
+    assert response.status_code == 200, response.text
+    return {item["id"]: item for item in response.json()["responses"]}
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("path", ["api/events/../../admin/", "api/events/%2e%2e/%2E%2E/admin/"])
+async def test_traversal_is_not_routed(upstream, client, path):
+    results = await batch(client, {"id": "escape", "path": path}, {"id": "events", "path": "api/events/"})
+    assert results["escape"]["status"] == 404
+    assert results["events"]["status"] == 200
+    assert upstream.requests == 1
+
+
+@pytest.mark.anyio
+async def test_hop_by_hop_headers_are_dropped(upstream, client):
+    headers = {"Host": "internal.example", "Content-Length": "1000", "Transfer-Encoding": "chunked",
+               "Connection": "close", "Accept-Language": "fr"}
+    results = await batch(client, {"id": "events", "path": "api/events/", "headers": headers})
+    assert results["events"]["status"] == 200
+
+    received = upstream.last.headers
+    assert received["Host"] == f"127.0.0.1:{STUB_PORT}"
+    assert "Content-Length" not in received
+    assert "Transfer-Encoding" not in received
+    assert received.get("Connection", "").lower() != "close"
+    assert received["Accept-Language"] == "fr"
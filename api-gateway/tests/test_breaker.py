@@ -0,0 +1,67 @@
+import asyncio
+import pytest
+from conf import settings
+from gateway.network import circuit_breakers
+from tests.conftest import STUB_PORT
+
+UPSTREAM = f"http://127.0.0.1:{STUB_PORT}"
+
+
+@pytest.fixture
+def breaker_settings(monkeypatch):
+    for name, value in {"BREAKER_MIN_REQUESTS": 5, "BREAKER_OPEN_SECONDS": 0.3, "BREAKER_HALF_OPEN_PROBES": 2,
+                        "UPSTREAM_RETRIES": 0}.items():
+        monkeypatch.setattr(settings, name, value)
+
+
+def state():
+    return circuit_breakers.get(UPSTREAM).state
+
+
+async def get(client, requests=1):
+    return [(await client.get("/api/events/")) for _ in range(requests)][-1]
+
+
+@pytest.mark.anyio
+async def test_breaker_cycle(breaker_settings, upstream, client):
+    await get(client, 5)
+    assert state() == "closed"
+
+    upstream.error_rate = 1.0
+    await get(client, 5)
+    assert state() == "open"
+
+    # Open: calls fail fast without reaching the upstream.
+    upstream.error_rate = 0.0
+    reached = upstream.requests
+    response = await get(client)
+    assert response.status_code == 503
+    assert int(response.headers["retry-after"]) >= 1
+    assert upstream.requests == reached
+
+    await asyncio.sleep(settings.BREAKER_OPEN_SECONDS)
+    assert (await get(client)).status_code == 200
+    assert state() == "half_open"
+    assert (await get(client)).status_code == 200
+    assert state() == "closed"
+
+
+@pytest.mark.anyio
+async def test_failed_probe_opens_again(breaker_settings, upstream, client):
+    upstream.error_rate = 1.0
+    await get(client, 5)
+    await asyncio.sleep(settings.BREAKER_OPEN_SECONDS)
+    await get(client)
+    assert state() == "open"
+    assert circuit_breakers.get(UPSTREAM).times_opened == 2
+
+
+@pytest.mark.anyio
+async def test_slow_calls_open_the_breaker(breaker_settings, monkeypatch, upstream, client):
+    monkeypatch.setattr(settings, "BREAKER_SLOW_CALL_SECONDS", 0.02)
+    upstream.latency = 0.05
+    for _ in range(5):
+        assert (await get(client)).status_code == 200
+    assert state() == "open"
+    assert circuit_breakers.get(UPSTREAM).stats()["slow_call_rate"] == 1.0
+    assert (await get(client)).status_code == 503
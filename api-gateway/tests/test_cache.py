@@ -0,0 +1,105 @@
+import httpx
+import pytest
+from fastapi import Request, Response
+from conf import settings
+from gateway.cache import CachePolicy, DiskCacheStore, MemoryCacheStore, ResponseCache
+from gateway.middleware.compression import CompressionMiddleware
+from tests.test_auth import access_token
+
+BODY = b'{"items": "' + b"x" * 4096 + b'"}'
+
+
+def request(headers=None, method="GET"):
+    raw = [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+    return Request({"type": "http", "method": method, "path": "/", "query_string": b"", "headers": raw})
+
+
+async def fetch():
+    return 200, [(b"content-type", b"application/json")], BODY
+
+
+@pytest.mark.anyio
+async def test_generated_etag_is_weak():
+    cache = ResponseCache(MemoryCacheStore(10), max_body=1 << 20)
+    response = await cache.respond(request(), "http://upstream/", CachePolicy(ttl=60), fetch)
+    etag = response.headers["etag"]
+    assert etag.startswith('W/"')
+
+    for if_none_match in (etag, etag[2:], f'"other", {etag}'):
+        revalidated = await cache.respond(request({"If-None-Match": if_none_match}), "http://upstream/",
+                                          CachePolicy(ttl=60), fetch)
+        assert revalidated.status_code == 304
+        assert revalidated.headers["etag"] == etag
+
+
+@pytest.mark.anyio
+async def test_compression_weakens_strong_etag():
+    async def app(scope, receive, send):
+        await Response(BODY, media_type="application/json", headers={"ETag": '"v1"'})(scope, receive, send)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=CompressionMiddleware(app)),
+                                 base_url="http://gateway") as client:
+        compressed = await client.get("/", headers={"Accept-Encoding": "gzip"})
+        identity = await client.get("/", headers={"Accept-Encoding": "identity"})
+
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.headers["etag"] == 'W/"v1"'
+    assert "accept-encoding" in compressed.headers["vary"].lower()
+    assert compressed.content == BODY  # Decoded by httpx.
+    assert identity.headers["etag"] == '"v1"'
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("policy", [CachePolicy(ttl=60), CachePolicy(ttl=60, vary=["user"])])
+async def test_uncached_responses_pass_through(policy):
+    async def refused():
+        return 401, [(b"content-type", b"application/json"), (b"www-authenticate", b"Bearer"),
+                     (b"x-request-id", b"abc"), (b"connection", b"close")], b'{"detail": "No."}'
+
+    # Refused by the service on a miss, or bypassing the cache for want of a user to vary on.
+    cache = ResponseCache(MemoryCacheStore(10), max_body=1 << 20)
+    response = await cache.respond(request({"Authorization": "Bearer " + access_token()}), "http://upstream/",
+                                   policy, refused)
+    assert response.status_code == 401
+    assert response.body == b'{"detail": "No."}'
+    assert response.headers["www-authenticate"] == "Bearer"
+    assert response.headers["x-request-id"] == "abc"
+    assert "connection" not in response.headers
+    assert "etag" not in response.headers
+
+
+@pytest.fixture(params=["memory", "disk"])
+def store(request, tmp_path):
+    store = MemoryCacheStore(10) if request.param == "memory" else DiskCacheStore(str(tmp_path / "cache.sqlite3"), 10)
+    yield store
+    store.close()
+
+
+@pytest.mark.anyio
+async def test_invalidate_drops_every_entry_of_the_url(store):
+    cache = ResponseCache(store, max_body=1 << 20)
+    policy = CachePolicy(ttl=60, vary=["accept-language"])
+    urls = ["http://upstream/users/1/", "http://upstream/users/1/?fields=name", "http://upstream/users/2/"]
+    for url in urls:
+        for language in ("en", "fr"):
+            await cache.respond(request({"Accept-Language": language}), url, policy, fetch)
+    assert cache.misses == 6
+
+    await cache.invalidate("http://upstream/users/1/")
+    for url in urls:
+        await cache.respond(request({"Accept-Language": "en"}), url, policy, fetch)
+    assert (cache.misses, cache.hits) == (8, 1)
+
+
+@pytest.mark.anyio
+async def test_writes_invalidate_the_cached_user(monkeypatch, upstream, client):
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_ENABLED", True)
+    headers = {"Authorization": "Bearer " + access_token()}
+    for _ in range(2):
+        assert (await client.get("/api/accounts/users/1/", headers=headers)).status_code == 200
+    assert upstream.requests == 1
+
+    written = await client.put("/api/accounts/users/1/", headers=headers, json={"email": "new@example.com"})
+    assert written.status_code == 200
+    assert (await client.get("/api/accounts/users/1/", headers=headers)).status_code == 200
+    assert upstream.requests == 3
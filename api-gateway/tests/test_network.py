@@ -0,0 +1,48 @@
+import time
+import asyncio
+import pytest
+from conf import settings
+from gateway import tracing
+from gateway.deadline import remaining, request_deadline
+from gateway.exceptions import DeadlineExceeded
+from gateway.network import SingleFlight
+from gateway.tracing import Span, current_span
+
+
+@pytest.fixture
+def exported(monkeypatch):
+    spans = []
+    monkeypatch.setattr(settings, "UPSTREAM_COALESCE", True)
+    monkeypatch.setattr(tracing.exporter, "export", spans.append)
+    return spans
+
+
+@pytest.mark.anyio
+async def test_shared_call_outlives_first_callers_deadline(exported):
+    flight = SingleFlight()
+    seen, callers = [], {}
+
+    async def call():
+        seen.append((remaining(), current_span.get()))
+        await asyncio.sleep(0.1)
+        return "body"
+
+    async def caller(name, seconds):
+        request_deadline.set(None if seconds is None else time.time() + seconds)
+        callers[name] = Span(name, tracing.new_id(128), None, sampled=True, kind="server")
+        current_span.set(callers[name])
+        return await flight.do("get", "http://upstream/", {}, call)
+
+    first, second = await asyncio.gather(caller("first", 0.02), caller("second", None), return_exceptions=True)
+
+    assert isinstance(first, DeadlineExceeded)
+    assert second == "body"
+    assert flight.calls == 1 and flight.coalesced == 1
+    deadline, shared = seen[0]
+    assert deadline is None
+    assert (shared.trace_id, shared.parent_id) == (callers["first"].trace_id, callers["first"].span_id)
+
+    spans = {span["name"]: span for span in exported}
+    assert spans["coalesced call"]["span_id"] == shared.span_id
+    assert spans["coalesced wait"]["trace_id"] == callers["second"].trace_id
+    assert spans["coalesced wait"]["links"] == [{"trace_id": shared.trace_id, "span_id": shared.span_id}]
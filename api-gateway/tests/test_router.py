@@ -0,0 +1,69 @@
+import pytest
+from conf import settings
+from gateway.router import RouteTable, Route
+from gateway.middleware.request_gateway import route_table
+
+ROUTES = {
+    "api/accounts/users/{id}/": "http://users:8000/api/accounts/users/{id}/",
+    "api/accounts/*": "http://users:8000/api/accounts/",
+    "api/events/": {"url": "http://events:8000/api/events/", "methods": ["GET"]},
+}
+
+
+@pytest.fixture
+def table():
+    return RouteTable.compile(ROUTES)
+
+
+def test_static_param_and_mount(table):
+    assert table.match("/api/events/", "GET").url == "http://events:8000/api/events/"
+    assert table.match("/api/accounts/users/7/", "GET").url == "http://users:8000/api/accounts/users/7/"
+    assert table.match("/api/accounts/roles/3/", "GET").url == "http://users:8000/api/accounts/roles/3/"
+    assert table.match("/api/events/", "POST").allowed_methods == ["GET"]
+
+
+@pytest.mark.parametrize("path", [
+    "/api/accounts/../../admin/",
+    "/api/accounts/%2E%2E/%2E%2E/admin/",
+    "/api/accounts/%2e%2e/admin/",
+    "/api/accounts/foo/../../../secret/",
+    "/api/accounts/./roles/",
+    "/api/accounts/users/../",
+    "/api/accounts/users/%2E%2E/",
+    "/api/accounts//admin/",
+])
+def test_dot_and_empty_segments_match_no_route(table, path):
+    assert table.match(path, "GET") is None
+
+
+def test_url_never_leaves_the_target():
+    mount = Route("api/accounts/*", "http://users:8000/api/accounts/")
+    assert mount.url({}, "roles/1/") == "http://users:8000/api/accounts/roles/1/"
+    assert mount.url({}, "../../admin/") is None
+    param = Route("api/accounts/users/{id}/", "http://users:8000/api/accounts/users/{id}/")
+    assert param.url({"id": "a.b"}) == "http://users:8000/api/accounts/users/a.b/"
+    assert param.url({"id": ".."}) is None
+
+
+@pytest.mark.anyio
+async def test_traversal_is_not_proxied(upstream, client):
+    for path in ("/api/accounts/%2E%2E/%2E%2E/admin/", "/api/accounts/foo/%2E%2E/%2E%2E/%2E%2E/secret/"):
+        response = await client.get(path)
+        assert response.status_code == 404
+    assert upstream.requests == 0
+
+    response = await client.get("/api/accounts/roles/")
+    assert response.status_code == 200
+    assert upstream.last.path == "/api/accounts/roles/"
+
+
+@pytest.mark.anyio
+async def test_request_is_matched_once(monkeypatch, upstream, client):
+    matched = []
+    match = route_table.match
+    monkeypatch.setattr(route_table, "match", lambda path, method: matched.append(path) or match(path, method))
+    for name in ("RATE_LIMIT_ENABLED", "METRICS_ENABLED"):
+        monkeypatch.setattr(settings, name, True)
+
+    assert (await client.get("/api/events/")).status_code == 200
+    assert matched == ["/api/events/"]
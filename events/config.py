@@ -12,6 +12,21 @@ class BaseConfig:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECRET_KEY = os.getenv("SECRET_KEY", "default_secret_key")
 
+    # Tracing (see events_app.tracing): W3C traceparent from the gateway, spans exported as JSON lines.
+    TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))  # For requests without a traceparent.
+    TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "/tmp/traces/events.jsonl")
+    TRACE_BATCH_SIZE = 512
+    TRACE_EXPORT_INTERVAL = 5
+
+    # Deadlines (see events_app.deadline): work the gateway has given up on is stopped.
+    DEADLINE_HEADER = "X-Request-Deadline"
+    DEADLINE_CLOCK_SKEW = float(os.getenv("DEADLINE_CLOCK_SKEW", "0"))  # Seconds this host's clock may run ahead of the gateway's.
+
+    # Identity of verified callers forwarded by the gateway (see events_app.authentication),
+    # signed with a key shared with it. Empty ignores the header.
+    IDENTITY_HEADER = "X-Gateway-Identity"
+    IDENTITY_SIGNING_KEY = os.getenv("IDENTITY_SIGNING_KEY", "")
+
 class DevelopmentConfig(BaseConfig):
     """Development Configuration"""
     SQLALCHEMY_DATABASE_URI = f"sqlite:///{BASE_DIR / 'database.db'}"
@@ -3,4 +3,10 @@
 
 # flask db migrate
 flask db upgrade
-flask run --host=0.0.0.0 --port=${PORT}
\ No newline at end of file
+
+# On the same host as the gateway, listen on a Unix socket instead of TCP:
+# UNIX_SOCKET=/run/sockets/events.sock, and EVENTS_SERVICE_URL=unix:/run/sockets/events.sock for the gateway.
+if [ -n "${UNIX_SOCKET}" ]; then
+    exec gunicorn wsgi:app --bind unix:${UNIX_SOCKET} --workers ${WORKERS:-4}
+fi
+flask run --host=0.0.0.0 --port=${PORT}
@@ -0,0 +1,52 @@
+"""
+Authentication of requests by the identity the gateway forwards.
+
+The gateway verifies the bearer token of a request once and forwards the caller's
+claims in IDENTITY_HEADER, signed with IDENTITY_SIGNING_KEY. init_app checks that
+signature and sets request.user from the claims, without a lookup of its own: the
+users live in the users service, which alone refuses deleted and deactivated ones.
+The gateway signs each identity for a short while (IDENTITY_TTL), so a leaked one is
+soon refused here too.
+"""
+import jwt
+from flask import jsonify, request
+
+# Issuer of the identities the gateway signs.
+IDENTITY_ISSUER = 'api-gateway'
+
+
+class Identity:
+    """The caller of a request, as the gateway verified it."""
+    __slots__ = ('id', 'email', 'permissions', 'is_superuser')
+    is_authenticated = True
+
+    def __init__(self, claims):
+        self.id = claims['user_id']
+        self.email = claims.get('email')
+        self.permissions = frozenset(claims.get('permissions') or ())
+        self.is_superuser = bool(claims.get('is_superuser'))
+
+    def has_perm(self, permission):
+        return self.is_superuser or permission in self.permissions
+
+
+def init_app(app):
+    """Sets request.user of every request of app from its identity, None without one."""
+    header = app.config.get('IDENTITY_HEADER', 'X-Gateway-Identity')
+    key = app.config.get('IDENTITY_SIGNING_KEY')
+
+    @app.before_request
+    def authenticate():
+        request.user = None
+        identity = request.headers.get(header)
+        if not identity or not key:
+            return None
+        try:
+            claims = jwt.decode(identity, key, algorithms=['HS256'], issuer=IDENTITY_ISSUER,
+                                options={'require': ['iss']})
+            request.user = Identity(claims)
+        except jwt.ExpiredSignatureError:
+            return jsonify({"message": "Identity has expired."}), 401
+        except (jwt.InvalidTokenError, KeyError):
+            return jsonify({"message": "Identity is invalid."}), 401
+        return None
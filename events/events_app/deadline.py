@@ -0,0 +1,86 @@
+"""
+Request deadlines set by the gateway.
+
+The gateway sends the time by which it gives up on a request in DEADLINE_HEADER, as
+seconds since the epoch. init_app answers 504 without running the view when that time
+passed while the request was queued, and stops the request at its next SQL statement
+once it passes, so workers do not keep on with work nobody waits for. A request that
+has already written is let finish rather than stopped halfway.
+"""
+import math
+import time
+from contextvars import ContextVar
+from flask import g, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from .exceptions import DeadlineExceeded
+
+# Statements that leave the database as it was; any other one counts as a write.
+# The same as the users service's (userservice.deadline).
+READ_STATEMENTS = ('SELECT', 'SAVEPOINT', 'RELEASE', 'BEGIN', 'ROLLBACK')
+
+
+class QueryDeadline:
+    __slots__ = ('deadline', 'skew', 'wrote')
+
+    def __init__(self, deadline, skew):
+        self.deadline = deadline
+        self.skew = skew
+        self.wrote = False
+
+    @property
+    def expired(self):
+        return time.time() > self.deadline + self.skew
+
+
+current_deadline = ContextVar('current_deadline', default=None)
+
+
+def parse_deadline(value):
+    """Returns the deadline of a DEADLINE_HEADER value, None when missing or malformed."""
+    try:
+        deadline = float(value)
+    except (TypeError, ValueError):
+        return None
+    return deadline if math.isfinite(deadline) else None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    deadline = current_deadline.get()
+    if deadline is None:
+        return
+    if not deadline.wrote and deadline.expired:
+        raise DeadlineExceeded('Deadline exceeded.')
+    if not statement.lstrip()[:9].upper().startswith(READ_STATEMENTS):
+        deadline.wrote = True
+
+
+def init_app(app):
+    """Stops the requests of app whose deadline passed, before the view or at their next statement."""
+    header = app.config.get('DEADLINE_HEADER', 'X-Request-Deadline')
+    skew = app.config.get('DEADLINE_CLOCK_SKEW', 0)
+
+    @app.before_request
+    def start_deadline():
+        value = parse_deadline(request.headers.get(header))
+        if value is None:
+            return None
+        deadline = QueryDeadline(value, skew)
+        if deadline.expired:
+            return jsonify({"message": "Deadline exceeded."}), 504
+        g.deadline_token = current_deadline.set(deadline)
+        return None
+
+    @app.teardown_request
+    def end_deadline(exc):
+        token = g.pop('deadline_token', None)
+        if token is not None:
+            current_deadline.reset(token)
+
+    @app.errorhandler(DeadlineExceeded)
+    def deadline_exceeded(exc):
+        return jsonify({"message": str(exc)}), 504
+
+    # Global to every Engine: added once however many apps are set up.
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
@@ -0,0 +1,2 @@
+class DeadlineExceeded(Exception):
+    """Raised before a SQL statement of a request whose deadline has passed."""
@@ -1,8 +1,9 @@
 from marshmallow_sqlalchemy import SQLAlchemyAutoSchema
 from marshmallow import fields
 from . import models, db
+from .tracing import TracedSchemaMixin
 
-class EventSchema(SQLAlchemyAutoSchema):
+class EventSchema(TracedSchemaMixin, SQLAlchemyAutoSchema):
     class Meta:
         model = models.Event
         include_fk = True
@@ -20,7 +21,7 @@ class EventSchema(SQLAlchemyAutoSchema):
     def load_event_type(self, value):
         return models.EventType(value) 
 
-class EventAttendeeSchema(SQLAlchemyAutoSchema):
+class EventAttendeeSchema(TracedSchemaMixin, SQLAlchemyAutoSchema):
     class Meta:
         model = models.EventAttendee
         include_fk = True
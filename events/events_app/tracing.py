@@ -0,0 +1,201 @@
+"""
+W3C trace context for the events service.
+
+init_app continues the trace of the gateway from its traceparent header (or starts and
+samples one) and records a server span per request, a span per SQL statement and a span
+per marshmallow dump. Sampled spans are appended as JSON lines to TRACE_EXPORT_PATH in
+batches from a background thread.
+"""
+import os
+import json
+import time
+import random
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SERVICE_NAME = 'events'
+SAMPLED = 0x01
+
+
+def new_id(bits):
+    return format(random.getrandbits(bits) or 1, f'0{bits // 4}x')
+
+
+def parse_traceparent(value):
+    """Returns (trace_id, parent_id, sampled) of a valid traceparent header, otherwise None."""
+    parts = (value or '').strip().split('-')
+    if len(parts) < 4 or len(parts[0]) != 2 or parts[0] == 'ff' or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        flags = int(parts[3][:2], 16)
+        if not int(parts[1], 16) or not int(parts[2], 16):
+            return None
+    except ValueError:
+        return None
+    return parts[1].lower(), parts[2].lower(), bool(flags & SAMPLED)
+
+
+class Span:
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'sampled', 'name', 'kind', 'attributes', 'start', '_started')
+
+    def __init__(self, name, trace_id, parent_id, sampled, kind='internal'):
+        self.trace_id = trace_id
+        self.span_id = new_id(64)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.name = name
+        self.kind = kind
+        self.attributes = {}
+        self.start = time.time()
+        self._started = time.perf_counter()
+
+    @property
+    def traceparent(self):
+        return f'00-{self.trace_id}-{self.span_id}-{SAMPLED if self.sampled else 0:02x}'
+
+    def end(self):
+        if self.sampled:
+            exporter.export({
+                'trace_id': self.trace_id, 'span_id': self.span_id, 'parent_id': self.parent_id,
+                'service': SERVICE_NAME, 'name': self.name, 'kind': self.kind, 'start': self.start,
+                'duration_ms': round((time.perf_counter() - self._started) * 1000, 3),
+                'attributes': self.attributes,
+            })
+
+
+class BatchExporter:
+    """Appends finished spans to a JSON lines file every interval seconds or batch_size spans."""
+
+    def __init__(self, path='/tmp/traces/events.jsonl', batch_size=512, interval=5, max_queue=10000):
+        self.path = path
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_queue = max_queue
+        self._spans = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.dropped = 0
+
+    def export(self, span):
+        with self._lock:
+            if len(self._spans) >= self.max_queue:
+                self.dropped += 1
+                return
+            self._spans.append(span)
+            full = len(self._spans) >= self.batch_size
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+                self._thread.start()
+        if full:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            spans, self._spans = self._spans, []
+        if spans:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a') as export:
+                export.write(''.join(json.dumps(span, default=str) + '\n' for span in spans))
+
+
+exporter = BatchExporter()
+current_span = ContextVar('current_span', default=None)
+
+
+@contextmanager
+def span(name, kind='internal'):
+    """Times a child of the current span; yields None outside of a trace."""
+    parent = current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, parent.trace_id, parent.span_id, parent.sampled, kind)
+    token = current_span.set(child)
+    try:
+        yield child
+    finally:
+        current_span.reset(token)
+        child.end()
+
+
+class TracedSchemaMixin:
+    """Records each dump of a marshmallow schema as a serialize span."""
+
+    def dump(self, obj, *, many=None):
+        with span(f'serialize {type(self).__name__}'):
+            return super().dump(obj, many=many)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    parent = current_span.get()
+    if parent is not None and parent.sampled:
+        query = Span('db.query', parent.trace_id, parent.span_id, True, kind='client')
+        query.attributes['db.system'] = conn.dialect.name
+        query.attributes['db.statement'] = statement[:2000]
+        conn.info.setdefault('trace_queries', []).append(query)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    queries = conn.info.get('trace_queries')
+    if queries:
+        queries.pop().end()
+
+
+def _handle_error(context):
+    queries = context.connection.info.get('trace_queries') if context.connection is not None else None
+    if queries:
+        query = queries.pop()
+        query.attributes['error'] = type(context.original_exception).__name__
+        query.end()
+
+
+def init_app(app):
+    """Traces every request of app, and the SQL statements they run."""
+    exporter.path = app.config.get('TRACE_EXPORT_PATH', exporter.path)
+    exporter.batch_size = app.config.get('TRACE_BATCH_SIZE', exporter.batch_size)
+    exporter.interval = app.config.get('TRACE_EXPORT_INTERVAL', exporter.interval)
+    sample_rate = app.config.get('TRACE_SAMPLE_RATE', 0.01)
+
+    @app.before_request
+    def start_span():
+        parent = parse_traceparent(request.headers.get('traceparent'))
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id, sampled = new_id(128), None, random.random() < sample_rate
+        rule = request.url_rule.rule if request.url_rule is not None else request.path
+        g.trace_span = Span(f'{request.method} {rule}', trace_id, parent_id, sampled, kind='server')
+        g.trace_token = current_span.set(g.trace_span)
+
+    @app.after_request
+    def add_traceparent(response):
+        server = g.get('trace_span')
+        if server is not None:
+            server.attributes['http.status_code'] = response.status_code
+            response.headers['traceparent'] = server.traceparent
+        return response
+
+    @app.teardown_request
+    def end_span(exc):
+        server = g.pop('trace_span', None)
+        if server is not None:
+            current_span.reset(g.pop('trace_token'))
+            server.end()
+
+    # The listeners are global to every Engine: added once however many apps are set up.
+    for identifier, listener in (('before_cursor_execute', _before_cursor_execute),
+                                 ('after_cursor_execute', _after_cursor_execute),
+                                 ('handle_error', _handle_error)):
+        if not event.contains(Engine, identifier, listener):
+            event.listen(Engine, identifier, listener)
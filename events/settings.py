@@ -21,4 +21,10 @@ def get_app():
     migrate = Migrate(app, db, compare_type=True)
     from events_app import models
     from events_app import routes
+    from events_app import tracing
+    from events_app import deadline
+    from events_app import authentication
+    tracing.init_app(app)
+    deadline.init_app(app)
+    authentication.init_app(app)
     return app
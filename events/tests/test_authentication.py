@@ -0,0 +1,51 @@
+import time
+import jwt
+import pytest
+from flask import Flask, request
+from events_app import authentication
+from events_app.authentication import IDENTITY_ISSUER
+
+KEY = "identity-key-of-at-least-32-bytes!"
+
+
+def identity(key=KEY, **claims):
+    claims = {"iss": IDENTITY_ISSUER, "user_id": 5, "exp": int(time.time()) + 60, "permissions": ["events.add"],
+              **claims}
+    return jwt.encode({name: value for name, value in claims.items() if value is not None}, key, algorithm="HS256")
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.config["IDENTITY_SIGNING_KEY"] = KEY
+    authentication.init_app(app)
+
+    @app.route("/me")
+    def me():
+        user = request.user
+        return {"id": user.id, "add": user.has_perm("events.add")} if user is not None else {"id": None}
+
+    return app.test_client()
+
+
+def test_authenticated(client):
+    response = client.get("/me", headers={"X-Gateway-Identity": identity()})
+    assert response.get_json() == {"id": 5, "add": True}
+
+
+def test_anonymous(client):
+    assert client.get("/me").get_json() == {"id": None}
+
+
+@pytest.mark.parametrize("value, message", [
+    (identity(key="another-key-of-at-least-32-bytes!!"), "Identity is invalid."),
+    (identity(exp=int(time.time()) - 10), "Identity has expired."),
+    (identity(iss="someone-else"), "Identity is invalid."),
+    (identity(iss=None), "Identity is invalid."),
+    (identity(user_id=None), "Identity is invalid."),
+    ("not-an-identity", "Identity is invalid."),
+])
+def test_refused(client, value, message):
+    response = client.get("/me", headers={"X-Gateway-Identity": value})
+    assert response.status_code == 401
+    assert response.get_json() == {"message": message}
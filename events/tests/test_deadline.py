@@ -0,0 +1,85 @@
+import time
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine, text
+from events_app import deadline
+from events_app.deadline import QueryDeadline, current_deadline, parse_deadline
+
+HEADER = "X-Request-Deadline"
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE events (id INTEGER PRIMARY KEY)"))
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def client(engine):
+    app = Flask(__name__)
+    deadline.init_app(app)
+    deadline.init_app(Flask(__name__))  # Another app of the same process.
+    app.ran = []
+
+    @app.route("/work/<int:seconds_in>/<write>")
+    def work(seconds_in, write):
+        """Runs a statement, lets the request run seconds_in past its deadline, then runs another."""
+        app.ran.append(True)
+        with engine.begin() as connection:
+            connection.execute(text("INSERT INTO events DEFAULT VALUES" if write == "write" else "SELECT 1"))
+            time.sleep(seconds_in / 10)
+            connection.execute(text("SELECT COUNT(*) FROM events"))
+        return {"message": "done"}
+
+    return app.test_client()
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1700000000.250", 1700000000.25), (None, None), ("", None), ("soon", None), ("nan", None), ("inf", None),
+])
+def test_parse_deadline(value, expected):
+    assert parse_deadline(value) == expected
+
+
+def test_in_time(client):
+    response = client.get("/work/0/read", headers={HEADER: f"{time.time() + 60:.3f}"})
+    assert response.status_code == 200
+
+
+def test_expired_before_the_view(client):
+    response = client.get("/work/0/read", headers={HEADER: f"{time.time() - 1:.3f}"})
+    assert response.status_code == 504
+    assert response.get_json() == {"message": "Deadline exceeded."}
+    assert not client.application.ran
+
+
+def test_expired_at_the_next_statement(client):
+    response = client.get("/work/2/read", headers={HEADER: f"{time.time() + 0.1:.3f}"})
+    assert response.status_code == 504
+
+
+def test_writes_are_let_finish(client):
+    response = client.get("/work/2/write", headers={HEADER: f"{time.time() + 0.1:.3f}"})
+    assert response.status_code == 200
+
+
+def test_listener_added_once(client, engine):
+    checks = []
+
+    class Counting(QueryDeadline):
+        @property
+        def expired(self):
+            checks.append(True)
+            return False
+
+    token = current_deadline.set(Counting(time.time() + 60, 0))
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+    finally:
+        current_deadline.reset(token)
+    assert len(checks) == 1
+
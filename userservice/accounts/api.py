@@ -8,12 +8,15 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from .models import (User, UserDocument, Role, Department)
 from .serializers import (UserSerializer, UserListSerializer, UserDocumentSerializer, RoleSerializer,
          DepartmentSerializer, PermissionSerializer)
+from .pagination import UserCursorPagination
 
 class UserViewSet(viewsets.GenericViewSet, mixins.CreateModelMixin, mixins.ListModelMixin, 
                   mixins.RetrieveModelMixin):
     permission_classes = [IsAuthenticated]
-    queryset = User.objects.all()
+    # details is nested in every response; department and role are rendered from their ids.
+    queryset = User.objects.select_related('details')
     serializer_class = UserSerializer
+    pagination_class = UserCursorPagination
 
     def get_serializer_class(self):
         """Use different serializers for list, retrieve, create, and update."""
@@ -22,10 +25,10 @@ class UserViewSet(viewsets.GenericViewSet, mixins.CreateModelMixin, mixins.ListM
         return UserListSerializer
 
     def list(self, request):
-        """List all users."""
-        users = self.get_queryset()
+        """List users a page at a time; pass the next_cursor of a page as ?cursor= for the next one."""
+        users = self.paginate_queryset(self.get_queryset())
         serializer = self.get_serializer(users, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return self.get_paginated_response(serializer.data)
 
     def retrieve(self, request, pk=None):
         """Retrieve a single user along with details."""
@@ -85,7 +88,7 @@ class RoleViewSet(mixins.CreateModelMixin,
                   mixins.DestroyModelMixin,
                   viewsets.GenericViewSet):
     permission_classes = [IsAuthenticated]
-    queryset = Role.objects.all()
+    queryset = Role.objects.prefetch_related('permissions')
     serializer_class = RoleSerializer
 
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated], url_path='available-permissions')
@@ -104,5 +107,6 @@ class DepartmentViewSet(mixins.CreateModelMixin,
                   mixins.DestroyModelMixin,
                   viewsets.GenericViewSet):
     permission_classes = [IsAuthenticated]
-    queryset = Department.objects.all()
+    # parent_name reads the parent of each department.
+    queryset = Department.objects.select_related('parent')
     serializer_class = DepartmentSerializer
@@ -0,0 +1,47 @@
+"""
+Permission resolution cached in Django's cache framework, so the workers share it.
+
+ModelBackend resolves the permissions of a user with a query for their own and one for
+their groups' at every login and at the first permission check of each request.
+CachedPermissionBackend resolves the same permissions and keeps them in the cache, per
+user. accounts.signals drops the entries whose permissions or group memberships change;
+PERMISSION_CACHE_TIMEOUT bounds how long changes no signal reports (raw SQL, deleted
+permissions) go unseen.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+# Permissions of every superuser: all of them.
+SUPERUSER_KEY = 'permissions:superuser'
+
+
+def user_key(user_id):
+    return f'permissions:user:{user_id}'
+
+
+class CachedPermissionBackend(ModelBackend):
+    """ModelBackend resolving the permissions of users through the cache."""
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            user_obj._perm_cache = self.resolve(user_obj)
+        return user_obj._perm_cache
+
+    def resolve(self, user_obj):
+        """The permissions of an active user, queried only when they are not cached."""
+        if user_obj.is_superuser:
+            key, source = SUPERUSER_KEY, self.get_user_permissions
+        else:
+            key, source = user_key(user_obj.pk), self.get_own_permissions
+        permissions = cache.get(key)
+        if permissions is None:
+            permissions = source(user_obj)
+            cache.set(key, permissions, settings.PERMISSION_CACHE_TIMEOUT)
+        return permissions
+
+    def get_own_permissions(self, user_obj):
+        """Permissions of the user and of their groups."""
+        return {*self.get_user_permissions(user_obj), *self.get_group_permissions(user_obj)}
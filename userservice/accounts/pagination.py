@@ -0,0 +1,39 @@
+from urllib.parse import parse_qs, urlsplit
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class UserCursorPagination(CursorPagination):
+    """
+    Keyset pagination in primary key order: each page is a range scan of the primary
+    key index from the last id of the previous page, so any page costs the same however
+    many users there are. Cursors are opaque; page_limit is capped at max_page_size.
+    """
+    ordering = 'id'
+    page_size = 20
+    page_size_query_param = 'page_limit'
+    max_page_size = 100
+
+    def link_cursor(self, link):
+        """The cursor of a page link, without the host the service was reached on."""
+        if link is None:
+            return None
+        return parse_qs(urlsplit(link).query).get(self.cursor_query_param, [None])[0]
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next_cursor': self.link_cursor(self.get_next_link()),
+            'previous_cursor': self.link_cursor(self.get_previous_link()),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next_cursor': {'type': 'string', 'nullable': True},
+                'previous_cursor': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
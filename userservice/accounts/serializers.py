@@ -3,6 +3,7 @@ import random
 import string
 from rest_framework import serializers
 from django.contrib.auth.models import Permission
+from userservice.tracing import TracedSerializerMixin
 from .models import (User, UserDetail, UserDocument, Department, Role)
 
 def generate_random_password(length=12):
@@ -10,12 +11,12 @@ def generate_random_password(length=12):
     characters = string.ascii_letters + string.digits + string.punctuation
     return ''.join(random.choice(characters) for _ in range(length))
 
-class UserDetailSerializer(serializers.ModelSerializer):
+class UserDetailSerializer(TracedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = UserDetail
         fields = ["phone_number", "address", "date_of_birth"]
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TracedSerializerMixin, serializers.ModelSerializer):
     details = UserDetailSerializer(required=False)
     department = serializers.PrimaryKeyRelatedField(
         queryset=Department.objects.filter(parent=None), required=False, allow_null=True)
@@ -49,11 +50,12 @@ class UserSerializer(serializers.ModelSerializer):
         instance.save()
 
         if details_data:
-            UserDetail.objects.update_or_create(user=instance, defaults=details_data)
+            # Replaces the details the user was fetched with, so the response shows the update.
+            instance.details, _ = UserDetail.objects.update_or_create(user=instance, defaults=details_data)
 
         return instance
 
-class UserListSerializer(serializers.ModelSerializer):
+class UserListSerializer(TracedSerializerMixin, serializers.ModelSerializer):
     details = UserDetailSerializer(read_only=True)
 
     class Meta:
@@ -61,7 +63,7 @@ class UserListSerializer(serializers.ModelSerializer):
         fields = ["id", "username", "email", "first_name", "last_name", "department", "role", "details"]
 
 
-class UserDocumentSerializer(serializers.ModelSerializer):
+class UserDocumentSerializer(TracedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = UserDocument
         fields = ['id', 'user', 'document_type', 'document', 'document_name', 'is_deleted', 'created_at', 'uploaded_at']
@@ -96,19 +98,19 @@ class UserDocumentSerializer(serializers.ModelSerializer):
         return new_document
 
 
-class PermissionSerializer(serializers.ModelSerializer):
+class PermissionSerializer(TracedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Permission
         fields = ["id", "name", "codename", "content_type"]
 
-class RoleSerializer(serializers.ModelSerializer):
+class RoleSerializer(TracedSerializerMixin, serializers.ModelSerializer):
     permissions = serializers.PrimaryKeyRelatedField(queryset=Permission.objects.all(), many=True)
 
     class Meta:
         model = Role
         fields = ["id", "name", "permissions"]
 
-class DepartmentSerializer(serializers.ModelSerializer):
+class DepartmentSerializer(TracedSerializerMixin, serializers.ModelSerializer):
     parent_name = serializers.SerializerMethodField()
 
     class Meta:
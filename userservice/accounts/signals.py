@@ -0,0 +1,62 @@
+"""
+Drops the cached permissions (see accounts.backends) whose source changes: the
+permissions of a group or user, or the groups of a user.
+"""
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from .backends import SUPERUSER_KEY, user_key
+from .models import User
+
+# m2m_changed actions after which the cached permissions are out of date. A clear is
+# handled before it, while the rows it removes can still be found.
+CHANGES = ('post_add', 'post_remove', 'pre_clear')
+
+
+def invalidate(keys):
+    """
+    Deletes keys once the transaction commits, so no worker caches the permissions
+    being replaced again in the meantime.
+    """
+    keys = list(keys)
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def changed(instance, action, pk_set, related):
+    """pks of the objects on the other side of an m2m change of instance, reached by related."""
+    if action == 'pre_clear':
+        return set(getattr(instance, related).values_list('pk', flat=True))
+    return pk_set or set()
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in CHANGES:
+        return
+    groups = changed(instance, action, pk_set, 'group_set') if reverse else [instance.pk]
+    users = User.objects.filter(groups__in=groups).values_list('pk', flat=True).distinct()
+    invalidate(user_key(pk) for pk in users)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def user_permissions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in CHANGES:
+        return
+    users = changed(instance, action, pk_set, 'user_set') if reverse else [instance.pk]
+    invalidate(user_key(pk) for pk in users)
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    # Its memberships go with it without an m2m_changed.
+    invalidate(user_key(pk) for pk in instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+def permission_changed(sender, instance, **kwargs):
+    invalidate([SUPERUSER_KEY])
@@ -1,3 +1,170 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from itertools import count
+from django.contrib.auth.models import Group, Permission
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APITestCase
+from authentication.serializers import CustomTokenObtainPairSerializer
+from .models import User, UserDetail, UserDocument, Role, Department
 
-# Create your tests here.
+MEDIA_ROOT = tempfile.mkdtemp()
+serial = count()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class QueryCountTests(APITestCase):
+    """
+    Each endpoint runs a fixed number of queries however many rows it serves, so a
+    serializer field that queries once per row fails here. The numbers are the queries
+    of the view alone: requests are force authenticated.
+    """
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = self.add_user()
+        self.client.force_authenticate(self.user)
+
+    def add_user(self):
+        n = next(serial)
+        department = Department.objects.create(name=f"department{n}")
+        sub_department = Department.objects.create(name=f"sub-department{n}", parent=department)
+        role = Role.objects.create(name=f"role{n}")
+        role.permissions.set(Permission.objects.all()[:3])
+        user = User.objects.create(username=f"user{n}", email=f"user{n}@example.com", department=department,
+                                   sub_department=sub_department, role=role)
+        UserDetail.objects.create(user=user, phone_number="5550100", address="Street")
+        UserDocument.objects.create(user=user, document_type="other", document_name=f"document{n}",
+                                    document=SimpleUploadedFile(f"document{n}.txt", b"text"))
+        return user
+
+    def add_users(self, number=5):
+        for _ in range(number):
+            self.add_user()
+
+    def assertQueriesPerRequest(self, queries, request):
+        """Asserts request() runs queries queries, and still does once more rows exist."""
+        for _ in range(2):
+            with self.assertNumQueries(queries):
+                response = request()
+            self.assertLess(response.status_code, 300, response.content)
+            self.add_users()
+        return response
+
+    def test_list_users(self):
+        response = self.assertQueriesPerRequest(1, lambda: self.client.get("/api/accounts/users/?page_limit=100"))
+        self.assertEqual(len(response.json()["results"]), 6)
+
+    def test_retrieve_user(self):
+        self.assertQueriesPerRequest(1, lambda: self.client.get(f"/api/accounts/users/{self.user.pk}/"))
+
+    def test_update_user(self):
+        response = self.assertQueriesPerRequest(7, lambda: self.client.put(
+            f"/api/accounts/users/{self.user.pk}/",
+            {"first_name": "Updated", "role": self.user.role_id, "details": {"address": "Avenue"}}, format="json"))
+        self.assertEqual(response.json()["details"]["address"], "Avenue")
+
+    def test_list_roles(self):
+        response = self.assertQueriesPerRequest(2, lambda: self.client.get("/api/accounts/roles/"))
+        self.assertEqual(len(response.json()), 6)
+
+    def test_list_departments(self):
+        response = self.assertQueriesPerRequest(1, lambda: self.client.get("/api/accounts/departments/"))
+        self.assertEqual(len(response.json()), 12)
+
+    def test_available_permissions(self):
+        self.assertQueriesPerRequest(1, lambda: self.client.get("/api/accounts/roles/available-permissions/"))
+
+    def test_upload_document(self):
+        self.assertQueriesPerRequest(3, lambda: self.client.post(
+            "/api/accounts/user-documents/",
+            {"user": self.user.pk, "document_type": "other", "document": SimpleUploadedFile("cv.txt", b"text")},
+            format="multipart"))
+
+    def test_replace_document(self):
+        # Each replacement is a new document, which the next one replaces.
+        current = [self.user.documents.get().pk]
+
+        def replace():
+            response = self.client.patch(f"/api/accounts/user-documents/{current[0]}/",
+                                         {"document": SimpleUploadedFile("cv.txt", b"text")}, format="multipart")
+            current[0] = response.json()["id"]
+            return response
+        self.assertQueriesPerRequest(4, replace)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class PermissionCacheTests(TestCase):
+    """Permissions are resolved from the cache until a change to them drops it."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.permissions = list(Permission.objects.order_by("pk")[:4])
+        cls.group = Group.objects.create(name="reviewers")
+        cls.group.permissions.set(cls.permissions[2:3])
+        cls.user = User.objects.create(username="editor", email="editor@example.com")
+        cls.user.user_permissions.set(cls.permissions[:2])
+
+    def setUp(self):
+        cache.clear()
+
+    def permissions_of(self, user=None):
+        """The permissions of a freshly loaded user, as at the start of a request."""
+        user = User.objects.get(pk=(user or self.user).pk)
+        return user.get_all_permissions()
+
+    def names(self, *permissions):
+        return {f"{permission.content_type.app_label}.{permission.codename}" for permission in permissions}
+
+    def assertPermissions(self, *permissions):
+        self.assertEqual(self.permissions_of(), self.names(*permissions))
+
+    def test_resolved_once(self):
+        self.assertPermissions(*self.permissions[:2])
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_perm(next(iter(self.names(self.permissions[0])))))
+
+    def test_token_claims_permissions(self):
+        token = CustomTokenObtainPairSerializer(data={}).get_token(self.user)
+        self.assertEqual(set(token["permissions"]), self.names(*self.permissions[:2]))
+
+    def test_role_grants_nothing(self):
+        # As with ModelBackend, only the user's own and their groups' permissions count.
+        role = Role.objects.create(name="editor")
+        role.permissions.set(self.permissions[3:])
+        User.objects.filter(pk=self.user.pk).update(role=role)
+        self.assertPermissions(*self.permissions[:2])
+
+    def test_user_permissions_changed(self):
+        self.assertPermissions(*self.permissions[:2])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.user_permissions.add(self.permissions[3])
+        self.assertPermissions(self.permissions[0], self.permissions[1], self.permissions[3])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.permissions[0].user_set.clear()
+        self.assertPermissions(self.permissions[1], self.permissions[3])
+
+    def test_group_membership_changed(self):
+        self.assertPermissions(*self.permissions[:2])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.user_set.add(self.user)
+        self.assertPermissions(*self.permissions[:3])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.permissions.add(self.permissions[3])
+        self.assertPermissions(*self.permissions)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.delete()
+        self.assertPermissions(*self.permissions[:2])
+
+    def test_superuser(self):
+        User.objects.filter(pk=self.user.pk).update(is_superuser=True)
+        self.assertEqual(len(self.permissions_of()), Permission.objects.count())
+        with self.captureOnCommitCallbacks(execute=True):
+            Permission.objects.create(codename="extra", name="Extra", content_type=self.permissions[0].content_type)
+        self.assertEqual(len(self.permissions_of()), Permission.objects.count())
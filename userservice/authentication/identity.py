@@ -0,0 +1,77 @@
+import jwt
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.contrib.auth import get_user_model
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+# Issuer of the identities the gateway signs.
+IDENTITY_ISSUER = 'api-gateway'
+
+
+def active_key(user_id):
+    return f'identity:active:{user_id}'
+
+
+def is_active_user(user_id):
+    """
+    Whether the user exists and is active, from the cache when possible. authentication.signals
+    drops the entry when the user is saved or deleted.
+    """
+    key = active_key(user_id)
+    active = cache.get(key)
+    if active is None:
+        active = get_user_model().objects.filter(pk=user_id, is_active=True).exists()
+        cache.set(key, active, settings.PERMISSION_CACHE_TIMEOUT)
+    return active
+
+
+def identity_user(claims):
+    """
+    The user of the identity claims, without a query. Only the fields that authorize a
+    request are loaded, from the claims; any other field is fetched on first access.
+    Permissions come from the claims too, so has_perm does not query either. Save it
+    with update_fields, so claim values are never written back over the row.
+    """
+    User = get_user_model()
+    loaded = {'id': claims['user_id'], 'is_active': True, 'is_superuser': bool(claims.get('is_superuser'))}
+    # from_db takes the values in the order of the model's fields.
+    fields = [field.attname for field in User._meta.concrete_fields if field.attname in loaded]
+    user = User.from_db(DEFAULT_DB_ALIAS, fields, [loaded[name] for name in fields])
+    user._perm_cache = set(claims.get('permissions') or ())
+    return user
+
+
+class GatewayIdentityAuthentication(BaseAuthentication):
+    """
+    Authenticates requests by the identity the gateway forwards in IDENTITY_HEADER once
+    it has verified their bearer token, signed with IDENTITY_SIGNING_KEY. Requests
+    without it fall through to the next authentication class.
+    """
+
+    def authenticate(self, request):
+        identity = request.headers.get(settings.IDENTITY_HEADER)
+        if not identity or not settings.IDENTITY_SIGNING_KEY:
+            return None
+        try:
+            claims = jwt.decode(identity, settings.IDENTITY_SIGNING_KEY, algorithms=['HS256'],
+                                issuer=IDENTITY_ISSUER, options={'require': ['iss']})
+        except jwt.ExpiredSignatureError:
+            raise AuthenticationFailed(_('Identity has expired.'), code='identity_expired')
+        except jwt.InvalidTokenError:
+            raise AuthenticationFailed(_('Identity is invalid.'), code='identity_invalid')
+        if claims.get('user_id') is None:
+            raise AuthenticationFailed(_('Identity has no user.'), code='identity_invalid')
+        try:
+            active = is_active_user(claims['user_id'])
+        except (ValueError, TypeError):
+            raise AuthenticationFailed(_('Identity is invalid.'), code='identity_invalid')
+        if not active:
+            # Deleted or deactivated since the gateway's token was issued.
+            raise AuthenticationFailed(_('User is inactive or deleted.'), code='user_inactive')
+        return identity_user(claims), claims
+
+    def authenticate_header(self, request):
+        return 'Bearer'
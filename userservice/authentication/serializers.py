@@ -56,6 +56,7 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         token['permissions'] = [str(permission) for permission in user.get_all_permissions()]
         token['email'] = user.email
         token['id'] = user.id
+        token['is_superuser'] = user.is_superuser
 
         # Adjust token lifetime if "remember_me" is true
         if self.initial_data.get('remember_me'):
@@ -157,7 +158,7 @@ class ChangePasswordSerializer(serializers.Serializer):
         
         # Update the user's password
         user.set_password(new_password)
-        user.save()
+        user.save(update_fields=['password'])
         return user
 
 class LogoutSerializer(serializers.Serializer):
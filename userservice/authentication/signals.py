@@ -0,0 +1,18 @@
+"""
+Drops the cached activity of users (see authentication.identity.is_active_user) when
+they are saved or deleted.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from accounts.models import User
+from .identity import active_key
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    # Once the transaction commits, so no worker caches the old state again in the meantime.
+    key = active_key(instance.pk)
+    transaction.on_commit(lambda: cache.delete(key))
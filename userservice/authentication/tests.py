@@ -1,3 +1,72 @@
-from django.test import TestCase
+import time
+import jwt
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework.test import APITestCase
+from accounts.models import User
+from .identity import IDENTITY_ISSUER
 
-# Create your tests here.
+IDENTITY_KEY = 'identity-key-of-at-least-32-bytes!'
+
+
+@override_settings(IDENTITY_SIGNING_KEY=IDENTITY_KEY,
+                   CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class GatewayIdentityTests(APITestCase):
+    """Requests are authenticated by the identity the gateway signs, of a user who still may sign in."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='caller', email='caller@example.com')
+
+    def setUp(self):
+        cache.clear()
+
+    def identity(self, key=IDENTITY_KEY, **claims):
+        claims = {'iss': IDENTITY_ISSUER, 'user_id': self.user.pk, 'exp': int(time.time()) + 60,
+                  'permissions': ['accounts.view_role'], **claims}
+        claims = {name: value for name, value in claims.items() if value is not None}
+        return jwt.encode(claims, key, algorithm='HS256')
+
+    def get(self, identity):
+        return self.client.get('/api/accounts/roles/', HTTP_X_GATEWAY_IDENTITY=identity)
+
+    def test_authenticated_from_claims(self):
+        self.get(self.identity())
+        # Once the user is known to be active, neither they nor their permissions are queried.
+        with self.assertNumQueries(1):  # The roles of the view.
+            response = self.get(self.identity())
+        self.assertEqual(response.status_code, 200)
+        user = response.wsgi_request.user
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(user.get_all_permissions(), {'accounts.view_role'})
+
+    def test_refused(self):
+        inactive = User.objects.create(username='gone', email='gone@example.com', is_active=False)
+        for name, identity in {
+            'forged': self.identity(key='another-key-of-at-least-32-bytes!!'),
+            'expired': self.identity(exp=int(time.time()) - 10),
+            'wrong issuer': self.identity(iss='someone-else'),
+            'no issuer': self.identity(iss=None),
+            'no user': self.identity(user_id=None),
+            'malformed user': self.identity(user_id='me'),
+            'deleted user': self.identity(user_id=User.objects.order_by('pk').last().pk + 100),
+            'inactive user': self.identity(user_id=inactive.pk),
+        }.items():
+            with self.subTest(name):
+                response = self.get(identity)
+                self.assertEqual(response.status_code, 401)
+                self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+
+    def test_deactivated_after_caching(self):
+        self.assertEqual(self.get(self.identity()).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.get(self.identity()).status_code, 401)
+
+    def test_deleted_after_caching(self):
+        user = User.objects.create(username='leaving', email='leaving@example.com')
+        self.assertEqual(self.get(self.identity(user_id=user.pk)).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.delete()
+        self.assertEqual(self.get(self.identity(user_id=user.pk)).status_code, 401)
@@ -0,0 +1,117 @@
+"""
+Latency of permission resolution at login and at the first permission check of a request.
+
+Sets up a user with permissions of their own and of their groups in a scratch SQLite
+database and measures, for each mode:
+
+    token      CustomTokenObtainPairSerializer.get_token, which claims all permissions
+    has_perm   the first has_perm of a freshly loaded user, as at the start of a request
+    login      POST /api/auth/token/, password hashing included
+
+Modes are "model" (django's ModelBackend, as before CachedPermissionBackend), "uncached"
+(CachedPermissionBackend resolving every time, through a DummyCache) and "cached"
+(CachedPermissionBackend with the cache warm, the configured cache backend in a scratch
+location). Prints one JSON line per mode and operation with
+the p50/p99 latency and the queries of one call.
+
+    python -m benchmarks.permissions --requests 200
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "userservice.settings")
+
+PASSWORD = "bench-password-1"
+
+
+def setup(directory: str):
+    import django
+    from django.conf import settings
+    settings.DATABASES["default"]["NAME"] = os.path.join(directory, "db.sqlite3")
+    settings.CACHES["default"]["LOCATION"] = os.path.join(directory, "cache")
+    django.setup()
+    from django.core.management import call_command
+    call_command("migrate", verbosity=0)
+
+
+def create_user(groups: int, per_group: int, own: int):
+    from django.contrib.auth.models import Group, Permission
+    from accounts.models import User
+    permissions = list(Permission.objects.order_by("pk"))
+    user = User.objects.create_user(username="bench", email="bench@example.com", password=PASSWORD)
+    user.user_permissions.set(permissions[-own:])
+    for n in range(groups):
+        group = Group.objects.create(name=f"bench{n}")
+        group.permissions.set(permissions[n * per_group:(n + 1) * per_group])
+        group.user_set.add(user)
+    return user
+
+
+def measure(call, requests: int) -> dict:
+    from django.db import connection, reset_queries
+    from django.test.utils import CaptureQueriesContext
+    latencies = []
+    call()  # Warms the cache, where there is one.
+    for _ in range(requests):
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            call()
+            latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return {
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 3),
+        "queries": len(queries.captured_queries),
+    }
+
+
+def main(args):
+    setup(tempfile.mkdtemp(prefix="permissions-"))
+    from django.conf import settings
+    from django.test import Client, override_settings
+    from accounts.models import User
+    from authentication.serializers import CustomTokenObtainPairSerializer
+
+    user = create_user(args.groups, args.per_group, args.own)
+    client = Client()
+
+    def token():
+        CustomTokenObtainPairSerializer(data={}).get_token(User.objects.get(pk=user.pk))
+
+    def has_perm():
+        User.objects.get(pk=user.pk).has_perm("auth.view_group")
+
+    def login():
+        response = client.post("/api/auth/token/", {"username": "bench", "password": PASSWORD},
+                               content_type="application/json")
+        assert response.status_code == 200, response.content[:200]
+
+    modes = {
+        "model": {"AUTHENTICATION_BACKENDS": ["django.contrib.auth.backends.ModelBackend"]},
+        "uncached": {"CACHES": {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}},
+        "cached": {"CACHES": settings.CACHES},
+    }
+    for mode, overrides in modes.items():
+        with override_settings(**overrides):
+            for operation, call, requests in (("token", token, args.requests), ("has_perm", has_perm, args.requests),
+                                              ("login", login, args.logins)):
+                permissions = len(User.objects.get(pk=user.pk).get_all_permissions())
+                line = {"mode": mode, "operation": operation, "permissions": permissions}
+                print(json.dumps({**line, **measure(call, requests)}), flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", default=200, type=int, help="Calls per mode of token and has_perm")
+    parser.add_argument("--logins", default=20, type=int, help="Logins per mode; each one hashes the password")
+    parser.add_argument("--groups", default=2, type=int, help="Groups of the user")
+    parser.add_argument("--per-group", default=10, type=int, help="Permissions of each group")
+    parser.add_argument("--own", default=5, type=int, help="Permissions of the user")
+    main(parser.parse_args())
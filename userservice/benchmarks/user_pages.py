@@ -0,0 +1,124 @@
+"""
+Latency of a page of GET /api/accounts/users/ as the user table grows.
+
+Fills a scratch SQLite database with users up to each --sizes step and requests the
+first, middle and last page of the list view through the full DRF stack, paged by
+its cursor (keyset) pagination and, for comparison, by offset pagination at the same
+position. Prints one JSON line per table size, mode and page with the p50/p99 latency
+and the number of queries of a page.
+
+    python -m benchmarks.user_pages --sizes 10000,100000,1000000 --page-limit 20
+
+Keep the database with --database to rerun without filling it again.
+"""
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import tempfile
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "userservice.settings")
+
+
+def setup(database: str):
+    import django
+    from django.conf import settings
+    settings.DATABASES["default"]["NAME"] = database
+    django.setup()
+    from django.core.management import call_command
+    call_command("migrate", verbosity=0)
+
+
+def fill(count: int, batch: int = 10000):
+    """Adds users until there are count of them; passwords are unusable, so no hashing."""
+    from accounts.models import User
+    existing = User.objects.count()
+    for start in range(existing, count, batch):
+        User.objects.bulk_create([
+            User(username=f"user{n}", email=f"user{n}@example.com", first_name="Bench", last_name=str(n),
+                 password="!")
+            for n in range(start, min(start + batch, count))
+        ])
+
+
+def keyset_cursor(position: int) -> str:
+    """The opaque cursor DRF CursorPagination gives the page after the user with id position."""
+    return base64.b64encode(urlencode({"p": position}).encode("ascii")).decode("ascii")
+
+
+def measure(view, path: str, params: dict, user, requests: int) -> dict:
+    from django.db import connection, reset_queries
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    factory = APIRequestFactory()
+    latencies = []
+    for _ in range(requests):
+        # The query log is bounded; once filling the table has filled it, nothing is captured.
+        reset_queries()
+        request = factory.get(path, params)
+        force_authenticate(request, user=user)
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = view(request)
+            response.render()
+            latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.content[:200]
+    latencies.sort()
+    return {
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 3),
+        "queries": len(queries.captured_queries),
+    }
+
+
+def main(args):
+    database = args.database or os.path.join(tempfile.mkdtemp(prefix="user-pages-"), "db.sqlite3")
+    setup(database)
+    from rest_framework.pagination import LimitOffsetPagination
+    from accounts.api import UserViewSet
+    from accounts.models import User
+
+    class OffsetUserViewSet(UserViewSet):
+        pagination_class = LimitOffsetPagination
+
+    keyset = UserViewSet.as_view({"get": "list"})
+    offset = OffsetUserViewSet.as_view({"get": "list"})
+    path = "/api/accounts/users/"
+
+    for size in sorted(int(size) for size in args.sizes.split(",")):
+        started = time.perf_counter()
+        fill(size)
+        fill_seconds = round(time.perf_counter() - started, 1)
+        ids = User.objects.order_by("id").values_list("id", flat=True)
+        user = User.objects.order_by("id").first()
+        positions = {
+            "first": 0,
+            "middle": size // 2,
+            "last": size - args.page_limit,
+        }
+        for page, position in positions.items():
+            # The id the page after which starts at position.
+            after = ids[position - 1] if position else None
+            params = {"page_limit": args.page_limit}
+            if after is not None:
+                params["cursor"] = keyset_cursor(after)
+            line = {"users": size, "mode": "keyset", "page": page, "fill_s": fill_seconds}
+            print(json.dumps({**line, **measure(keyset, path, params, user, args.requests)}), flush=True)
+
+            params = {"limit": args.page_limit, "offset": position}
+            line = {"users": size, "mode": "offset", "page": page, "fill_s": fill_seconds}
+            print(json.dumps({**line, **measure(offset, path, params, user, args.requests)}), flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma separated user counts to measure at")
+    parser.add_argument("--page-limit", default=20, type=int)
+    parser.add_argument("--requests", default=50, type=int, help="Requests per page and mode")
+    parser.add_argument("--database", help="SQLite file to fill and keep, a scratch one by default")
+    main(parser.parse_args())
@@ -3,4 +3,10 @@
 
 python manage.py makemigrations
 python manage.py migrate
+
+# On the same host as the gateway, listen on a Unix socket instead of TCP:
+# UNIX_SOCKET=/run/sockets/userservice.sock, and USERS_SERVICE_URL=unix:/run/sockets/userservice.sock for the gateway.
+if [ -n "${UNIX_SOCKET}" ]; then
+    exec gunicorn userservice.wsgi:application --bind unix:${UNIX_SOCKET} --workers ${WORKERS:-4}
+fi
 python manage.py runserver 0.0.0.0:${PORT}
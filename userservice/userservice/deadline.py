@@ -0,0 +1,82 @@
+"""
+Request deadlines set by the gateway.
+
+The gateway sends the time by which it gives up on a request in DEADLINE_HEADER, as
+seconds since the epoch. DeadlineMiddleware answers 504 without running the view when
+that time passed while the request was queued, and stops the request at its next
+database query once it passes, so workers do not keep on with work nobody waits for.
+A request that has already written is let finish rather than stopped halfway.
+"""
+import math
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+# Statements that leave the database as it was; any other one counts as a write.
+# The same as the events service's (events_app.deadline).
+READ_STATEMENTS = ('SELECT', 'SAVEPOINT', 'RELEASE', 'BEGIN', 'ROLLBACK')
+
+
+class DeadlineExceeded(APIException):
+    status_code = status.HTTP_504_GATEWAY_TIMEOUT
+    default_detail = 'Deadline exceeded.'
+    default_code = 'deadline_exceeded'
+
+
+def parse_deadline(value):
+    """Returns the deadline of a DEADLINE_HEADER value, None when missing or malformed."""
+    try:
+        deadline = float(value)
+    except (TypeError, ValueError):
+        return None
+    return deadline if math.isfinite(deadline) else None
+
+
+def expired(deadline):
+    return time.time() > deadline + settings.DEADLINE_CLOCK_SKEW
+
+
+class QueryDeadline:
+    """Database execute wrapper raising DeadlineExceeded before a query once the deadline passed."""
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self.wrote = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if not self.wrote and expired(self.deadline):
+            raise DeadlineExceeded()
+        if not sql.lstrip()[:9].upper().startswith(READ_STATEMENTS):
+            self.wrote = True
+        return execute(sql, params, many, context)
+
+
+class DeadlineMiddleware:
+    """Stops requests whose deadline passed, before the view or at their next query."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        deadline = parse_deadline(request.headers.get(settings.DEADLINE_HEADER))
+        if deadline is None:
+            return self.get_response(request)
+        if expired(deadline):
+            return JsonResponse({'detail': DeadlineExceeded.default_detail}, status=DeadlineExceeded.status_code)
+
+        with ExitStack() as stack:
+            wrapper = QueryDeadline(deadline)
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(wrapper))
+            return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        # DRF views answer DeadlineExceeded themselves; this covers the others.
+        if isinstance(exception, DeadlineExceeded):
+            return JsonResponse({'detail': str(exception.detail)}, status=exception.status_code)
+        return None
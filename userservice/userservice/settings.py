@@ -46,9 +46,18 @@ INSTALLED_APPS = [
 
 AUTH_USER_MODEL = 'accounts.User'
 
+# ModelBackend with the permissions it resolves cached (see accounts.backends).
+AUTHENTICATION_BACKENDS = ['accounts.backends.CachedPermissionBackend']
+
 
 MIDDLEWARE = [
+    # First, so its span covers the other middleware too.
+    'userservice.tracing.TracingMiddleware',
+    # Before anything that may query, so expired requests are dropped untouched.
+    'userservice.deadline.DeadlineMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Compresses responses for clients (the gateway) that accept gzip.
+    'django.middleware.gzip.GZipMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -109,6 +118,8 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
+        # Callers the gateway has already verified, without decoding their token or loading the user.
+        'authentication.identity.GatewayIdentityAuthentication',
         'rest_framework_simplejwt.authentication.JWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
@@ -120,11 +131,43 @@ REST_FRAMEWORK = {
     #     'rest_framework.renderers.AdminRenderer',
     #     'rest_framework.renderers.JSONRenderer',
     # ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'userservice.tracing.TracedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
     'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.coreapi.AutoSchema',
     'TEST_REQUEST_DEFAULT_FORMAT': 'json'
 }
 
 
+# Tracing (see userservice.tracing): W3C traceparent from the gateway, spans exported as JSON lines.
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0.01'))  # For requests without a traceparent.
+TRACE_EXPORT_PATH = os.environ.get('TRACE_EXPORT_PATH', '/tmp/traces/userservice.jsonl')
+TRACE_BATCH_SIZE = 512
+TRACE_EXPORT_INTERVAL = 5
+TRACE_MAX_QUEUE = 10000
+TRACE_MAX_STATEMENT_LENGTH = 2000
+
+# Deadlines (see userservice.deadline): work the gateway has given up on is stopped.
+DEADLINE_HEADER = 'X-Request-Deadline'
+DEADLINE_CLOCK_SKEW = float(os.environ.get('DEADLINE_CLOCK_SKEW', '0'))  # Seconds this host's clock may run ahead of the gateway's.
+
+# Identity of verified callers forwarded by the gateway (see authentication.identity), signed
+# with a key shared with it. Empty ignores the header and every token is verified here.
+IDENTITY_HEADER = 'X-Gateway-Identity'
+IDENTITY_SIGNING_KEY = os.environ.get('IDENTITY_SIGNING_KEY', '')
+
+# Shared by the workers of a host; point it at a cache server, e.g. CACHE_BACKEND=
+# django.core.cache.backends.redis.RedisCache with redis installed, to share it across hosts.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', '/tmp/userservice-cache'),
+    }
+}
+PERMISSION_CACHE_TIMEOUT = int(os.environ.get('PERMISSION_CACHE_TIMEOUT', '300'))  # Seconds, for changes no signal reports.
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
 
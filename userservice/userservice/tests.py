@@ -0,0 +1,95 @@
+import time
+from unittest import mock
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APITestCase
+from accounts.models import Role, User
+from .deadline import DeadlineExceeded, QueryDeadline, parse_deadline
+from .tracing import exporter
+
+
+class ParseDeadlineTests(SimpleTestCase):
+
+    def test_parse(self):
+        self.assertEqual(parse_deadline('1700000000.250'), 1700000000.25)
+        for value in (None, '', 'soon', 'nan', 'inf', '-inf'):
+            with self.subTest(value=value):
+                self.assertIsNone(parse_deadline(value))
+
+
+class QueryDeadlineTests(TestCase):
+    """Queries are stopped once the deadline passed, unless the request already wrote."""
+
+    def run_query(self, wrapper, sql='SELECT 1'):
+        with connection.execute_wrapper(wrapper), connection.cursor() as cursor:
+            cursor.execute(sql)
+
+    def test_stops_queries_after_deadline(self):
+        wrapper = QueryDeadline(time.time() + 60)
+        self.run_query(wrapper)
+        with mock.patch('userservice.deadline.time.time', return_value=time.time() + 120):
+            with self.assertRaises(DeadlineExceeded):
+                self.run_query(wrapper)
+
+    def test_lets_writes_finish(self):
+        wrapper = QueryDeadline(time.time() + 60)
+        self.run_query(wrapper, "UPDATE django_content_type SET model = model WHERE id = 0")
+        self.assertTrue(wrapper.wrote)
+        with mock.patch('userservice.deadline.time.time', return_value=time.time() + 120):
+            self.run_query(wrapper)
+
+    def test_transaction_statements_are_reads(self):
+        wrapper = QueryDeadline(time.time() + 60)
+        for sql in ('SAVEPOINT "s1"', 'RELEASE SAVEPOINT "s1"', 'SELECT 1'):
+            self.run_query(wrapper, sql)
+        self.assertFalse(wrapper.wrote)
+
+
+class DeadlineMiddlewareTests(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create(username='deadline', email='deadline@example.com'))
+        Role.objects.create(name='reader')
+
+    def get(self, deadline):
+        return self.client.get('/api/accounts/roles/', HTTP_X_REQUEST_DEADLINE=deadline)
+
+    def test_in_time(self):
+        self.assertEqual(self.get(f'{time.time() + 60:.3f}').status_code, 200)
+
+    def test_malformed_deadline_is_ignored(self):
+        self.assertEqual(self.get('soon').status_code, 200)
+
+    def test_expired_before_the_view(self):
+        with self.assertNumQueries(0):
+            response = self.get(f'{time.time() - 1:.3f}')
+        self.assertEqual(response.status_code, 504)
+        self.assertEqual(response.json(), {'detail': 'Deadline exceeded.'})
+
+    def test_expired_during_the_view(self):
+        # In time when the request arrives, out of time by its first query.
+        with mock.patch('userservice.deadline.expired', side_effect=[False, True]):
+            response = self.get(f'{time.time() + 60:.3f}')
+        self.assertEqual(response.status_code, 504)
+
+
+class TracingTests(APITestCase):
+    """Sampled requests record the evaluation of their serializer data apart from rendering it."""
+
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create(username='traced', email='traced@example.com'))
+        Role.objects.create(name='reader')
+
+    def test_serialization_spans(self):
+        traceparent = '00-' + 'a' * 32 + '-' + 'b' * 16 + '-01'
+        with mock.patch.object(exporter, 'export') as export:
+            self.assertEqual(self.client.get('/api/accounts/roles/', HTTP_TRACEPARENT=traceparent).status_code, 200)
+        exported = [call.args[0] for call in export.call_args_list]
+        spans = {span['kind'] if span['kind'] == 'server' else span['name']: span for span in exported}
+
+        server = spans['server']
+        self.assertEqual(spans['serialize']['parent_id'], server['span_id'])
+        self.assertEqual(spans['serialize']['attributes']['serializer'], 'RoleSerializer')
+        self.assertEqual(spans['render']['parent_id'], server['span_id'])
+        # The permissions of each role are read while its data is evaluated.
+        self.assertIn(spans['serialize']['span_id'], [span['parent_id'] for span in exported if span['name'] == 'db.query'])
@@ -0,0 +1,203 @@
+"""
+W3C trace context for the users service.
+
+TracingMiddleware continues the trace of the gateway from its traceparent header (or
+starts and samples one) and records a server span per request, a span per database
+query, a span for evaluating the serializer data of the response (TracedSerializerMixin)
+and one for rendering it. Sampled spans are appended as JSON lines
+to TRACE_EXPORT_PATH in batches from a background thread.
+"""
+import os
+import json
+import time
+import random
+import threading
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+
+SERVICE_NAME = 'userservice'
+SAMPLED = 0x01
+
+
+def new_id(bits):
+    return format(random.getrandbits(bits) or 1, f'0{bits // 4}x')
+
+
+def parse_traceparent(value):
+    """Returns (trace_id, parent_id, sampled) of a valid traceparent header, otherwise None."""
+    parts = (value or '').strip().split('-')
+    if len(parts) < 4 or len(parts[0]) != 2 or parts[0] == 'ff' or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        flags = int(parts[3][:2], 16)
+        if not int(parts[1], 16) or not int(parts[2], 16):
+            return None
+    except ValueError:
+        return None
+    return parts[1].lower(), parts[2].lower(), bool(flags & SAMPLED)
+
+
+class Span:
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'sampled', 'name', 'kind', 'attributes', 'start', '_started')
+
+    def __init__(self, name, trace_id, parent_id, sampled, kind='internal'):
+        self.trace_id = trace_id
+        self.span_id = new_id(64)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.name = name
+        self.kind = kind
+        self.attributes = {}
+        self.start = time.time()
+        self._started = time.perf_counter()
+
+    @property
+    def traceparent(self):
+        return f'00-{self.trace_id}-{self.span_id}-{SAMPLED if self.sampled else 0:02x}'
+
+    def end(self):
+        if self.sampled:
+            exporter.export({
+                'trace_id': self.trace_id, 'span_id': self.span_id, 'parent_id': self.parent_id,
+                'service': SERVICE_NAME, 'name': self.name, 'kind': self.kind, 'start': self.start,
+                'duration_ms': round((time.perf_counter() - self._started) * 1000, 3),
+                'attributes': self.attributes,
+            })
+
+
+class BatchExporter:
+    """Appends finished spans to TRACE_EXPORT_PATH every TRACE_EXPORT_INTERVAL seconds or TRACE_BATCH_SIZE spans."""
+
+    def __init__(self):
+        self._spans = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.dropped = 0
+
+    def export(self, span):
+        with self._lock:
+            if len(self._spans) >= settings.TRACE_MAX_QUEUE:
+                self.dropped += 1
+                return
+            self._spans.append(span)
+            full = len(self._spans) >= settings.TRACE_BATCH_SIZE
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+                self._thread.start()
+        if full:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(settings.TRACE_EXPORT_INTERVAL)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            spans, self._spans = self._spans, []
+        if spans:
+            os.makedirs(os.path.dirname(settings.TRACE_EXPORT_PATH) or '.', exist_ok=True)
+            with open(settings.TRACE_EXPORT_PATH, 'a') as export:
+                export.write(''.join(json.dumps(span, default=str) + '\n' for span in spans))
+
+
+exporter = BatchExporter()
+current_span = ContextVar('current_span', default=None)
+
+
+@contextmanager
+def span(name, kind='internal'):
+    """Times a child of the current span; yields None outside of a trace."""
+    parent = current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, parent.trace_id, parent.span_id, parent.sampled, kind)
+    token = current_span.set(child)
+    try:
+        yield child
+    finally:
+        current_span.reset(token)
+        child.end()
+
+
+def trace_query(execute, sql, params, many, context):
+    """Database execute wrapper recording each query as a span."""
+    parent = current_span.get()
+    if parent is None or not parent.sampled:
+        return execute(sql, params, many, context)
+    with span('db.query', kind='client') as query:
+        query.attributes['db.system'] = context['connection'].vendor
+        query.attributes['db.statement'] = sql[:settings.TRACE_MAX_STATEMENT_LENGTH]
+        return execute(sql, params, many, context)
+
+
+class TracingMiddleware:
+    """Records the server span of each request, with its database queries as children."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        parent = parse_traceparent(request.headers.get('traceparent'))
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id, sampled = new_id(128), None, random.random() < settings.TRACE_SAMPLE_RATE
+        server = Span(f'{request.method} {request.path}', trace_id, parent_id, sampled, kind='server')
+
+        token = current_span.set(server)
+        try:
+            with ExitStack() as stack:
+                if sampled:
+                    for connection in connections.all():
+                        stack.enter_context(connection.execute_wrapper(trace_query))
+                response = self.get_response(request)
+            if getattr(request, 'resolver_match', None) is not None:
+                server.name = f'{request.method} {request.resolver_match.route}'
+            server.attributes['http.status_code'] = response.status_code
+            response['traceparent'] = server.traceparent
+            return response
+        finally:
+            current_span.reset(token)
+            server.end()
+
+
+class TracedSerializerMixin:
+    """
+    Records the evaluation of a serializer's data as a span: the fields, nested serializers
+    and related objects it reads, with their queries as children. Serializers of many=True
+    get a TracedListSerializer unless their Meta names a list_serializer_class.
+    """
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        meta = cls.__dict__.get('Meta')
+        if meta is not None and not hasattr(meta, 'list_serializer_class'):
+            meta.list_serializer_class = TracedListSerializer
+
+    @property
+    def data(self):
+        with span('serialize') as serialize:
+            if serialize is not None:
+                serialize.attributes['serializer'] = type(getattr(self, 'child', self)).__name__
+            return super().data
+
+
+class TracedListSerializer(TracedSerializerMixin, serializers.ListSerializer):
+    pass
+
+
+class TracedJSONRenderer(JSONRenderer):
+    """JSONRenderer that records the time spent encoding the response data."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with span('render'):
+            return super().render(data, accepted_media_type, renderer_context)